@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 00:12:46 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import os
+import mmap
+import zlib
+import struct
+import tarfile
+import zipfile
+import threading
+import numpy as np
+
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar')
+# stored and deflated zip members are read from the mapped archive
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+METHOD_OTHER = 255
+
+
+def isArchive(path):
+    """Check if a path is a zip or uncompressed tar file."""
+    return os.path.splitext(path)[1].lower() in ARCHIVE_EXTENSIONS and \
+        os.path.isfile(path)
+
+
+class ArchiveIndex:
+    """Offsets of the files inside a zip or tar archive.
+
+    The members are read from the memory mapped archive by its offset,
+    without extracting them. The index is built listing the archive once
+    and kept next to it, rebuilt only if the archive is modified.
+    """
+
+    def __init__(self, archive_path):
+        """Initialize the index.
+
+        Parameters
+        ----------
+        archive_path : string
+            The zip or uncompressed tar file.
+
+        """
+        self.archive_path = archive_path
+        self.names = []
+        self.positions = {}
+        self.offsets = np.empty(0, dtype=np.uint64)
+        self.lengths = np.empty(0, dtype=np.uint64)
+        self.sizes = np.empty(0, dtype=np.uint64)
+        self.methods = np.empty(0, dtype=np.uint8)
+        self.state = None
+        self._mm = None
+
+    @property
+    def index_file(self):
+        """The persisted index, next to the archive."""
+        return self.archive_path + '.index.npz'
+
+    def __len__(self):
+        """Number of files in the archive."""
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def open(self):
+        """Map the archive, loading or building its index."""
+        st = os.stat(self.archive_path)
+        self.state = st.st_size, st.st_mtime_ns
+        if not self.load():
+            if os.path.splitext(self.archive_path)[1].lower() == '.zip':
+                self._listZip()
+            else:
+                self._listTar()
+            self.save()
+        self.positions = {n: i for i, n in enumerate(self.names)}
+        with open(self.archive_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if self.state[0] > 0 else b''
+        return self
+
+    def close(self):
+        """Unmap the archive."""
+        mm, self._mm = self._mm, None
+        if isinstance(mm, mmap.mmap):
+            try:
+                mm.close()
+            except BufferError:
+                # a member view is still in use, unmapped once released
+                pass
+
+    def _listZip(self):
+        names, offsets, lengths, sizes, methods = [], [], [], [], []
+        with open(self.archive_path, 'rb') as f, \
+                zipfile.ZipFile(f) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                # the data follows the local header, whose extra field may
+                # differ from the central directory one
+                f.seek(info.header_offset)
+                header = ZIP_LOCAL_HEADER.unpack(
+                    f.read(ZIP_LOCAL_HEADER.size))
+                names.append(info.filename)
+                offsets.append(info.header_offset + ZIP_LOCAL_HEADER.size +
+                               header[-2] + header[-1])
+                lengths.append(info.compress_size)
+                sizes.append(info.file_size)
+                methods.append(info.compress_type
+                               if info.compress_type in (METHOD_STORED,
+                                                         METHOD_DEFLATED)
+                               else METHOD_OTHER)
+        self._setMembers(names, offsets, lengths, sizes, methods)
+
+    def _listTar(self):
+        names, offsets, sizes = [], [], []
+        try:
+            # only uncompressed tar files can be read by offset
+            archive = tarfile.open(self.archive_path, 'r:')
+        except tarfile.ReadError:
+            raise ValueError('{} is not an uncompressed tar file'.format(
+                self.archive_path))
+        with archive:
+            for member in archive:
+                if not member.isfile() or member.sparse is not None:
+                    continue
+                name = member.name[2:] if member.name.startswith('./') \
+                    else member.name
+                names.append(name)
+                offsets.append(member.offset_data)
+                sizes.append(member.size)
+        self._setMembers(names, offsets, sizes, sizes,
+                         [METHOD_STORED] * len(names))
+
+    def _setMembers(self, names, offsets, lengths, sizes, methods):
+        self.names = names
+        self.offsets = np.array(offsets, dtype=np.uint64)
+        self.lengths = np.array(lengths, dtype=np.uint64)
+        self.sizes = np.array(sizes, dtype=np.uint64)
+        self.methods = np.array(methods, dtype=np.uint8)
+
+    def load(self):
+        """Read the persisted index, if of the current archive."""
+        if not os.path.isfile(self.index_file):
+            return False
+        with np.load(self.index_file) as cached:
+            if tuple(cached['state'].tolist()) != self.state:
+                return False
+            names = cached['names'].tobytes().decode('utf8')
+            self._setMembers(names.split('\0') if len(names) > 0 else [],
+                             cached['offsets'], cached['lengths'],
+                             cached['sizes'], cached['methods'])
+        return True
+
+    def save(self):
+        """Write the index next to the archive, if the folder is writable."""
+        names = np.frombuffer('\0'.join(self.names).encode('utf8'),
+                              dtype=np.uint8)
+        tmp_file = self.index_file + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.savez(f, state=np.array(self.state, dtype=np.int64),
+                         names=names, offsets=self.offsets,
+                         lengths=self.lengths, sizes=self.sizes,
+                         methods=self.methods)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            print('Archive index not saved:', e)
+            return False
+        return True
+
+    def read(self, name):
+        """The bytes of a member, None if not in the archive.
+
+        The stored members are a view of the mapped archive.
+        """
+        i = self.positions.get(name)
+        if i is None:
+            return None
+        offset, length = int(self.offsets[i]), int(self.lengths[i])
+        data = memoryview(self._mm)[offset:offset + length]
+        if self.methods[i] == METHOD_STORED:
+            return data
+        elif self.methods[i] == METHOD_DEFLATED:
+            return zlib.decompress(data, -15, int(self.sizes[i]))
+        with zipfile.ZipFile(self.archive_path) as archive:
+            return archive.read(name)
+
+    def memberState(self, name):
+        """The (size, archive mtime_ns) of a member, (-1, -1) if missing."""
+        i = self.positions.get(name)
+        if i is None:
+            return -1, -1
+        return int(self.sizes[i]), self.state[1]
+
+    def listFiles(self, valid_extensions=None):
+        """The files by folder, as listed by SearchHandler.
+
+        Parameters
+        ----------
+        valid_extensions : list, optional
+            The files extensions to consider, all if None.
+            The default is None.
+
+        Returns
+        -------
+        list
+            The file names.
+        list
+            The folder of each file, '.' for the archive root.
+
+        """
+        elements, elements_path = [], []
+        for name in sorted(self.names):
+            folder, _, filename = name.rpartition('/')
+            extension = filename.lower().rsplit('.', 1)[-1]
+            if valid_extensions is None or extension in valid_extensions:
+                elements.append(filename)
+                elements_path.append(folder.replace('/', os.path.sep)
+                                     if folder else '.')
+        return elements, elements_path
+
+
+# the opened archives by path, shared by the reading threads
+_archives = {}
+_lock = threading.Lock()
+
+
+def openArchive(archive_path):
+    """The index of an archive, opened once per process.
+
+    The index is opened again if the archive was modified since.
+    """
+    st = os.stat(archive_path)
+    with _lock:
+        index = _archives.get(archive_path)
+        if index is not None and \
+                index.state != (st.st_size, st.st_mtime_ns):
+            index.close()
+            index = None
+        if index is None:
+            index = _archives[archive_path] = \
+                ArchiveIndex(archive_path).open()
+        return index
+
+
+def splitMember(path):
+    """Split a path into an archive and the member name inside it.
+
+    Returns
+    -------
+    ArchiveIndex
+        The archive index, None if the path is not inside an archive.
+    string
+        The member name.
+
+    """
+    lower = path.lower()
+    for extension in ARCHIVE_EXTENSIONS:
+        pos = lower.find(extension + os.path.sep)
+        while pos > -1:
+            archive_path = path[:pos + len(extension)]
+            if isArchive(archive_path):
+                member = os.path.normpath(path[pos + len(extension) + 1:])
+                return openArchive(archive_path), \
+                    member.replace(os.path.sep, '/')
+            pos = lower.find(extension + os.path.sep, pos + 1)
+    return None, None
+
+
+def readMember(path):
+    """The bytes of a file inside an archive, None if not found."""
+    archive, member = splitMember(path)
+    if archive is None:
+        return None
+    return archive.read(member)
+
+
+def memberState(path):
+    """The (size, archive mtime_ns) of a file inside an archive."""
+    archive, member = splitMember(path)
+    if archive is None:
+        return -1, -1
+    return archive.memberState(member)
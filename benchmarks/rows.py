@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:20:44 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+
+Row access benchmark of DataHandler against plain pandas iloc access.
+
+    python -m benchmarks.rows --rows 1000000
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from handlers import DataHandler
+from benchmarks.synthetic import syntheticFrame
+
+
+def pandasGet(data, idx):
+    img_path = os.path.join(data.iloc[idx]['folder_path'],
+                            data.iloc[idx]['image_id'])
+    return img_path, data.iloc[idx]['class']
+
+
+def pandasSet(data, idx, label):
+    data.iloc[idx, data.columns.get_loc('class')] = label
+
+
+def timeit(fn, indexes):
+    start = time.perf_counter()
+    for idx in indexes:
+        fn(idx)
+    return (time.perf_counter() - start) / len(indexes) * 1e6
+
+
+def run(n_rows, n_ops=10000, seed=0):
+    """Time the get and set of random rows, in microseconds per call."""
+    dataset_df = syntheticFrame(n_rows, seed=seed)
+    indexes = np.random.default_rng(seed).integers(0, n_rows, n_ops)
+
+    handler = DataHandler(os.path.join('.', 'bench.csv'))
+    handler.data = dataset_df.copy()
+    pandas_df = dataset_df.copy()
+
+    return {
+        'rows': n_rows,
+        'ops': n_ops,
+        'handler_get_us': timeit(lambda i: handler[int(i)], indexes),
+        'handler_set_us': timeit(
+            lambda i: handler.__setitem__(int(i), 'bom'), indexes),
+        'pandas_get_us': timeit(lambda i: pandasGet(pandas_df, int(i)),
+                                indexes),
+        'pandas_set_us': timeit(lambda i: pandasSet(pandas_df, int(i), 'bom'),
+                                indexes),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='DataHandler row access benchmark')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--ops', type=int, default=10000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.ops), indent=2))
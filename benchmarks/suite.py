@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:30:48 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+
+Benchmark suite over synthetic datasets, headless under the offscreen Qt
+platform.
+
+    python -m benchmarks.suite --rows 10000 100000 --output results.json
+    python -m benchmarks.suite --rows 10000 --baseline results.json
+
+With a baseline the timings slower than the tolerance are reported and
+the exit code is 1, as it is if the cold startup exceeds its budget or
+imports pandas or cv2 before the window is shown.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import argparse
+import numpy as np
+
+from handlers import SearchHandler
+from handlers import DataHandler
+from labels import LABELS_ID
+from benchmarks import synthetic
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def result(name, rows, seconds, ops=1):
+    """A benchmark result, the seconds of a single operation."""
+    return {'name': name, 'rows': rows, 'seconds': seconds / ops,
+            'ops': ops}
+
+
+def benchTree(root_path, n_files, depth, fanout, image_size):
+    """Search and create a dataset from an images tree."""
+    synthetic.writeTree(root_path, n_files, depth, fanout, image_size)
+    results = []
+
+    seconds, _ = timed(SearchHandler(root_path).searchImages)
+    results.append(result('search', n_files, seconds))
+
+    data = DataHandler(os.path.join(root_path, 'dataset.csv'), LABELS_ID)
+    seconds, _ = timed(data.create)
+    results.append(result('create', n_files, seconds))
+
+    return results
+
+
+def benchCsv(csv_path, n_rows, depth, fanout, n_ops=10000, seed=0):
+    """Read, stats, rows access and save of a dataset csv."""
+    synthetic.writeCsv(csv_path, n_rows, depth=depth, fanout=fanout,
+                       seed=seed)
+    results = []
+
+    data = DataHandler(csv_path, LABELS_ID)
+    seconds, _ = timed(data.read)
+    results.append(result('read', n_rows, seconds))
+
+    seconds, _ = timed(data.buildStats)
+    results.append(result('build_stats', n_rows, seconds))
+    seconds, _ = timed(data.get_stats)
+    results.append(result('get_stats', n_rows, seconds))
+
+    indexes = np.random.default_rng(seed).integers(0, n_rows, n_ops)
+    indexes = [int(i) for i in indexes]
+    seconds, _ = timed(lambda: [data[i] for i in indexes])
+    results.append(result('getitem', n_rows, seconds, n_ops))
+    labels = ['bom', ['bom', 'handgun'], 'unset']
+    seconds, _ = timed(lambda: [data.__setitem__(i, labels[k % 3])
+                                for k, i in enumerate(indexes)])
+    results.append(result('setitem', n_rows, seconds, n_ops))
+
+    seconds, _ = timed(data.save)
+    results.append(result('save', n_rows, seconds))
+
+    return results
+
+
+# run in a new interpreter, printing the time when the window is shown
+STARTUP_SCRIPT = '''
+import sys, time, json
+from PyQt5.QtWidgets import QApplication
+from main import LabelerWindow
+app = QApplication([])
+window = LabelerWindow()
+window.show()
+app.processEvents()
+print(json.dumps({'shown': time.time(), 'loaded': [
+    m for m in ('pandas', 'cv2') if m in sys.modules]}))
+'''
+DATA_SCRIPT = '''
+import sys, time, json
+import handlers, sqlite_handler, sessions
+print(json.dumps({'shown': time.time(), 'loaded': [
+    m for m in ('PyQt5', 'pandas', 'cv2') if m in sys.modules]}))
+'''
+
+
+def coldStart(script):
+    """The seconds from a new interpreter to the script end."""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start = time.time()
+    output = subprocess.run([sys.executable, '-c', script], cwd=root_path,
+                            env=env, capture_output=True, text=True,
+                            check=True).stdout
+    shown = json.loads(output.strip().splitlines()[-1])
+    return shown['shown'] - start, shown['loaded']
+
+
+def benchStartup(n_runs=5, gui=True):
+    """Cold start of the window and of the data layer, the best run.
+
+    The window must be shown without pandas and cv2, and the data
+    handlers imported without Qt, pandas and cv2.
+    """
+    results, loaded = [], []
+    scripts = [('import_data', DATA_SCRIPT)]
+    if gui:
+        scripts.append(('startup_window', STARTUP_SCRIPT))
+    for name, script in scripts:
+        runs = [coldStart(script) for _ in range(n_runs)]
+        results.append(result(name, 0, min(r[0] for r in runs)))
+        loaded += ['{} at {}'.format(m, name) for m in runs[0][1]]
+    return results, loaded
+
+
+def headlessDisplay():
+    """Run Qt offscreen."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+def benchWindow(csv_path, n_rows, n_steps=200, image_size=(640, 480)):
+    """Populate the list and navigate labeling, as the annotators do.
+
+    The images of the navigated rows are written next to the csv, each
+    step is onSelectItem -> processLabels -> updateItem -> showImage.
+    """
+    headlessDisplay()
+    from PyQt5.QtWidgets import QApplication
+    from main import LabelerWindow
+
+    app = QApplication.instance() or QApplication([])
+    n_steps = min(n_steps, n_rows - 1)
+    data = DataHandler(csv_path, LABELS_ID)
+    data.read()
+    root_path = os.path.dirname(csv_path)
+    synthetic.writeImages(root_path, [data[i][0]
+                                      for i in range(n_steps + 1)],
+                          image_size)
+    results = []
+
+    window = LabelerWindow()
+    window.data = window.dataHandler(csv_path)
+    seconds, _ = timed(window.startLabeling)
+    results.append(result('start_labeling', n_rows, seconds))
+    seconds, _ = timed(window.populateList)
+    results.append(result('populate_list', n_rows, seconds))
+    window.setCurrentRow(0)
+
+    def navigate():
+        for step in range(n_steps):
+            window.checkboxes[step % len(window.checkboxes)].setChecked(True)
+            window.onNextImage(None)
+            # the image view is painted by the event loop
+            window.imageArea.view.repaint()
+            app.processEvents()
+    seconds, _ = timed(navigate)
+    results.append(result('navigate', n_rows, seconds, n_steps))
+
+    # discard the labels without asking, the csv folder is removed
+    window.changesSaved = True
+    window.stopLabeling()
+    window.prefetcher.shutdown()
+    window.deleteLater()
+
+    return results
+
+
+def run(rows, work_path, depth=1, fanout=100, max_tree_files=100000,
+        image_size=(640, 480), gui=True):
+    """Run all the benchmarks for each rows count."""
+    results = []
+    for n_rows in rows:
+        # small images, only the files listing is measured
+        tree_path = os.path.join(work_path, 'tree_{}'.format(n_rows))
+        batch = benchTree(tree_path, min(n_rows, max_tree_files),
+                          depth, fanout, image_size=(64, 48))
+        shutil.rmtree(tree_path)
+
+        csv_folder = os.path.join(work_path, 'csv_{}'.format(n_rows))
+        os.makedirs(csv_folder)
+        csv_path = os.path.join(csv_folder, 'dataset.csv')
+        batch += benchCsv(csv_path, n_rows, depth, fanout)
+        if gui:
+            batch += benchWindow(csv_path, n_rows, image_size=image_size)
+        shutil.rmtree(csv_folder)
+
+        for r in batch:
+            print('{name:>16} {rows:>9} rows {seconds:.6f}s'.format(**r),
+                  file=sys.stderr)
+        results += batch
+    return results
+
+
+def compare(results, baseline, tolerance=1.5):
+    """The results slower than the baseline by more than tolerance."""
+    known = {(r['name'], r['rows']): r['seconds'] for r in baseline}
+    regressions = []
+    for r in results:
+        base = known.get((r['name'], r['rows']))
+        if base is not None and r['seconds'] > base * tolerance:
+            regressions.append(dict(r, baseline=base,
+                                    ratio=r['seconds'] / base))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark suite over synthetic datasets')
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--fanout', type=int, default=100)
+    parser.add_argument('--max-tree-files', type=int, default=100000,
+                        help='the images tree is capped to these files')
+    parser.add_argument('--image-size', type=synthetic.imageSizeArg,
+                        default=(640, 480), help='WIDTHxHEIGHT')
+    parser.add_argument('--no-gui', action='store_true',
+                        help='skip the window benchmarks')
+    parser.add_argument('--workdir', default=None,
+                        help='where the synthetic data is written, '
+                        'a temporary folder if not defined')
+    parser.add_argument('--output', default=None,
+                        help='the json results file, stdout if not defined')
+    parser.add_argument('--baseline', default=None,
+                        help='a previous json results file to compare')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--startup-budget', type=float, default=1.,
+                        help='the seconds until the window is shown')
+    args = parser.parse_args(argv)
+
+    results, loaded = benchStartup(gui=not args.no_gui)
+    for r in results:
+        print('{name:>16} {seconds:.6f}s'.format(**r), file=sys.stderr)
+    failed = False
+    for r in results:
+        if r['name'] == 'startup_window' and \
+                r['seconds'] > args.startup_budget:
+            print('Startup over budget: {:.3f}s vs {:.3f}s'.format(
+                r['seconds'], args.startup_budget), file=sys.stderr)
+            failed = True
+    for module in loaded:
+        print('Startup imported', module, file=sys.stderr)
+        failed = True
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as work_path:
+        results += run(args.rows, work_path, args.depth, args.fanout,
+                       args.max_tree_files, args.image_size, not args.no_gui)
+
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'],
+                                  args.tolerance)
+        for r in regressions:
+            print('Regression {name} at {rows} rows: {seconds:.6f}s vs '
+                  '{baseline:.6f}s ({ratio:.2f}x)'.format(**r),
+                  file=sys.stderr)
+        failed = failed or len(regressions) > 0
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
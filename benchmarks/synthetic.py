@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:02:15 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+
+Synthetic datasets for the benchmarks, as images trees or dataset csv.
+
+    python -m benchmarks.synthetic tree /tmp/tree --files 10000 --depth 2
+    python -m benchmarks.synthetic csv /tmp/data.csv --rows 1000000
+"""
+import os
+import itertools
+import argparse
+import numpy as np
+import pandas as pd
+import cv2
+
+from labels import LABELS_ID
+from images import imageSizeArg
+
+
+def folderPaths(depth=1, fanout=100):
+    """The leaf folders of a tree, fanout subfolders per level.
+
+    A zero depth is the root folder alone, as '.'.
+    """
+    if depth == 0:
+        return ['.']
+    levels = [['d{}_{:03d}'.format(level, i) for i in range(fanout)]
+              for level in range(depth)]
+    return [os.path.join(*p) for p in itertools.product(*levels)]
+
+
+def labelValues(n_rows, unset_ratio=0.5, multi_ratio=0.2, max_labels=3,
+                labels_id=LABELS_ID, seed=0):
+    """Random stored label values with a mix of unset, single and multiple.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of values.
+    unset_ratio : float, optional
+        The ratio of 'unset' values. The default is 0.5.
+    multi_ratio : float, optional
+        The ratio of multiple labels values. The default is 0.2.
+    max_labels : int, optional
+        The maximum labels of a multiple labels value. The default is 3.
+    labels_id : list, optional
+        The labels to choose from. The default is LABELS_ID.
+    seed : int, optional
+        The random generator seed. The default is 0.
+
+    Returns
+    -------
+    numpy.ndarray
+        The object array of label values, the lists stringified as in
+        the csv.
+
+    """
+    rng = np.random.default_rng(seed)
+    # a pool of combinations, as the labeled datasets have few of them
+    pool = set()
+    for _ in range(256):
+        k = rng.integers(2, max(max_labels, 2) + 1)
+        idx = sorted(rng.choice(len(labels_id), size=k, replace=False))
+        pool.add(str([labels_id[i] for i in idx]))
+    pool = np.array(sorted(pool), dtype=object)
+    single = np.array(labels_id, dtype=object)
+
+    kind = rng.random(n_rows)
+    values = np.full(n_rows, 'unset', dtype=object)
+    is_multi = kind >= 1 - multi_ratio
+    is_single = (kind >= unset_ratio) & ~is_multi
+    values[is_single] = single[rng.integers(0, len(single),
+                                            is_single.sum())]
+    values[is_multi] = pool[rng.integers(0, len(pool), is_multi.sum())]
+    return values
+
+
+def syntheticFrame(n_rows, depth=1, fanout=100, unset_ratio=0.5,
+                   multi_ratio=0.2, seed=0):
+    """Create a dataset dataframe, sorted as DataHandler.create does."""
+    folders = folderPaths(depth, fanout)
+    folder_idx = np.arange(n_rows) * len(folders) // max(n_rows, 1)
+    return pd.DataFrame({
+        'folder_path': np.array(folders, dtype=object)[folder_idx],
+        'image_id': ['img_{:08d}.jpg'.format(i) for i in range(n_rows)],
+        'class': labelValues(n_rows, unset_ratio, multi_ratio, seed=seed)})
+
+
+def writeCsv(csv_path, n_rows, **kwargs):
+    """Write a synthetic dataset csv, see syntheticFrame."""
+    dataset_df = syntheticFrame(n_rows, **kwargs)
+    dataset_df.to_csv(csv_path, index=None)
+    return dataset_df
+
+
+def encodedImage(image_size=(640, 480), ext='jpg', seed=0):
+    """The file bytes of a random smooth image."""
+    rng = np.random.default_rng(seed)
+    img = (rng.random((image_size[1], image_size[0], 3)) * 255)
+    img = cv2.GaussianBlur(img.astype(np.uint8), (31, 31), 0)
+    ok, buffer = cv2.imencode('.' + ext, img)
+    return buffer.tobytes()
+
+
+def writeImages(root_path, rel_paths, image_size=(640, 480)):
+    """Write the same encoded image on each path relative to root_path."""
+    content = {}
+    for rel_path in rel_paths:
+        ext = rel_path.rsplit('.', 1)[-1].lower()
+        if ext not in content:
+            content[ext] = encodedImage(image_size, ext)
+        img_path = os.path.join(root_path, rel_path)
+        os.makedirs(os.path.dirname(img_path), exist_ok=True)
+        with open(img_path, 'wb') as f:
+            f.write(content[ext])
+    return len(rel_paths)
+
+
+def writeTree(root_path, n_files, depth=1, fanout=100, image_size=(640, 480)):
+    """Write an images tree with the files spread over its leaf folders.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The folder_path and image_id of the written images.
+
+    """
+    dataset_df = syntheticFrame(n_files, depth, fanout)
+    writeImages(root_path, [os.path.join(f, i) for f, i in zip(
+        dataset_df['folder_path'], dataset_df['image_id'])], image_size)
+    return dataset_df[['folder_path', 'image_id']]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Write a synthetic images tree or dataset csv')
+    parser.add_argument('kind', choices=['tree', 'csv'])
+    parser.add_argument('path', help='the tree root folder or csv file')
+    parser.add_argument('--files', '--rows', type=int, default=10000,
+                        dest='n', help='the number of images or rows')
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--fanout', type=int, default=100)
+    parser.add_argument('--image-size', type=imageSizeArg,
+                        default=(640, 480), help='WIDTHxHEIGHT')
+    parser.add_argument('--unset-ratio', type=float, default=0.5)
+    parser.add_argument('--multi-ratio', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.kind == 'tree':
+        writeTree(args.path, args.n, args.depth, args.fanout,
+                  args.image_size)
+    else:
+        writeCsv(args.path, args.n, depth=args.depth, fanout=args.fanout,
+                 unset_ratio=args.unset_ratio, multi_ratio=args.multi_ratio)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:02:37 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+
+Headless bulk labeling of a dataset csv from a json rules file:
+
+    python bulk_label.py dataset.csv rules.json [--dry-run]
+
+The rules are applied in order, each one selecting rows by all its
+selectors and setting, adding or removing its label:
+
+    {"rules": [
+        {"folder": "cam1", "label": "falso"},
+        {"folder_glob": "night/*", "image_glob": "IMG_1*.jpg",
+         "label": ["bom", "handgun"], "mode": "add"},
+        {"keys_csv": "reviewed.csv", "only_unset": true, "label": "ruim"},
+        {"keys_csv": "other_labels.csv"}
+    ]}
+
+Selectors:
+    folder       the folder_path and its subfolders, "." for all.
+    folder_glob  fnmatch pattern over the folder_path.
+    image_glob   fnmatch pattern over the image_id.
+    image_regex  regex matched at the start of the image_id.
+    keys_csv     csv with the folder_path and image_id of the rows, relative
+                 to the rules file. Without a rule label, its class column
+                 is applied to each row.
+    only_unset   only the rows without labels.
+"""
+import os
+import re
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import numpy as np
+import pandas as pd
+
+from handlers import DataHandler
+from labels import LABELS_ID
+
+
+SELECTORS = ('folder', 'folder_glob', 'image_glob', 'image_regex',
+             'keys_csv', 'only_unset')
+
+
+def selectRows(data, rule, base_path='.'):
+    """Get the rows matching all the rule selectors.
+
+    Parameters
+    ----------
+    data : DataHandler
+        The loaded dataset.
+    rule : dict
+        The rule selectors.
+    base_path : string, optional
+        The folder where the keys_csv paths are relative to.
+        The default is '.'.
+
+    Returns
+    -------
+    numpy.ndarray
+        The positional index of the rows.
+    pandas.Series
+        The class of each row from the keys_csv, if any.
+
+    """
+    if not any(k in rule for k in SELECTORS):
+        raise ValueError('Rule without selectors: {}'.format(rule))
+
+    match = np.ones(len(data), dtype=bool)
+    if 'folder' in rule:
+        folder = os.path.normpath(rule['folder'])
+        prefix = os.path.join(folder, '')
+        # the root contains all the folders
+        if folder != '.':
+            match &= data.matchFolders(
+                lambda f: f == folder or f.startswith(prefix))
+    if 'folder_glob' in rule:
+        pattern = re.compile(fnmatch.translate(rule['folder_glob']))
+        match &= data.matchFolders(pattern.match)
+    if 'image_glob' in rule:
+        match &= data.matchImages(fnmatch.translate(rule['image_glob']))
+    if 'image_regex' in rule:
+        match &= data.matchImages(rule['image_regex'])
+    if rule.get('only_unset', False):
+        match &= data.matchUnset()
+
+    classes = None
+    if 'keys_csv' in rule:
+        keys_df = pd.read_csv(os.path.join(base_path, rule['keys_csv']))
+        keys_df['folder_path'] = keys_df['folder_path'].astype(str)
+        rows = data.indexOf(keys_df)
+        found = rows >= 0
+        in_keys = np.zeros(len(data), dtype=bool)
+        in_keys[rows[found]] = True
+        match &= in_keys
+        if 'class' in keys_df.columns:
+            classes = pd.Series(keys_df['class'].to_numpy()[found],
+                                index=rows[found])
+
+    rows = np.flatnonzero(match)
+    if classes is not None:
+        classes = classes[~classes.index.duplicated(keep='last')]
+        classes = classes.reindex(rows)
+
+    return rows, classes
+
+
+def applyRules(data, rules, base_path='.', dry_run=False):
+    """Apply the rules in order.
+
+    Returns
+    -------
+    list
+        The (rows matched, rows changed) of each rule. On dry run the
+        changes are counted against the labels before any rule.
+
+    """
+    results = []
+    for rule in rules:
+        rows, classes = selectRows(data, rule, base_path)
+        mode = rule.get('mode', 'set')
+
+        if 'label' in rule:
+            changed = data.setLabels(rows, rule['label'], mode, dry_run)
+        elif classes is not None:
+            # one batch per distinct label from the keys csv
+            changed = 0
+            for label, group in classes.groupby(classes, sort=False):
+                changed += data.setLabels(group.index.to_numpy(), label,
+                                          mode, dry_run)
+        else:
+            raise ValueError('Rule without label: {}'.format(rule))
+        results.append((len(rows), changed))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Apply a json rules file of labels to a dataset csv.')
+    parser.add_argument('csv_file', help='the dataset csv file')
+    parser.add_argument('rules_file', help='the json rules file')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only count the rows, without saving')
+    args = parser.parse_args(argv)
+
+    with open(args.rules_file) as f:
+        rules = json.load(f)['rules']
+
+    start = time.perf_counter()
+    # replays the labels set in the window and not saved yet, the rules
+    # are applied over them and all folded into the csv on save
+    data = DataHandler(args.csv_file, LABELS_ID, use_journal=True)
+    data.read()
+    results = applyRules(data, rules,
+                         os.path.dirname(os.path.abspath(args.rules_file)),
+                         args.dry_run)
+
+    for i, (rule, (matched, changed)) in enumerate(zip(rules, results)):
+        print('Rule {}: {} rows matched, {} {}'.format(
+            i + 1, matched, changed,
+            'would change' if args.dry_run else 'changed'))
+
+    if not args.dry_run and sum(r[1] for r in results) > 0:
+        data.save()
+    print('Done in {:.2f}s'.format(time.perf_counter() - start))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,9 +11,12 @@ from PyQt5.QtWidgets import QFormLayout
 from PyQt5.QtWidgets import QGroupBox
 from PyQt5.QtWidgets import QDialogButtonBox
 from PyQt5.QtWidgets import QLineEdit
+from PyQt5.QtWidgets import QPlainTextEdit
 from PyQt5.QtWidgets import QCheckBox
 from PyQt5.QtWidgets import QLabel
 from PyQt5.QtWidgets import QSpacerItem
+from PyQt5.QtWidgets import QFileDialog
+from PyQt5.QtGui import QFont
 
 
 class CsvNameDialog(QDialog):
@@ -40,16 +43,20 @@ class CsvNameDialog(QDialog):
         layout = QFormLayout()
         
         self.filename = QLineEdit('dataset.csv')
+        self.filename.setToolTip('Use a .db extension to store as SQLite')
         self.have_labels = QCheckBox()
+        self.as_mask = QCheckBox()
         
         layout.addRow('Filename', self.filename)
         layout.addRow('Subfolders are labels', self.have_labels)
+        layout.addRow('Store labels as bitmask', self.as_mask)
         
         self.formGroup = QGroupBox('Options')
         self.formGroup.setLayout(layout)
         
     def accept(self):        
-        self._output = self.filename.text(), self.have_labels.isChecked()
+        self._output = self.filename.text(), self.have_labels.isChecked(), \
+            self.as_mask.isChecked()
         super(CsvNameDialog, self).accept()
     
     def getValues(self):
@@ -80,4 +87,60 @@ class MessageDialog(QDialog):
         self.layout.addItem(QSpacerItem(10, 10))
         
         self.layout.addWidget(self.buttonBox)
-        self.setLayout(self.layout)
\ No newline at end of file
+        self.setLayout(self.layout)
+
+class StatsDialog(QDialog):
+
+    def __init__(self, title, text):
+        super(StatsDialog, self).__init__()
+        
+        self.setWindowTitle(title)
+        self.resize(400, 500)
+        self.layout = QVBoxLayout()
+        
+        # scrollable for large folders list
+        content = QPlainTextEdit(text)
+        content.setReadOnly(True)
+        self.layout.addWidget(content)
+        
+        buttonBox = QDialogButtonBox(QDialogButtonBox.Ok)
+        buttonBox.accepted.connect(self.accept)
+        self.layout.addWidget(buttonBox)
+        self.setLayout(self.layout)
+
+
+class TimingDialog(QDialog):
+
+    def __init__(self, title, timers):
+        super(TimingDialog, self).__init__()
+        self.timers = timers
+        
+        self.setWindowTitle(title)
+        self.resize(600, 400)
+        self.layout = QVBoxLayout()
+        
+        self.content = QPlainTextEdit(timers.toText())
+        self.content.setReadOnly(True)
+        self.content.setFont(QFont('Monospace'))
+        self.layout.addWidget(self.content)
+        
+        QBtn = QDialogButtonBox.Save | QDialogButtonBox.Reset | \
+            QDialogButtonBox.Ok
+        buttonBox = QDialogButtonBox(QBtn)
+        buttonBox.accepted.connect(self.accept)
+        buttonBox.button(QDialogButtonBox.Save).clicked.connect(self.onSave)
+        buttonBox.button(QDialogButtonBox.Reset).clicked.connect(self.onReset)
+        self.layout.addWidget(buttonBox)
+        self.setLayout(self.layout)
+        
+    def onSave(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Save timings',
+                                              'timings.json',
+                                              "JSON files (*.json);;"
+                                              "CSV files (*.csv)")
+        if path:
+            self.timers.dump(path)
+        
+    def onReset(self):
+        self.timers.reset()
+        self.content.setPlainText(self.timers.toText())
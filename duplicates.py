@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:21:40 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from lazy import LazyModule
+from images import decodeImage
+from images import REDUCED_GRAY_FLAGS
+from archives import memberState
+
+cv2 = LazyModule('cv2')
+
+
+HASH_NAMES = ('dhash', 'phash')
+
+
+def _packBits(bits):
+    """The 64 booleans as an unsigned integer, first bit the highest."""
+    return int(np.packbits(bits.ravel()).view('>u8')[0])
+
+
+def dHash(gray):
+    """Difference hash, the brightness gradient of a 9x8 thumbnail."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return _packBits(small[:, 1:] > small[:, :-1])
+
+
+def pHash(gray):
+    """Perceptual hash, the low frequencies of a 32x32 thumbnail DCT."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(np.float32(small))[:8, :8]
+    return _packBits(low > np.median(low))
+
+
+def hashImage(img_path):
+    """Compute the hashes of an image file.
+
+    The image is decoded in grayscale at the smaller resolution which
+    still fill the 32x32 pHash thumbnail.
+
+    Parameters
+    ----------
+    img_path : string
+        The image file path.
+
+    Returns
+    -------
+    tuple
+        The (dhash, phash) of the image, None if can't be read.
+
+    """
+    gray = decodeImage(img_path, (32, 32), REDUCED_GRAY_FLAGS)
+    if gray is None:
+        return None
+    return dHash(gray), pHash(gray)
+
+
+def hammingDistance(a, b):
+    """The number of different bits between uint64 hashes arrays."""
+    x = np.bitwise_xor(a, b)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    bits = np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1)
+    return bits.sum(axis=1).reshape(np.shape(x))
+
+
+class HashCache:
+    """Image hashes cached in a sidecar file.
+
+    The hashes are kept by image path along its size and modification
+    time, so only the new or modified images are hashed again.
+    """
+
+    def __init__(self, cache_path):
+        """Initialize the cache.
+
+        Parameters
+        ----------
+        cache_path : string
+            The .npz file of the cached hashes.
+
+        """
+        self.cache_path = cache_path
+        self.entries = {}
+
+    def load(self):
+        """Read the cached hashes, if any."""
+        self.entries = {}
+        if not os.path.isfile(self.cache_path):
+            return False
+        with np.load(self.cache_path) as cached:
+            for path, state, hashes, valid in zip(
+                    cached['path'], cached['state'], cached['hashes'],
+                    cached['valid']):
+                self.entries[str(path)] = (tuple(state.tolist()),
+                                           tuple(hashes.tolist())
+                                           if valid else None)
+        return True
+
+    def save(self):
+        """Write the cached hashes, replacing the file once written."""
+        paths = list(self.entries)
+        states = [self.entries[p][0] for p in paths]
+        hashes = [self.entries[p][1] or (0, 0) for p in paths]
+        valid = [self.entries[p][1] is not None for p in paths]
+        tmp_file = self.cache_path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, path=np.array(paths, dtype=str),
+                     state=np.array(states, dtype=np.int64).reshape(-1, 2),
+                     hashes=np.array(hashes, dtype=np.uint64).reshape(-1, 2),
+                     valid=np.array(valid, dtype=bool))
+        os.replace(tmp_file, self.cache_path)
+
+    def get(self, path, state):
+        """Get the (found, hashes) of an image in the given state."""
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != state:
+            return False, None
+        return True, entry[1]
+
+    def put(self, path, state, hashes):
+        """Store the hashes of an image, None if can't be read."""
+        self.entries[path] = (state, hashes)
+
+
+def fileState(path):
+    """The (size, mtime_ns) of a file, (-1, -1) if not exist.
+
+    The files inside an archive have the archive mtime.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return memberState(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def computeHashes(paths, cache=None, workers=None, stop_event=None,
+                  progress=None):
+    """Compute the hashes of the images on a process pool.
+
+    Parameters
+    ----------
+    paths : list
+        The image files path.
+    cache : HashCache, optional
+        The cached hashes, updated with the computed ones.
+        The default is None.
+    workers : int, optional
+        The number of processes, the CPU count if None.
+        The default is None.
+    stop_event : threading.Event, optional
+        Set to stop the hashing, the hashes done are kept.
+        The default is None.
+    progress : callable, optional
+        Called with the hashed fraction of the pending images.
+        The default is None.
+
+    Returns
+    -------
+    numpy.ndarray
+        The (n, 2) dhash and phash of each image.
+    numpy.ndarray
+        The boolean array of the images which could be read.
+
+    """
+    start = time.perf_counter()
+    hashes = np.zeros((len(paths), 2), dtype=np.uint64)
+    valid = np.zeros(len(paths), dtype=bool)
+
+    pending = []
+    for i, path in enumerate(paths):
+        state = fileState(path)
+        found, cached = cache.get(path, state) if cache is not None \
+            else (False, None)
+        if found:
+            if cached is not None:
+                hashes[i] = cached
+                valid[i] = True
+        else:
+            pending.append((i, path, state))
+
+    if len(pending) > 0:
+        # spawned processes, the GUI threads are not forked
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=context) as executor:
+            results = executor.map(hashImage, [p[1] for p in pending],
+                                   chunksize=64)
+            for k, ((i, path, state), result) in enumerate(
+                    zip(pending, results)):
+                if result is not None:
+                    hashes[i] = result
+                    valid[i] = True
+                if cache is not None:
+                    cache.put(path, state, result)
+                if progress is not None:
+                    progress((k + 1) / len(pending))
+                if stop_event is not None and stop_event.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+
+    print('Hashed {} images, {} cached, in {:.2f}s'.format(
+        len(pending), len(paths) - len(pending),
+        time.perf_counter() - start))
+
+    return hashes, valid
+
+
+def nearPairs(hashes, threshold):
+    """Find the pairs of hashes within a Hamming distance.
+
+    Multi-index search: the 64 bits are split into threshold + 1 blocks,
+    two hashes within the threshold are equal in at least one block, so
+    only the hashes sharing a block value are compared.
+
+    Parameters
+    ----------
+    hashes : numpy.ndarray
+        The distinct uint64 hashes.
+    threshold : int
+        The maximum number of different bits.
+
+    Returns
+    -------
+    numpy.ndarray
+        The (i, j) index of the near pairs, as two rows.
+
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n_blocks = min(threshold + 1, 64)
+    edges = np.linspace(0, 64, n_blocks + 1).astype(int)
+    pairs_i, pairs_j = [], []
+
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        mask = np.uint64((1 << (hi - lo)) - 1)
+        keys = (hashes >> np.uint64(lo)) & mask
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        bounds = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        for group in np.split(order, bounds):
+            if len(group) < 2:
+                continue
+            if len(group) <= 512:
+                i, j = np.triu_indices(len(group), k=1)
+                i, j = group[i], group[j]
+                near = hammingDistance(hashes[i], hashes[j]) <= threshold
+                pairs_i.append(i[near])
+                pairs_j.append(j[near])
+                continue
+            # large buckets compared one row at a time
+            for k in range(len(group) - 1):
+                others = group[k + 1:]
+                near = others[hammingDistance(
+                    hashes[group[k]], hashes[others]) <= threshold]
+                pairs_i.append(np.full(len(near), group[k]))
+                pairs_j.append(near)
+
+    if len(pairs_i) == 0:
+        return np.empty((2, 0), dtype=np.int64)
+    return np.stack([np.concatenate(pairs_i),
+                     np.concatenate(pairs_j)]).astype(np.int64)
+
+
+def connectedComponents(n, pairs):
+    """Label each node with the lowest node connected to it."""
+    labels = np.arange(n)
+    if pairs.shape[1] == 0:
+        return labels
+    i, j = pairs
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        prev = labels.copy()
+        np.minimum.at(labels, i, low)
+        np.minimum.at(labels, j, low)
+        # pointer jumping
+        labels = labels[labels]
+        if np.array_equal(labels, prev):
+            return labels
+
+
+class DuplicateClusters:
+    """Clusters of near duplicate rows.
+
+    Each row is mapped to the representative of its cluster, the lowest
+    row of it, the rows without duplicates being its own representative.
+    """
+
+    def __init__(self, representative):
+        self.representative = np.asarray(representative, dtype=np.int64)
+        order = np.argsort(self.representative, kind='stable')
+        reps = self.representative[order]
+        bounds = np.flatnonzero(reps[1:] != reps[:-1]) + 1
+        self._members = {int(g[0]): g for g in np.split(order, bounds)
+                         if len(g) > 1}
+
+    @classmethod
+    def fromHashes(cls, hashes, valid, threshold=4):
+        """Cluster the rows by the Hamming distance of its hashes.
+
+        Parameters
+        ----------
+        hashes : numpy.ndarray
+            The uint64 hash of each row.
+        valid : numpy.ndarray
+            The boolean array of the rows having a hash.
+        threshold : int, optional
+            The maximum number of different bits of near duplicates.
+            The default is 4.
+
+        """
+        n = len(hashes)
+        rows = np.flatnonzero(valid)
+        # identical hashes are compared once
+        uniques, inverse = np.unique(hashes[rows], return_inverse=True)
+        labels = connectedComponents(len(uniques),
+                                     nearPairs(uniques, threshold))
+        clusters = labels[inverse.ravel()]
+        first = np.full(len(uniques), n, dtype=np.int64)
+        np.minimum.at(first, clusters, rows)
+
+        representative = np.arange(n)
+        representative[rows] = first[clusters]
+        return cls(representative)
+
+    def __len__(self):
+        """Number of clusters with duplicates."""
+        return len(self._members)
+
+    @property
+    def n_duplicates(self):
+        """Number of rows which are not the representative of its cluster."""
+        return int(np.count_nonzero(
+            self.representative != np.arange(len(self.representative))))
+
+    def members(self, row):
+        """The sorted rows in the cluster of a row."""
+        rep = int(self.representative[row])
+        return self._members.get(rep, np.array([row], dtype=np.int64))
+
+    def representatives(self):
+        """The sorted rows representing its cluster."""
+        return np.flatnonzero(
+            self.representative == np.arange(len(self.representative)))
+
+
+def clusterImages(paths, hashes_file, hash_name='dhash', threshold=4,
+                  workers=None, stop_event=None, progress=None):
+    """Cluster the near duplicate images, with its hashes cached.
+
+    Parameters
+    ----------
+    paths : list
+        The image files path.
+    hashes_file : string
+        The sidecar file of the cached hashes.
+    hash_name : string, optional
+        'dhash' or 'phash'. The default is 'dhash'.
+    threshold : int, optional
+        The maximum number of different bits of near duplicates.
+        The default is 4.
+    workers : int, optional
+        The number of hashing processes, the CPU count if None.
+        The default is None.
+    stop_event : threading.Event, optional
+        Set to stop the hashing, resumed from the cache by the next one.
+        The default is None.
+    progress : callable, optional
+        Called with the hashed fraction of the pending images.
+        The default is None.
+
+    Returns
+    -------
+    DuplicateClusters
+        The clusters of the paths, None if stopped.
+
+    """
+    if hash_name not in HASH_NAMES:
+        raise ValueError("Unknown hash '{}'".format(hash_name))
+
+    cache = HashCache(hashes_file)
+    cache.load()
+    try:
+        hashes, valid = computeHashes(paths, cache, workers, stop_event,
+                                      progress)
+    finally:
+        cache.save()
+    if stop_event is not None and stop_event.is_set():
+        return None
+
+    clusters = DuplicateClusters.fromHashes(
+        hashes[:, HASH_NAMES.index(hash_name)], valid, threshold)
+    print('{} duplicate clusters, {} duplicate images'.format(
+        len(clusters), clusters.n_duplicates))
+
+    return clusters
+
+
+def findDuplicates(data, hash_name='dhash', threshold=4, workers=None):
+    """Cluster the near duplicate images of a data handler.
+
+    The hashes are cached in the data hashes sidecar file, see
+    clusterImages.
+
+    Parameters
+    ----------
+    data : DataHandler
+        The loaded dataset.
+    hash_name : string, optional
+        'dhash' or 'phash'. The default is 'dhash'.
+    threshold : int, optional
+        The maximum number of different bits of near duplicates.
+        The default is 4.
+    workers : int, optional
+        The number of hashing processes, the CPU count if None.
+        The default is None.
+
+    Returns
+    -------
+    DuplicateClusters
+        The clusters of the data rows.
+
+    """
+    paths = [os.path.join(data.images_root, path)
+             for path in data.imagePaths()]
+    return clusterImages(paths, data.hashes_file, hash_name, threshold,
+                         workers)
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 02:21:09 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+
+Export of a labeled dataset csv as training inputs:
+
+    python export.py dataset.csv out_dir [--folders] [--symlink]
+        [--shards] [--shard-size 1G] [--matrix] [--skip-unset]
+
+Without a format option all of them are exported, into out_dir, the
+labels matrix only if the labels are in the labels_id:
+    folders/<label>/<folder_path>/<image_id>
+        The images linked by label, a multi-label image is linked in the
+        folder of each label. Hardlinks unless --symlink, the images inside
+        an archive are the only ones written.
+    shards/shard-000000.tar
+        The images and a <key>.json with their labels, the key is the row
+        number. Each shard up to --shard-size bytes, filled across the
+        chunks of rows.
+    labels.npy, labels.json, paths.csv
+        The (rows, labels) multi-hot uint8 matrix, with the labels_id of
+        its columns and the image path of its rows, in the csv order.
+"""
+import io
+import os
+import sys
+import json
+import time
+import errno
+import tarfile
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from lazy import LazyModule
+from archives import readMember
+from archives import memberState
+from labels import LabelCodec
+from labels import LABELS_ID
+from labels import UNSET
+
+pd = LazyModule('pandas')
+
+
+FORMATS = ('folders', 'shards', 'matrix')
+TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+def rowLabels(values, codec=None):
+    """Parse a chunk of stored label values, once per distinct value.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        The stored label values.
+    codec : LabelCodec, optional
+        Decodes the values, if stored as bitmask. The default is None.
+
+    Returns
+    -------
+    numpy.ndarray
+        The distinct label code of each row.
+    list
+        The labels list of each distinct label.
+
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    label_lists = [LabelCodec.toList(codec.decode(value)
+                                     if codec is not None else value)
+                   for value in uniques]
+    return codes, label_lists
+
+
+def labelMatrix(codes, label_lists, labels_id):
+    """Multi-hot encode a chunk of parsed labels, see rowLabels.
+
+    Raises
+    ------
+    ValueError
+        If a label is not in the labels_id.
+
+    Returns
+    -------
+    numpy.ndarray
+        The (rows, labels) uint8 matrix.
+
+    """
+    index = {lbl: i for i, lbl in enumerate(labels_id)}
+    rows = np.zeros((len(label_lists), len(labels_id)), dtype=np.uint8)
+    for j, labels in enumerate(label_lists):
+        for lbl in labels:
+            if lbl not in index:
+                raise ValueError("Unknown label '{}'".format(lbl))
+            rows[j, index[lbl]] = 1
+    return rows[codes]
+
+
+def linkImages(pairs, symlink=False):
+    """Link the images in the labels folders.
+
+    The hardlinks fall back to symlinks across devices, the existing
+    destinations are kept.
+
+    Parameters
+    ----------
+    pairs : list
+        The (image path, destination path) pairs.
+    symlink : bool, optional
+        Create symlinks instead of hardlinks. The default is False.
+
+    Returns
+    -------
+    int
+        The number of linked images.
+    int
+        The number of missing images.
+
+    """
+    linked = missing = 0
+    for src, dst in pairs:
+        if os.path.lexists(dst):
+            linked += 1
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if not os.path.isfile(src):
+            # the archive members can not be linked
+            buffer = readMember(src)
+            if buffer is None:
+                missing += 1
+                continue
+            with open(dst, 'wb') as f:
+                f.write(buffer)
+        elif symlink:
+            os.symlink(os.path.abspath(src), dst)
+        else:
+            try:
+                os.link(src, dst)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                os.symlink(os.path.abspath(src), dst)
+        linked += 1
+    return linked, missing
+
+
+def _memberSize(size):
+    # the header and the data padded to blocks
+    return TAR_BLOCK + (size + TAR_BLOCK - 1) // TAR_BLOCK * TAR_BLOCK
+
+
+def _tarSize(size):
+    # with the end of archive blocks, padded to records
+    size += 2 * TAR_BLOCK
+    return (size + tarfile.RECORDSIZE - 1) // tarfile.RECORDSIZE * \
+        tarfile.RECORDSIZE
+
+
+def _addBytes(tar, name, buffer):
+    info = tarfile.TarInfo(name)
+    info.size = len(buffer)
+    # whole seconds, a fractional mtime takes a PAX header
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(buffer))
+
+
+def _fileSize(path):
+    # the size of a file or an archive member, -1 if missing
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return memberState(path)[0]
+
+
+def writeShard(shard_path, items):
+    """Write the images and their labels in a tar shard.
+
+    The shard is written as a temporary file, renamed once complete.
+
+    Parameters
+    ----------
+    shard_path : string
+        The shard file path.
+    items : list
+        The (image path, key, labels) of each image.
+
+    Returns
+    -------
+    int
+        The number of written images.
+    int
+        The number of missing images.
+
+    """
+    written = missing = 0
+    tmp_path = shard_path + '.tmp'
+    with tarfile.open(tmp_path, 'w', format=tarfile.PAX_FORMAT) as tar:
+        for src, key, labels in items:
+            name = key + os.path.splitext(src)[1].lower()
+            if os.path.isfile(src):
+                info = tar.gettarinfo(src, arcname=name)
+                info.mtime = int(info.mtime)
+                with open(src, 'rb') as f:
+                    tar.addfile(info, f)
+            else:
+                buffer = readMember(src)
+                if buffer is None:
+                    missing += 1
+                    continue
+                _addBytes(tar, name, buffer)
+            _addBytes(tar, key + '.json',
+                      json.dumps({'labels': labels}).encode('utf8'))
+            written += 1
+    os.replace(tmp_path, shard_path)
+    return written, missing
+
+
+def _drain(pending, limit, handle):
+    # keep the submitted chunks, and its memory, bounded
+    while len(pending) > limit:
+        kind, future = pending.popleft()
+        handle(kind, future.result())
+
+
+def unknownLabels(data, labels_id):
+    """The labels of the data rows not in the labels_id."""
+    stats = data.stats if data.stats is not None else data.buildStats()
+    return sorted(lbl for lbl, count in stats.labels.items()
+                  if count > 0 and lbl not in labels_id)
+
+
+def exportDataset(data, out_path, formats=None, labels_id=None,
+                  symlink=False, shard_bytes=1 << 30, skip_unset=False,
+                  chunk_rows=10000, workers=None):
+    """Export a data handler rows as training inputs.
+
+    The rows are streamed in chunks, whose links are written on a process
+    pool, keeping up to two chunks per process in memory. The shards are
+    filled in the rows order across the chunks, and written on the pool
+    once full.
+
+    Parameters
+    ----------
+    data : DataHandler
+        The loaded dataset.
+    out_path : string
+        The output folder.
+    formats : tuple, optional
+        Any of 'folders', 'shards' and 'matrix'. The default is None, all
+        of them, the matrix only if the labels are in the labels_id.
+    labels_id : list, optional
+        The labels of the matrix columns, the data labels_id if None. The
+        folders and shards take the rows labels as they are.
+        The default is None.
+    symlink : bool, optional
+        Link the folders images with symlinks. The default is False.
+    shard_bytes : int, optional
+        The maximum shard size. The default is 1GiB.
+    skip_unset : bool, optional
+        Leave the unlabeled images out of the folders and shards.
+        The default is False.
+    chunk_rows : int, optional
+        The rows of each chunk. The default is 10000.
+    workers : int, optional
+        The number of processes, the CPU count if None.
+        The default is None.
+
+    Raises
+    ------
+    ValueError
+        If a label is not in the labels_id, exporting the matrix. Checked
+        before anything is written.
+
+    Returns
+    -------
+    dict
+        The number of links, packed images, shards and missing images.
+
+    """
+    start = time.perf_counter()
+    if labels_id is None:
+        labels_id = data.codec.labels_id if data.codec is not None \
+            else LABELS_ID
+    codec = data.codec if data.label_format == 'mask' else None
+    unknown = unknownLabels(data, labels_id)
+    if formats is None:
+        formats = FORMATS
+        if len(unknown) > 0:
+            print('Labels matrix skipped, labels not in the labels_id:',
+                  ', '.join(unknown))
+            formats = tuple(f for f in formats if f != 'matrix')
+    elif 'matrix' in formats and len(unknown) > 0:
+        raise ValueError("Unknown labels for the matrix: {}".format(
+            ', '.join(unknown)))
+    folders_path = os.path.join(out_path, 'folders')
+    shards_path = os.path.join(out_path, 'shards')
+    os.makedirs(out_path, exist_ok=True)
+
+    matrix = None
+    if 'matrix' in formats:
+        matrix = np.lib.format.open_memmap(
+            os.path.join(out_path, 'labels.npy'), mode='w+',
+            dtype=np.uint8, shape=(len(data), len(labels_id)))
+        with open(os.path.join(out_path, 'labels.json'), 'w') as f:
+            json.dump({'labels_id': list(labels_id)}, f)
+        paths_file = os.path.join(out_path, 'paths.csv')
+        pd.DataFrame(columns=['path']).to_csv(paths_file, index=False)
+    if 'shards' in formats:
+        os.makedirs(shards_path, exist_ok=True)
+
+    stats = {'linked': 0, 'packed': 0, 'shards': 0, 'missing': 0}
+    key_digits = max(len(str(len(data))), 9)
+
+    def handle(kind, result):
+        if kind == 'folders':
+            stats['linked'] += result[0]
+            if 'shards' not in formats:
+                stats['missing'] += result[1]
+            return
+        written, missing = result
+        stats['packed'] += written
+        stats['missing'] += missing
+
+    # the shard being filled, kept open across the chunks
+    shard_items = []
+    shard_size = 0
+
+    def submitShard():
+        shard_path = os.path.join(
+            shards_path, 'shard-{:06d}.tar'.format(stats['shards']))
+        stats['shards'] += 1
+        pending.append(('shards', executor.submit(
+            writeShard, shard_path, list(shard_items))))
+        shard_items.clear()
+
+    # spawned processes, the GUI threads are not forked
+    context = multiprocessing.get_context('spawn')
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=context) as executor:
+        limit = 2 * workers
+        pending = deque()
+        for first, paths, values in data.iterRows(chunk_rows):
+            codes, label_lists = rowLabels(values, codec)
+            if matrix is not None:
+                matrix[first:first + len(paths)] = labelMatrix(
+                    codes, label_lists, labels_id)
+                pd.DataFrame({'path': paths}).to_csv(
+                    paths_file, mode='a', header=False, index=False)
+            srcs = [os.path.join(data.images_root, p) for p in paths]
+
+            if 'folders' in formats:
+                pairs = []
+                for src, path, code in zip(srcs, paths, codes):
+                    labels = label_lists[code]
+                    if len(labels) == 0 and not skip_unset:
+                        labels = [UNSET]
+                    for lbl in labels:
+                        pairs.append((src, os.path.join(folders_path, lbl,
+                                                        path)))
+                pending.append(('folders', executor.submit(
+                    linkImages, pairs, symlink)))
+            if 'shards' in formats:
+                meta_sizes = [_memberSize(len(json.dumps(
+                    {'labels': labels}).encode('utf8')))
+                    for labels in label_lists]
+                for i, (src, code) in enumerate(zip(srcs, codes)):
+                    if skip_unset and len(label_lists[code]) == 0:
+                        continue
+                    src_size = _fileSize(src)
+                    if src_size < 0:
+                        stats['missing'] += 1
+                        continue
+                    item_size = _memberSize(src_size) + meta_sizes[code]
+                    if len(shard_items) > 0 and _tarSize(
+                            shard_size + item_size) > shard_bytes:
+                        submitShard()
+                        shard_size = 0
+                    shard_items.append((src, str(first + i).zfill(
+                        key_digits), label_lists[code]))
+                    shard_size += item_size
+            _drain(pending, limit, handle)
+        if len(shard_items) > 0:
+            submitShard()
+        _drain(pending, 0, handle)
+
+    if matrix is not None:
+        matrix.flush()
+        del matrix
+    print('Exported {} rows, {} links, {} images in {} shards, {} missing, '
+          'in {:.2f}s'.format(len(data), stats['linked'], stats['packed'],
+                              stats['shards'], stats['missing'],
+                              time.perf_counter() - start))
+    return stats
+
+
+def byteSizeArg(value):
+    """Parse a size as bytes, with an optional K, M or G suffix."""
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    value = value.strip().upper().rstrip('B')
+    try:
+        if value[-1:] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid size {}, expected as 512M or 1G'.format(value))
+
+
+def main(argv=None):
+    from handlers import DataHandler
+
+    parser = argparse.ArgumentParser(
+        description='Export a dataset csv as training inputs.')
+    parser.add_argument('csv_file', help='the dataset csv file')
+    parser.add_argument('out_path', help='the output folder')
+    parser.add_argument('--folders', action='store_true',
+                        help='link the images in a folder by label')
+    parser.add_argument('--symlink', action='store_true',
+                        help='link with symlinks instead of hardlinks')
+    parser.add_argument('--shards', action='store_true',
+                        help='pack the images and labels in tar shards')
+    parser.add_argument('--shard-size', type=byteSizeArg, default=1 << 30,
+                        help='maximum shard size, as 512M or 1G')
+    parser.add_argument('--matrix', action='store_true',
+                        help='write the multi-hot labels matrix')
+    parser.add_argument('--skip-unset', action='store_true',
+                        help='leave the unlabeled images out')
+    parser.add_argument('--chunk-rows', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    formats = tuple(f for f in FORMATS if getattr(args, f)) or None
+    data = DataHandler(args.csv_file)
+    data.read()
+    exportDataset(data, args.out_path, formats, symlink=args.symlink,
+                  shard_bytes=args.shard_size, skip_unset=args.skip_unset,
+                  chunk_rows=args.chunk_rows, workers=args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:07:33 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import os
+from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QSize
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtWidgets import QListView
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtWidgets import QPushButton
+from PyQt5.QtWidgets import QHBoxLayout
+from PyQt5.QtWidgets import QVBoxLayout
+from PyQt5.QtWidgets import QShortcut
+from PyQt5.QtWidgets import QAbstractItemView
+
+from models import ThumbnailModel
+from images import ImageCache
+from images import ImagePrefetcher
+from images import readThumbnail
+from duplicates import fileState
+from thumbstore import ThumbnailStore
+
+
+class ThumbnailGrid(QWidget):
+    """A page of thumbnails labeled at once.
+
+    The pages follow the labeler list, filters included. The label
+    shortcuts and the checked labels are applied to all the selected
+    thumbnails in a single batch update.
+    """
+
+    def __init__(self, labeler, cols=6, rows=4, thumb_size=(160, 120)):
+        super(ThumbnailGrid, self).__init__()
+        self.labeler = labeler
+        self.cols = cols
+        self.rows = rows
+        self.thumb_size = thumb_size
+        self.page = 0
+        self.store = None
+        self.storeRoot = None
+        self.thumbCache = ImageCache(max_bytes=64 * 1024**2)
+        self.thumbLoader = ImagePrefetcher(self.thumbCache, workers=4,
+                                           read_fn=self.readThumbnail)
+
+        self.setWindowTitle("Thumbnails")
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+
+        self.model = ThumbnailModel(self.item2text, self.thumbKey,
+                                    self.thumbCache, self)
+        self.view = QListView(self)
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setMovement(QListView.Static)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setUniformItemSizes(True)
+        self.view.setWordWrap(True)
+        self.view.setIconSize(QSize(*thumb_size))
+        self.view.setGridSize(QSize(thumb_size[0] + 16, thumb_size[1] + 40))
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self.onOpenItem)
+        self.layout.addWidget(self.view)
+        self.resize(cols * (thumb_size[0] + 16) + 40,
+                    rows * (thumb_size[1] + 40) + 80)
+
+        layout = QHBoxLayout()
+        prev_button = QPushButton("Previous page", self)
+        prev_button.setShortcut("PgUp")
+        prev_button.clicked.connect(self.onPrevPage)
+        layout.addWidget(prev_button)
+
+        self.pageInfo = QLabel("")
+        self.pageInfo.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.pageInfo)
+
+        apply_button = QPushButton("Apply checked labels", self)
+        apply_button.setStatusTip("Set the checked labels to the selected thumbnails")
+        apply_button.clicked.connect(self.onApplyChecked)
+        layout.addWidget(apply_button)
+
+        next_button = QPushButton("Next page", self)
+        next_button.setShortcut("PgDown")
+        next_button.clicked.connect(self.onNextPage)
+        layout.addWidget(next_button)
+        self.layout.addLayout(layout)
+
+        # same label presets than the labeler
+        for sh_key, sh_fn in labeler.labelPresets():
+            sh = QShortcut(sh_key, self)
+            sh.activated.connect(sh_fn)
+            sh.activated.connect(self.onApplyPreset)
+
+        # take the decoded thumbnails until the page is complete
+        self.loadTimer = QTimer(self)
+        self.loadTimer.timeout.connect(self.onLoadThumbnails)
+
+    @property
+    def pageSize(self):
+        return self.cols * self.rows
+
+    def item2text(self, idx):
+        img_path, label = self.labeler.data[idx]
+        labels = self.labeler.id2label(self.labeler.parseLabel(label))
+        if isinstance(labels, list):
+            labels = '_'.join(labels)
+        return "{}\n{}".format(os.path.basename(img_path), labels)
+
+    def thumbKey(self, idx):
+        img_path, _ = self.labeler.data[idx]
+        return os.path.join(self.labeler.data.images_root, img_path), \
+            self.thumb_size
+
+    def openStore(self):
+        # the packed thumbnails of the dataset, if built
+        thumbs_file = self.labeler.data.thumbs_file
+        if self.store is None or self.store.store_path != thumbs_file:
+            self.store = ThumbnailStore(thumbs_file, self.thumb_size)
+            self.storeRoot = self.labeler.data.images_root
+            self.store.open()
+        else:
+            self.store.reload()
+
+    def readThumbnail(self, img_path, size):
+        # the packed thumbnail, decoded from the image if missing or modified
+        store = self.store
+        if store is not None and len(store) > 0:
+            img = store.get(os.path.relpath(img_path, self.storeRoot or '.'),
+                            fileState(img_path))
+            if img is not None:
+                return img
+        return readThumbnail(img_path, size)
+
+    def pageRows(self, page):
+        listModel = self.labeler.listModel
+        start = page * self.pageSize
+        end = min(start + self.pageSize, listModel.rowCount())
+        return [listModel.dataRow(r) for r in range(start, end)]
+
+    @property
+    def nPages(self):
+        n_rows = self.labeler.listModel.rowCount()
+        return max((n_rows + self.pageSize - 1) // self.pageSize, 1)
+
+    def showCurrentPage(self):
+        # the page of the labeler current image
+        row = self.labeler.listView.currentIndex().row()
+        self.showPage(max(row, 0) // self.pageSize)
+
+    def showPage(self, page):
+        self.openStore()
+        self.page = min(max(page, 0), self.nPages - 1)
+        rows = self.pageRows(self.page)
+        self.model.setRows(rows)
+        self.pageInfo.setText("Page {} of {}".format(self.page + 1,
+                                                     self.nPages))
+        # this page first, then the next one
+        keys = [self.thumbKey(r) for r in rows]
+        keys += [self.thumbKey(r) for r in self.pageRows(self.page + 1)]
+        self.thumbLoader.prefetch(keys)
+        if not self.model.loadThumbnails():
+            self.loadTimer.start(30)
+
+    def onLoadThumbnails(self):
+        busy = self.thumbLoader.busy
+        if self.model.loadThumbnails() or not busy:
+            self.loadTimer.stop()
+
+    def onPrevPage(self):
+        self.showPage(self.page - 1)
+
+    def onNextPage(self):
+        self.showPage(self.page + 1)
+
+    def selectedRows(self):
+        return sorted(self.model.dataRow(i.row())
+                      for i in self.view.selectionModel().selectedIndexes())
+
+    def applyLabels(self, labels):
+        rows = self.selectedRows()
+        if len(rows) == 0:
+            return 0
+        changed = self.labeler.applyLabels(rows, labels)
+        for row in rows:
+            self.model.updateRow(row)
+        return changed
+
+    def onApplyPreset(self):
+        self.applyLabels(self.labeler.labels)
+        self.labeler.setLastLabel()
+
+    def onApplyChecked(self):
+        self.applyLabels(self.labeler.getValidLabels())
+
+    def onOpenItem(self, index):
+        self.labeler.setCurrentRow(self.model.dataRow(index.row()))
+
+    def showEvent(self, event):
+        self.showCurrentPage()
+        super(ThumbnailGrid, self).showEvent(event)
+
+    def clear(self):
+        self.loadTimer.stop()
+        self.thumbLoader.cancel()
+        self.thumbCache.clear()
+        self.model.setRows([])
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def closeEvent(self, event):
+        self.loadTimer.stop()
+        self.thumbLoader.cancel()
+        event.accept()
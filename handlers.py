@@ -6,36 +6,136 @@ Created on Fri Jul  3 00:51:40 2020
 @author: Angel Ayala <angel4ayala [at] gmail.com>
 """
 import os
-import ast
-import pandas as pd
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from lazy import LazyModule
+from archives import openArchive
+from labels import LabelCodec
+from labels import LabelStats
+from journal import LabelJournal
+from timing import timers
 
+pd = LazyModule('pandas')
+
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'tiff', 'bmp']
 
 class SearchHandler:
     """Handler class for searching files inside a root folder."""
 
-    def __init__(self, root_path):
+    def __init__(self, root_path, workers=8):
         """Initialize the search handler.
 
         Parameters
         ----------
         root_path : string
             The root path where search file.
+        workers : int, optional
+            The number of threads listing folders. The default is 8.
 
         """
         self.root_path = root_path
+        self.workers = workers
         self.elements = []
         self.elements_path = []
+        self.folders = {}
+        self.scanned = 0
+        self.elapsed = 0.
+
+    @staticmethod
+    def listFolder(folder_path, valid_extensions=None):
+        """List the files and subfolders of a single folder.
+
+        Parameters
+        ----------
+        folder_path : string
+            The folder to list.
+        valid_extensions : list, optional
+            The files extensions to consider, all if None.
+            The default is None.
+
+        Returns
+        -------
+        int
+            The folder modification time in nanoseconds, taken before the
+            listing.
+        list
+            The (name, is_dir) tuples of the entries sorted by name.
+        int
+            The number of entries scanned.
+
+        """
+        mtime = os.stat(folder_path).st_mtime_ns
+        with os.scandir(folder_path) as it:
+            # sorting by name as the subfolders are inlined in that order
+            entries = sorted(it, key=lambda e: e.name)
+
+        items = []
+        for entry in entries:
+            # DirEntry reuse the type info from the folder listing
+            if entry.is_file():
+                extension = entry.name.lower().rsplit('.', 1)[-1]
+                if (valid_extensions is None
+                   or extension in valid_extensions):
+                    items.append((entry.name, False))
+
+            elif entry.is_dir():
+                items.append((entry.name, True))
+
+        return mtime, items, len(entries)
+
+    def _scan(self, executor, folder_path, rel_path, valid_extensions):
+        """List a folder, submitting the scan of its subfolders."""
+        mtime, entries, scanned = self.listFolder(folder_path,
+                                                  valid_extensions)
+        self.folders[rel_path] = (mtime, [n for n, d in entries if d])
+
+        items = []
+        for name, is_dir in entries:
+            if is_dir:
+                sub_path = os.path.join(rel_path, name) \
+                    if rel_path else name
+                items.append(executor.submit(
+                    self._scan, executor, os.path.join(folder_path, name),
+                    sub_path, valid_extensions))
+            else:
+                items.append(name)
+
+        return rel_path, items, scanned
+
+    def _collect(self, future):
+        """Append the folder scan results in depth-first order."""
+        rel_path, items, scanned = future.result()
+        elm_path = rel_path if rel_path else '.'
+
+        for item in items:
+            if isinstance(item, str):
+                self.elements.append(item)
+                self.elements_path.append(elm_path)
+            else:
+                scanned += self._collect(item)
+
+        return scanned
 
     def search(self, folder_path=None, level=0, valid_extensions=None):
         """Search all the files inside the root_path.
 
+        The folders are listed concurrently with os.scandir, but the
+        elements keep the depth-first order of the sorted folder entries.
+
         Parameters
         ----------
         folder_path : string, optional
-            The path where start or continue the searching.
+            The path where start the searching.
             The default is None.
         level : int, optional
-            The subfolder level. The default is 0.
+            Ignored, kept for the previous callers, all the subfolders are
+            scanned at once. The default is 0.
+        valid_extensions : list, optional
+            The files extensions to consider, all if None.
+            The default is None.
 
         Returns
         -------
@@ -48,40 +148,29 @@ class SearchHandler:
         if folder_path is None:
             folder_path = self.root_path
 
-        current_path = folder_path.replace(self.root_path, '')
-        folder_elems = os.listdir(folder_path)
-        # sorting for leave the subfolder at the final
-        folder_elems.sort()
-
-        if level == 0:
-            print('Navigating', str(os.path.sep).join(
-                self.root_path.split(os.path.sep)[-3:]))
-        else:
-            print('-'*level, current_path.split(os.path.sep)[-1])
-
-        for elem in folder_elems:
-            elem_path = os.path.join(folder_path, elem)
+        rel_path = os.path.relpath(folder_path, self.root_path)
+        rel_path = '' if rel_path == '.' else rel_path
 
-            # if is file
-            if os.path.isfile(elem_path):
-                extension = elem_path.lower().split(".")[-1]
+        print('Navigating', str(os.path.sep).join(
+            folder_path.split(os.path.sep)[-3:]))
 
-                if (extension in valid_extensions
-                   or valid_extensions is None):
-                    # filter extension file if must apply
-                    self.elements.append(elem)
-                    _elm_path = current_path.replace(os.path.sep, '', 1)
-                    if _elm_path == '':
-                        _elm_path = '.'
-                    self.elements_path.append(_elm_path)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            root = executor.submit(self._scan, executor, folder_path,
+                                   rel_path, valid_extensions)
+            self.scanned = self._collect(root)
+        self.elapsed = time.perf_counter() - start
 
-            elif os.path.isdir(elem_path):
-                # if dir go deeper
-                self.search(elem_path, level+1,
-                            valid_extensions=valid_extensions)
+        print('{} files scanned in {:.2f}s ({:.0f} files/s)'.format(
+            self.scanned, self.elapsed, self.scan_rate))
 
         return self.elements, self.elements_path
 
+    @property
+    def scan_rate(self):
+        """Files scanned per second by the last search."""
+        return self.scanned / self.elapsed if self.elapsed > 0 else 0.
+
     def searchImages(self):
         """Search only images.
 
@@ -95,50 +184,406 @@ class SearchHandler:
         list
             The subfolder of the images if there is the case.
         """
-        valid_extensions = ['jpg', 'jpeg', 'png',
-                            'gif', 'tiff', 'bmp']
-        return self.search(valid_extensions=valid_extensions)
+        return self.search(valid_extensions=IMAGE_EXTENSIONS)
 
 
 class DataHandler:
     """Handler class for csv data."""
 
-    def __init__(self, filepath):
+    # the snapshots can be written from another thread
+    background_save = True
+
+    def __init__(self, filepath, labels_id=None, use_journal=False,
+                 archive=None):
         """Initialize the handler.
 
         Parameters
         ----------
         filepath : string
             The csv file target to write or read the data.
+        labels_id : list, optional
+            The known labels, required to store them as bitmasks.
+            The default is None.
+        use_journal : bool, optional
+            if the label changes are appended to a journal next to the csv,
+            replayed on read until saved. The default is False.
+        archive : string, optional
+            A zip or tar file with the images, instead of the csv folder.
+            The default is None.
         """
         file_path = filepath.split(os.path.sep)
         self.csv_file = file_path[-1]
         self.root_path = str(os.path.sep).join(file_path[:-1])
         self.loaded = False
+        self.codec = LabelCodec(labels_id) if labels_id else None
+        # labels stored as 'str' in the class column, or 'mask' as bitmasks
+        # in the class_mask column
+        self.label_format = 'str'
         self.data = []
+        self.journal = None
+        if use_journal:
+            self.journal = LabelJournal(
+                os.path.join(self.root_path, self.csv_file + '.journal'))
+        # folders mtime and subfolders from the last scan
+        self.folders = None
+        self.have_labels = False
+        self.stats = None
+        self.archive_path = archive
+
+    @property
+    def images_root(self):
+        """The folder of the images, or the archive containing them."""
+        return self.archive_path or self.root_path
+
+    @property
+    def data(self):
+        """The pandas.DataFrame of the data, with the current labels.
+
+        The rows are accessed through the column arrays, the label changes
+        are copied into the dataframe only when it is requested.
+        """
+        if self._labels_changed:
+            self._frame[self.label_column] = self._labelValues()
+            self._labels_changed = False
+        return self._frame
+
+    @data.setter
+    def data(self, dataset_df):
+        """Set the pandas.DataFrame, rebuilding the column arrays."""
+        self._frame = dataset_df
+        self._labels_changed = False
+        if len(dataset_df) == 0:
+            dataset_df = pd.DataFrame(
+                columns=['folder_path', 'image_id', self.label_column])
+
+        # interned folders, the paths are its prefix plus the image_id
+        codes, folders = pd.factorize(dataset_df['folder_path'])
+        self._folder_codes = codes.astype(np.int32)
+        self._folder_names = list(folders)
+        self._folder_prefix = [os.path.join(f, '') for f in folders]
+        self._image_ids = dataset_df['image_id'].to_numpy(dtype=object)
+
+        if self.label_format == 'mask':
+            # the bitmasks are the codes
+            self._label_codes = np.array(dataset_df['class_mask'],
+                                         dtype=self.codec.dtype)
+        else:
+            codes, values = pd.factorize(dataset_df['class'],
+                                         use_na_sentinel=False)
+            self._label_codes = codes.astype(np.int32)
+            self._label_values = list(values)
+            self._label_index = {v: i for i, v in enumerate(values)}
+
+    def _labelValues(self, codes=None, label_values=None):
+        """The stored labels array from the label codes."""
+        if codes is None:
+            codes = self._label_codes
+            label_values = None if self.label_format == 'mask' \
+                else self._label_values
+        if label_values is None:
+            # the bitmasks are the codes
+            return codes.copy()
+        values = np.empty(len(label_values), dtype=object)
+        values[:] = label_values
+        return values[codes]
+
+    def _labelCode(self, value):
+        """The code of a stored label value, interned if new."""
+        if self.label_format == 'mask':
+            return value
+        code = self._label_index.get(value)
+        if code is None:
+            code = len(self._label_values)
+            self._label_values.append(value)
+            self._label_index[value] = code
+        return code
+
+    def _labelValue(self, code):
+        if self.label_format == 'mask':
+            return code
+        return self._label_values[code]
 
     def __len__(self):
-        """Length of the pandas dataframe."""
-        return len(self.data)
+        """Number of rows."""
+        return len(self._image_ids)
+
+    @property
+    def label_column(self):
+        """The column storing the labels."""
+        return 'class_mask' if self.label_format == 'mask' else 'class'
+
+    def key(self, idx):
+        """The (folder_path, image_id) identifying a row."""
+        return (self._folder_names[self._folder_codes[idx]],
+                self._image_ids[idx])
 
     def __getitem__(self, idx):
         """Get the image path and label of an element data."""
         # read image
-        img_path = os.path.join(self.data.iloc[idx]['folder_path'],
-                                self.data.iloc[idx]['image_id'])
+        img_path = self._folder_prefix[self._folder_codes[idx]] + \
+            self._image_ids[idx]
 
         # read label
-        label = self.data.iloc[idx]['class']
+        label = self._labelValue(self._label_codes[idx])
+        if self.label_format == 'mask':
+            label = self.codec.decode(label)
 
         return img_path, label
 
     def __setitem__(self, idx, label):
         """Set the label of an element data."""
-        # set label
-        self.data.iloc[idx]['class'] = label
+        if self._store(idx, label) and self.journal is not None:
+            self.journal.append(self.key(idx), label)
 
         return self[idx]
 
+    def isWritable(self, idx):
+        """Check if the label of a row can be set, always for a csv."""
+        return True
+
+    def leasedRows(self):
+        """The rows labeled by this session, None if all."""
+        return None
+
+    def _storedValue(self, label):
+        """The value stored for a label, labels list or 'unset'."""
+        if self.label_format == 'mask':
+            return self.codec.encode(label)
+        elif isinstance(label, list):
+            if len(label) == 0:
+                return 'unset'
+            elif len(label) == 1:
+                return label[0]
+            # as it is read from the csv
+            return str(label)
+        return label
+
+    def _store(self, idx, label):
+        """Set the label of an element data, True if it changed."""
+        value = self._storedValue(label)
+
+        # set label
+        code = self._labelCode(value)
+        prev_code = self._label_codes[idx]
+        if prev_code == code:
+            return False
+        self._label_codes[idx] = code
+        self._labels_changed = True
+
+        if self.stats is not None:
+            folder = self._folder_names[self._folder_codes[idx]]
+            self.stats.update(folder, self._labelValue(prev_code), value)
+        return True
+
+    def _combine(self, value, labels, mode):
+        """The stored value after adding or removing labels."""
+        current = LabelCodec.toList(self.codec.decode(value)
+                                    if self.label_format == 'mask'
+                                    else value)
+        if mode == 'add':
+            current = current + [lbl for lbl in labels if lbl not in current]
+        else:
+            current = [lbl for lbl in current if lbl not in labels]
+        if self.codec is not None:
+            # keep the labels_id order, as the labeler does
+            order = self.codec.index
+            current.sort(key=lambda lbl: order.get(lbl, len(order)))
+        return self._storedValue(current)
+
+    def setLabels(self, rows, label, mode='set', dry_run=False):
+        """Set the label of many rows at once.
+
+        The new labels are computed once per distinct current label and
+        assigned as array operations.
+
+        Parameters
+        ----------
+        rows : array_like
+            The positional index of the rows.
+        label : string or list
+            The label, or labels list, to apply.
+        mode : string, optional
+            'set' to replace the labels, 'add' or 'remove' to add or remove
+            the labels from the current ones. The default is 'set'.
+        dry_run : bool, optional
+            if only count the rows which would change.
+            The default is False.
+
+        Returns
+        -------
+        int
+            The number of rows whose label changed.
+
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return 0
+        if mode not in ('set', 'add', 'remove'):
+            raise ValueError("Unknown mode '{}'".format(mode))
+
+        prev_codes = self._label_codes[rows]
+        uniques, inverse = np.unique(prev_codes, return_inverse=True)
+        if mode == 'set':
+            code = self._labelCode(self._storedValue(label))
+            new_uniques = [code] * len(uniques)
+        else:
+            labels = LabelCodec.toList(label)
+            new_uniques = [self._labelCode(self._combine(
+                self._labelValue(u), labels, mode)) for u in uniques]
+        new_codes = np.array(new_uniques,
+                             dtype=self._label_codes.dtype)[inverse]
+
+        changed = new_codes != prev_codes
+        n_changed = int(np.count_nonzero(changed))
+        if dry_run or n_changed == 0:
+            return n_changed
+
+        rows, prev_codes, new_codes = \
+            rows[changed], prev_codes[changed], new_codes[changed]
+        self._label_codes[rows] = new_codes
+        self._labels_changed = True
+
+        if self.stats is not None:
+            # moved counts by folder and label
+            groups = np.stack([self._folder_codes[rows].astype(np.int64),
+                               prev_codes.astype(np.int64),
+                               new_codes.astype(np.int64)])
+            groups, counts = np.unique(groups, axis=1, return_counts=True)
+            for (folder, prev, new), count in zip(groups.T, counts):
+                folder = self._folder_names[folder]
+                self.stats.add(folder, self._labelValue(prev), -int(count))
+                self.stats.add(folder, self._labelValue(new), int(count))
+
+        if self.journal is not None:
+            # one fsync for the whole batch
+            labels = {code: self.labelOf(code)
+                      for code in np.unique(new_codes)}
+            self.journal.extend((self.key(idx), labels[code])
+                                for idx, code in zip(rows, new_codes))
+
+        return n_changed
+
+    def imagePaths(self):
+        """The image path of each row, relative to the images root."""
+        return [path for _, paths, _ in self.iterRows() for path in paths]
+
+    def iterRows(self, chunk_rows=10000):
+        """Stream the rows in chunks, without building the frame.
+
+        Parameters
+        ----------
+        chunk_rows : int, optional
+            The rows of each chunk. The default is 10000.
+
+        Yields
+        ------
+        int
+            The position of the first row of the chunk.
+        numpy.ndarray
+            The image path of each row.
+        numpy.ndarray
+            The stored label of each row, bitmasks if stored as mask.
+
+        """
+        prefixes = np.array(self._folder_prefix + [''], dtype=object)
+        for start in range(0, len(self), chunk_rows):
+            stop = min(start + chunk_rows, len(self))
+            paths = prefixes[self._folder_codes[start:stop]] + \
+                self._image_ids[start:stop]
+            yield start, paths, self._labelValues(
+                self._label_codes[start:stop], self._label_values
+                if self.label_format != 'mask' else None)
+
+    def labelOf(self, code):
+        """The label of a label code, as returned by __getitem__."""
+        value = self._labelValue(code)
+        if self.label_format == 'mask':
+            return self.codec.decode(value)
+        return value
+
+    def matchFolders(self, predicate):
+        """Boolean array of the rows whose folder_path match a predicate.
+
+        The predicate is evaluated once per distinct folder.
+        """
+        found = np.array([bool(predicate(f)) for f in self._folder_names]
+                         + [False], dtype=bool)
+        return found[self._folder_codes]
+
+    def matchImages(self, pattern):
+        """Boolean array of the rows whose image_id match a regex."""
+        return np.array(pd.Series(self._image_ids, dtype=object)
+                        .str.match(pattern), dtype=bool)
+
+    def matchUnset(self):
+        """Boolean array of the rows without labels."""
+        if self.label_format == 'mask':
+            return self._label_codes == 0
+        code = self._label_index.get('unset', -1)
+        return self._label_codes == code
+
+    def indexOf(self, keys):
+        """The row positions of (folder_path, image_id) keys, -1 if missing.
+
+        Parameters
+        ----------
+        keys : pandas.DataFrame
+            The folder_path and image_id of each key.
+
+        """
+        index = pd.MultiIndex.from_arrays([
+            np.array(self._folder_names + [''], dtype=object)[
+                self._folder_codes], self._image_ids])
+        return index.get_indexer(pd.MultiIndex.from_frame(
+            keys[['folder_path', 'image_id']]))
+
+    @staticmethod
+    def _groupRows(codes):
+        """The distinct codes and the sorted rows array of each one."""
+        order = np.argsort(codes, kind='stable')
+        if len(order) == 0:
+            return [], []
+        sorted_codes = codes[order]
+        bounds = np.flatnonzero(sorted_codes[1:] != sorted_codes[:-1]) + 1
+        return (sorted_codes[np.r_[0, bounds]].tolist(),
+                np.split(order.astype(np.int64), bounds))
+
+    def labelRows(self):
+        """The sorted rows array of each label, 'unset' for no labels."""
+        groups = {}
+        for code, rows in zip(*self._groupRows(self._label_codes)):
+            labels = LabelCodec.toList(self.labelOf(code))
+            for lbl in labels if len(labels) > 0 else ['unset']:
+                groups.setdefault(lbl, []).append(rows)
+        return {lbl: np.sort(np.concatenate(rows)) if len(rows) > 1
+                else rows[0] for lbl, rows in groups.items()}
+
+    def folderRows(self):
+        """The sorted rows array of each folder_path."""
+        return {self._folder_names[code]: rows for code, rows in
+                zip(*self._groupRows(self._folder_codes))}
+
+    def buildStats(self):
+        """Count the labels of all the rows, then kept updated on changes."""
+        if self.label_format == 'mask':
+            def parse_fn(value):
+                return LabelCodec.toList(self.codec.decode(value))
+        else:
+            parse_fn = LabelCodec.toList
+        self.stats = LabelStats(parse_fn)
+
+        # count by folder and label codes pairs
+        labels, label_idx = np.unique(self._label_codes, return_inverse=True)
+        pairs = self._folder_codes.astype(np.int64) * len(labels) + \
+            label_idx.ravel()
+        pairs, counts = np.unique(pairs, return_counts=True)
+        for pair, count in zip(pairs.tolist(), counts.tolist()):
+            folder, label = divmod(pair, len(labels))
+            self.stats.add(self._folder_names[folder],
+                           self._labelValue(labels[label]), count)
+        return self.stats
+
+    @timers.timed('data.read')
     def read(self):
         """Load the csv as pandas.DataFrame."""
         # if already loaded, do nothing
@@ -148,13 +593,34 @@ class DataHandler:
         csv_path = os.path.join(self.root_path, self.csv_file)
         print('Reading', str(os.path.sep).join(
             csv_path.split(os.path.sep)[-2:]))
-        dataset_df = pd.read_csv(csv_path)
+        dataset_df = self.readCache()
+        from_csv = dataset_df is None
+        if from_csv:
+            dataset_df = pd.read_csv(csv_path)
+
+        if 'class_mask' in dataset_df.columns:
+            with open(self.labels_file) as f:
+                self.codec = LabelCodec(json.load(f)['labels_id'])
+            dataset_df['class_mask'] = \
+                dataset_df['class_mask'].astype(self.codec.dtype)
+            self.label_format = 'mask'
+        else:
+            self.label_format = 'str'
 
         self.data = dataset_df
         self.loaded = True
+        if from_csv:
+            # before the journal changes, as the csv
+            self.writeCache()
+        self.readFolders()
+
+        if self.journal is not None:
+            self.replayJournal()
+        self.buildStats()
 
         return self.data
 
+    @timers.timed('data.create')
     def create(self, have_labels=False):
         """Create the pandas.DataFrame from the container folder.
 
@@ -175,39 +641,555 @@ class DataHandler:
 
         """
         # search
-        searcher = SearchHandler(self.root_path)
-        searcher.searchImages()
+        elements, elements_path = self.searchImages()
+        self.have_labels = have_labels
 
         # save
-        dataset_df = pd.DataFrame(data=searcher.elements, columns=['image_id'])
-        dataset_df.insert(0, 'folder_path', searcher.elements_path)
+        dataset_df = pd.DataFrame(data=elements, columns=['image_id'])
+        dataset_df.insert(0, 'folder_path', elements_path)
 
         if have_labels:
-            images_path = [p.lower() for p in searcher.elements_path]
+            images_path = [p.lower() for p in elements_path]
             dataset_df.insert(2, 'class', images_path)
         else:
             dataset_df.insert(2, 'class', 'unset')
 
+        self.label_format = 'str'
         self.data = dataset_df.sort_values(
             ['folder_path', 'class', 'image_id'])
         self.loaded = True
+        self.buildStats()
         return self.data
 
+    def searchImages(self):
+        """List the images of the folder, or of the archive.
+
+        Returns
+        -------
+        list
+            the images found.
+        list
+            The subfolder of the images, '.' for the root.
+
+        """
+        if self.archive_path is not None:
+            # the archive index is the listing, no folders to rescan
+            self.folders = {}
+            return openArchive(self.archive_path).listFiles(IMAGE_EXTENSIONS)
+
+        searcher = SearchHandler(self.root_path)
+        searcher.searchImages()
+        self.folders = searcher.folders
+        return searcher.elements, searcher.elements_path
+
+    @timers.timed('data.save')
     def save(self):
         """Save the pandas.DataFrame into csv."""
-        # save file
+        self.writeSnapshot(self.snapshot())
+
+    def snapshot(self):
+        """Copy the labels, to be written while the labeling continues.
+
+        Only the label codes are copied, the other columns are shared
+        with the current frame. The labels format and the folders state
+        are copied too, as a refresh may change them while written. The
+        journal changes until now are set aside, and removed once the
+        snapshot is written.
+
+        Returns
+        -------
+        dict
+            The frame, label codes, label values, format, codec and
+            folders state of the data.
+
+        """
+        snapshot = {'frame': self._frame.copy(deep=False),
+                    'codes': self._label_codes.copy(),
+                    # append only, all the copied codes have its value
+                    'values': None if self.label_format == 'mask'
+                    else list(self._label_values),
+                    'format': self.label_format,
+                    'codec': self.codec,
+                    'folders': self._foldersState()}
+        if self.journal is not None:
+            self.journal.rotate()
+        return snapshot
+
+    def writeSnapshot(self, snapshot, progress=None, chunk_rows=100000):
+        """Write a snapshot into the csv, safe to call from a thread.
+
+        The csv is written aside and renamed over the previous one, so a
+        crash while writing never leaves it truncated.
+
+        Parameters
+        ----------
+        snapshot : dict
+            The labels state returned by snapshot.
+        progress : callable, optional
+            Called with the fraction of rows written. The default is None.
+        chunk_rows : int, optional
+            The rows written between progress calls. The default is 100000.
+
+        """
         csv_path = os.path.join(self.root_path, self.csv_file)
         print('Saving', str(os.path.sep).join(
             csv_path.split(os.path.sep)[-2:]))
-        self.data.to_csv(csv_path, index=None)
+        dataset_df = snapshot['frame']
+        label_column = 'class_mask' if snapshot['format'] == 'mask' \
+            else 'class'
+        dataset_df[label_column] = self._labelValues(
+            snapshot['codes'], snapshot['values'])
+
+        tmp_path = csv_path + '.tmp'
+        with open(tmp_path, 'w', newline='') as f:
+            if len(dataset_df) == 0:
+                dataset_df.to_csv(f, index=None)
+            for start in range(0, len(dataset_df), chunk_rows):
+                dataset_df.iloc[start:start + chunk_rows].to_csv(
+                    f, header=start == 0, index=None)
+                if progress is not None:
+                    progress(min(start + chunk_rows, len(dataset_df)) /
+                             len(dataset_df))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, csv_path)
+        if snapshot['folders'] is not None:
+            self.saveFolders(snapshot['folders'])
+        self.writeCache(dataset_df, snapshot['format'])
+
+        if snapshot['format'] == 'mask':
+            with open(self.labels_file, 'w') as f:
+                json.dump({'labels_id': snapshot['codec'].labels_id}, f)
+
+        # the changes set aside are in the csv now
+        if self.journal is not None:
+            self.journal.release()
+
+    def replayJournal(self):
+        """Apply the journal changes not yet saved into the csv.
+
+        Returns
+        -------
+        int
+            The number of changes applied.
+
+        """
+        changes = self.journal.replay()
+        if len(changes) == 0:
+            return 0
+
+        rows = dict(zip(zip(self.data['folder_path'], self.data['image_id']),
+                        range(len(self.data))))
+        replayed = 0
+        for key, label, _ in changes:
+            idx = rows.get(tuple(key))
+            if idx is not None:
+                self._store(idx, label)
+                replayed += 1
+        print('Replayed {} label changes from the journal'.format(replayed))
+
+        return replayed
+
+    def hasJournal(self):
+        """Check if there are changes in the journal not saved to the csv."""
+        return self.journal is not None and len(self.journal) > 0
+
+    def compact(self):
+        """Fold the journal changes into the csv, if there are any."""
+        if not self.hasJournal():
+            return False
+        self.save()
+        return True
+
+    @property
+    def labels_file(self):
+        """The sidecar file with the labels of the bitmasks."""
+        return os.path.join(self.root_path, self.csv_file + '.labels.json')
+
+    def toMask(self):
+        """Convert the stored labels into bitmasks.
+
+        Raises ValueError if a label is not in the labels_id.
+        """
+        if self.label_format == 'mask':
+            return False
+        if self.codec is None:
+            raise ValueError('The labels_id are required to use bitmasks')
+
+        masks = self.codec.encodeColumn(self.data['class'])
+        col = self.data.columns.get_loc('class')
+        dataset_df = self.data.drop(columns='class')
+        dataset_df.insert(col, 'class_mask', masks)
+        self.label_format = 'mask'
+        self.data = dataset_df
+        self.buildStats()
+        return True
+
+    def toStr(self):
+        """Convert the stored bitmasks into labels strings."""
+        if self.label_format == 'str':
+            return False
+
+        labels = self.codec.decodeColumn(self.data['class_mask'].to_numpy())
+        col = self.data.columns.get_loc('class_mask')
+        dataset_df = self.data.drop(columns='class_mask')
+        dataset_df.insert(col, 'class', labels)
+        self.label_format = 'str'
+        self.data = dataset_df
+        self.buildStats()
+        return True
+
+    def select(self, labels, require_all=False):
+        """Get the rows index having the labels.
+
+        Parameters
+        ----------
+        labels : list
+            The labels to look for.
+        require_all : bool, optional
+            if all the labels must be present instead of any of them.
+            The default is False.
+
+        Returns
+        -------
+        numpy.ndarray
+            The positional index of the matching rows.
+
+        """
+        if self.label_format == 'mask':
+            masks = self.data['class_mask'].to_numpy()
+            if require_all:
+                match = self.codec.hasAll(masks, labels)
+            else:
+                match = self.codec.hasAny(masks, labels)
+        else:
+            wanted = set(labels)
+            codes, uniques = pd.factorize(self.data['class'])
+            found = []
+            # only the distinct values are parsed
+            for value in uniques:
+                value_set = set(LabelCodec.toList(value))
+                found.append(wanted <= value_set if require_all
+                             else len(wanted & value_set) > 0)
+            # the missing values code is -1
+            found.append(False)
+            match = np.array(found, dtype=bool)[codes]
+        return np.flatnonzero(match)
+
+    @property
+    def cache_file(self):
+        """The sidecar file with the csv columns in binary form."""
+        return os.path.join(self.root_path, self.csv_file + '.cache.npz')
+
+    def _csvState(self):
+        """The (size, mtime_ns) of the csv file, the cache key."""
+        st = os.stat(os.path.join(self.root_path, self.csv_file))
+        return st.st_size, st.st_mtime_ns
+
+    def writeCache(self, dataset_df=None, label_format=None):
+        """Write the csv columns as a binary sidecar.
+
+        The folder_path and class are dictionary encoded, the image_id
+        joined in a single utf-8 buffer. Its key is the csv size and
+        modification time, so it must match the csv content, the current
+        data if dataset_df is None, with labels in label_format, the
+        current one if None.
+        """
+        if dataset_df is None:
+            dataset_df = self.data
+        label_format = label_format or self.label_format
+        label_column = 'class_mask' if label_format == 'mask' else 'class'
+        if len(dataset_df) == 0 or any(c not in ('folder_path', 'image_id',
+                                                 label_column)
+                                       for c in dataset_df.columns):
+            return False
+
+        folder_codes, folder_names = pd.factorize(dataset_df['folder_path'],
+                                                  sort=True)
+        image_ids = dataset_df['image_id'].to_numpy(dtype=object)
+        # only text columns, as read back from the csv
+        infer = pd.api.types.infer_dtype
+        if (infer(np.asarray(folder_names), skipna=False) != 'string'
+           or infer(image_ids, skipna=False) != 'string'):
+            return False
+
+        columns = {
+            'csv_state': np.array(self._csvState(), dtype=np.int64),
+            'columns': np.array(list(dataset_df.columns), dtype=str),
+            'folder_codes': folder_codes.astype(np.int32),
+            'folder_names': np.asarray(folder_names, dtype=str),
+            'image_ids': np.frombuffer('\0'.join(image_ids).encode(
+                'utf-8'), dtype=np.uint8)}
+        if label_format == 'mask':
+            columns['class_mask'] = dataset_df['class_mask'].to_numpy()
+        else:
+            label_codes, label_values = pd.factorize(dataset_df['class'],
+                                                     sort=True)
+            if infer(np.asarray(label_values), skipna=False) != 'string' \
+                    or (label_codes < 0).any():
+                return False
+            columns['label_codes'] = label_codes.astype(np.int32)
+            columns['label_values'] = np.asarray(label_values, dtype=str)
+
+        # replaced at once, never read half written
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_file, self.cache_file)
+        return True
+
+    def readCache(self):
+        """Load the csv dataframe from the binary sidecar, if still valid.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The data with categorical folder_path and class, None if the
+            cache is missing or older than the csv.
+
+        """
+        if not os.path.isfile(self.cache_file):
+            return None
+        try:
+            with np.load(self.cache_file) as cached:
+                if tuple(cached['csv_state']) != self._csvState():
+                    return None
+                image_ids = bytes(cached['image_ids']).decode(
+                    'utf-8').split('\0')
+                dataset_df = pd.DataFrame({
+                    'folder_path': pd.Categorical.from_codes(
+                        cached['folder_codes'],
+                        cached['folder_names'].astype(object)),
+                    'image_id': np.array(image_ids, dtype=object)})
+                if 'class_mask' in cached:
+                    dataset_df['class_mask'] = cached['class_mask']
+                else:
+                    dataset_df['class'] = pd.Categorical.from_codes(
+                        cached['label_codes'],
+                        cached['label_values'].astype(object))
+                columns = list(cached['columns'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+        return dataset_df[columns]
+
+    @property
+    def hashes_file(self):
+        """The sidecar file with the cached images hashes."""
+        return os.path.join(self.root_path, self.csv_file + '.hashes.npz')
+
+    @property
+    def scores_file(self):
+        """The sidecar file with the cached images label scores."""
+        return os.path.join(self.root_path, self.csv_file + '.scores.npz')
+
+    @property
+    def thumbs_file(self):
+        """The sidecar file with the packed images thumbnails."""
+        return os.path.join(self.root_path, self.csv_file + '.thumbs.bin')
+
+    @property
+    def folders_file(self):
+        """The sidecar file with the folders state of the last scan."""
+        return os.path.join(self.root_path, self.csv_file + '.folders.json')
+
+    def readFolders(self):
+        """Load the folders state of the last scan, if any."""
+        if not os.path.isfile(self.folders_file):
+            self.folders = None
+            return False
+
+        with open(self.folders_file) as f:
+            state = json.load(f)
+        self.have_labels = state['have_labels']
+        self.folders = {k: tuple(v) for k, v in state['folders'].items()}
+        if state.get('archive') is not None:
+            self.archive_path = os.path.join(self.root_path,
+                                             state['archive'])
+        return True
+
+    def _foldersState(self):
+        """The folders state of the last scan, None if not scanned."""
+        if self.folders is None:
+            return None
+
+        state = {'have_labels': self.have_labels,
+                 'folders': dict(self.folders)}
+        if self.archive_path is not None:
+            # relative, the archive moves along the csv
+            state['archive'] = os.path.relpath(self.archive_path,
+                                               self.root_path or '.')
+        return state
+
+    def saveFolders(self, state=None):
+        """Write a folders state next to the csv, the last scan if None."""
+        if state is None:
+            state = self._foldersState()
+        if state is None:
+            return False
+
+        with open(self.folders_file, 'w') as f:
+            json.dump(state, f)
+        return True
+
+    def _refreshFolder(self, rel_path):
+        """Stat a folder, listing it only if changed since the last scan."""
+        folder_path = os.path.join(self.root_path, rel_path)
+        try:
+            mtime = os.stat(folder_path).st_mtime_ns
+        except FileNotFoundError:
+            return rel_path, None, None
+
+        if rel_path in self.folders and self.folders[rel_path][0] == mtime:
+            return rel_path, self.folders[rel_path], None
+
+        mtime, entries, _ = SearchHandler.listFolder(folder_path,
+                                                     IMAGE_EXTENSIONS)
+        subfolders = [n for n, d in entries if d]
+        files = [n for n, d in entries if not d]
+        return rel_path, (mtime, subfolders), files
+
+    def refresh(self, workers=8):
+        """Sync the data with the images currently in the folder.
+
+        Only the folders modified since the last scan are listed again,
+        the added images are appended with the default label and the
+        removed ones are dropped, keeping all the other labels.
+        Without a previous scan state all the folders are listed.
+
+        Parameters
+        ----------
+        workers : int, optional
+            The number of threads checking folders. The default is 8.
+
+        Returns
+        -------
+        int
+            The number of images added.
+        int
+            The number of images removed.
+
+        Raises
+        ------
+        ValueError
+            If the labels are bitmasks and a new folder label is not in
+            the labels_id, the data is kept unchanged.
+
+        """
+        if self.archive_path is not None:
+            return self._refreshArchive()
+
+        full_scan = self.folders is None
+        if full_scan:
+            # unknown state, all folders must be listed
+            self.folders = {}
+
+        folders, listed = self._listChanged(workers)
+        found = set(k or '.' for k in folders)
+        if full_scan:
+            removed_folders = set(self.folderPaths()) - found
+        else:
+            removed_folders = set(k or '.' for k in self.folders) - found
+
+        added, n_removed = self._mergeChanges(removed_folders, listed)
+        self.folders = folders
+        if added + n_removed > 0:
+            self.buildStats()
+        print('Refreshed {} folders: {} images added, {} removed'.format(
+            len(listed), added, n_removed))
+
+        return added, n_removed
+
+    def _refreshArchive(self):
+        """Sync the data with the images of the archive index."""
+        elements, elements_path = openArchive(self.archive_path).listFiles(
+            IMAGE_EXTENSIONS)
+        listed = {}
+        for image_id, folder in zip(elements, elements_path):
+            listed.setdefault(folder, []).append(image_id)
+        removed_folders = set(self.folderPaths()) - set(listed)
+
+        added, n_removed = self._mergeChanges(removed_folders, listed)
+        if added + n_removed > 0:
+            self.buildStats()
+        print('Refreshed the archive: {} images added, {} removed'.format(
+            added, n_removed))
+
+        return added, n_removed
+
+    def _listChanged(self, workers):
+        """Walk the known folders, listing only the changed ones."""
+        folders = {}
+        listed = {}
+        level = ['']
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while len(level) > 0:
+                next_level = []
+                for rel_path, state, files in executor.map(
+                        self._refreshFolder, level):
+                    if state is None:
+                        continue
+                    folders[rel_path] = state
+                    if files is not None:
+                        listed[rel_path or '.'] = files
+                    next_level.extend(os.path.join(rel_path, n)
+                                      if rel_path else n for n in state[1])
+                level = next_level
+
+        return folders, listed
+
+    def folderPaths(self):
+        """The distinct folder_path of the data."""
+        return self.data['folder_path'].unique()
+
+    def _mergeChanges(self, removed_folders, listed):
+        """Drop the removed images and append the new ones."""
+        folder_col = self.data['folder_path']
+        drop = np.array(folder_col.isin(removed_folders), dtype=bool)
+
+        # only the rows of the listed folders are compared by image
+        listed_keys = [(p, f) for p, files in listed.items() for f in files]
+        in_listed = np.array(folder_col.isin(list(listed)), dtype=bool)
+        listed_df = self.data.loc[in_listed]
+        row_keys = list(zip(listed_df['folder_path'], listed_df['image_id']))
+        listed_set = set(listed_keys)
+        drop[in_listed] = [k not in listed_set for k in row_keys]
+        known = set(row_keys)
+        added = [k for k in listed_keys if k not in known]
+
+        n_removed = int(drop.sum())
+        dataset_df = self.data.loc[~drop]
+        if len(added) > 0:
+            added_df = pd.DataFrame(data=added,
+                                    columns=['folder_path', 'image_id'])
+            if self.have_labels:
+                added_df['class'] = added_df['folder_path'].str.lower()
+            else:
+                added_df['class'] = 'unset'
+            if self.label_format == 'mask':
+                # raises before the data is changed
+                added_df['class_mask'] = self.codec.encodeColumn(
+                    added_df.pop('class'))
+            dataset_df = pd.concat([dataset_df, added_df])
+            # same order than create
+            dataset_df = dataset_df.sort_values(
+                ['folder_path', 'image_id'], kind='mergesort')
+
+        self.data = dataset_df.reset_index(drop=True)
+
+        return len(added), n_removed
 
     def get_stats(self):
-        """Get current information about classes of csv file."""
-        val_stats = self.data['class'].value_counts()
-        labels = map(lambda x: ast.literal_eval(x) if "[" in x else x,
-                     val_stats.index)
-        qt_by_label = val_stats.to_list()
-        val_stats = list(zip(labels, qt_by_label))
-        val_stats.sort(key=lambda x: x[0][0] if type(x[0]) is list else x[0])
-
-        return val_stats
+        """Get current information about classes of csv file.
+
+        Returns
+        -------
+        list
+            The (label, count) of each label combination, the multiple
+            labels as list.
+
+        """
+        if self.stats is None:
+            self.buildStats()
+
+        return self.stats.byCombination()
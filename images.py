@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:25:40 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import os
+import io
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import numpy as np
+
+from lazy import LazyModule
+from archives import readMember
+from timing import timers
+
+cv2 = LazyModule('cv2')
+
+
+# the cv2 imread flags values, defined without importing cv2
+IMREAD_GRAYSCALE = 0
+IMREAD_COLOR = 1
+IMREAD_REDUCED_GRAYSCALE_2 = 16
+IMREAD_REDUCED_COLOR_2 = 17
+IMREAD_REDUCED_GRAYSCALE_4 = 32
+IMREAD_REDUCED_COLOR_4 = 33
+IMREAD_REDUCED_GRAYSCALE_8 = 64
+IMREAD_REDUCED_COLOR_8 = 65
+
+# the imread flags of each reduction factor
+REDUCED_FLAGS = {1: IMREAD_COLOR, 2: IMREAD_REDUCED_COLOR_2,
+                 4: IMREAD_REDUCED_COLOR_4, 8: IMREAD_REDUCED_COLOR_8}
+REDUCED_GRAY_FLAGS = {1: IMREAD_GRAYSCALE, 2: IMREAD_REDUCED_GRAYSCALE_2,
+                      4: IMREAD_REDUCED_GRAYSCALE_4,
+                      8: IMREAD_REDUCED_GRAYSCALE_8}
+
+
+def _exifOrientation(segment):
+    """The orientation tag of an APP1 segment, 1 if not Exif."""
+    if segment[:6] != b'Exif\0\0':
+        return 1
+    tiff = segment[6:]
+    order = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if order is None:
+        return 1
+    ifd = struct.unpack(order + 'I', tiff[4:8])[0]
+    count = struct.unpack(order + 'H', tiff[ifd:ifd + 2])[0]
+    for entry in range(ifd + 2, ifd + 2 + count * 12, 12):
+        tag, = struct.unpack(order + 'H', tiff[entry:entry + 2])
+        if tag == 0x0112:
+            return struct.unpack(order + 'H', tiff[entry + 8:entry + 10])[0]
+    return 1
+
+
+def _jpegSize(f):
+    f.seek(2)
+    orientation = 1
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # fill bytes
+        while marker[1] == 0xFF:
+            fill = f.read(1)
+            if not fill:
+                return None
+            marker = marker[1:] + fill
+        code = marker[1]
+        if code in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            continue
+        seg_len = struct.unpack('>H', f.read(2))[0]
+        # start of frame markers, except DHT, JPG and DAC
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>xHH', f.read(5))
+            # decoded rotated by a quarter turn, as cv2 applies it
+            if orientation >= 5:
+                return height, width
+            return width, height
+        if code == 0xE1:
+            orientation = _exifOrientation(f.read(seg_len - 2))
+        else:
+            f.seek(seg_len - 2, os.SEEK_CUR)
+
+
+def imageSizeArg(value):
+    """Parse a WIDTHxHEIGHT command line size."""
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def imageSize(img_path, buffer=None):
+    """Read the image dimensions from the file header.
+
+    Only JPEG, PNG, GIF and BMP headers are parsed, the JPEG size as
+    rotated by its Exif orientation.
+
+    Parameters
+    ----------
+    img_path : string
+        The image file path.
+    buffer : bytes-like, optional
+        The file content, read instead of the path. The default is None.
+
+    Returns
+    -------
+    tuple
+        The (width, height) of the image, None if can't be determined.
+
+    """
+    try:
+        with open(img_path, 'rb') if buffer is None \
+                else io.BytesIO(buffer) as f:
+            head = f.read(26)
+            if head[:2] == b'\xff\xd8':
+                return _jpegSize(f)
+            elif head[:8] == b'\x89PNG\r\n\x1a\n':
+                return struct.unpack('>II', head[16:24])
+            elif head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            elif head[:2] == b'BM':
+                width, height = struct.unpack('<ii', head[18:26])
+                return width, abs(height)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def reduceFactor(img_size, target_size):
+    """Get the decoding reduction which still fill the target size.
+
+    Parameters
+    ----------
+    img_size : tuple
+        The (width, height) of the image file.
+    target_size : tuple
+        The (width, height) where the image will be fitted.
+
+    Returns
+    -------
+    int
+        The reduction factor, one of 1, 2, 4 or 8.
+
+    """
+    if img_size is None or min(img_size) <= 0:
+        return 1
+    scale = min(target_size[0] / img_size[0], target_size[1] / img_size[1])
+    for factor in (8, 4, 2):
+        if factor * scale <= 1:
+            return factor
+    return 1
+
+
+def decodeImage(img_path, target_size=None, flags=REDUCED_FLAGS):
+    """Decode an image file, or a file inside a zip or tar archive.
+
+    Parameters
+    ----------
+    img_path : string
+        The image file path, inside the archive path for its members.
+    target_size : tuple, optional
+        The (width, height) to fill, decoded at full resolution if None.
+        The default is None.
+    flags : dict, optional
+        The imread flags of each reduction factor.
+        The default is REDUCED_FLAGS.
+
+    Returns
+    -------
+    numpy.ndarray
+        The decoded image, None if the file not exist or can't be read.
+
+    """
+    if os.path.isfile(img_path):
+        factor = 1
+        if target_size is not None:
+            factor = reduceFactor(imageSize(img_path), target_size)
+        return cv2.imread(img_path, flags[factor])
+
+    # decoded from the archive bytes, without extracting it
+    buffer = readMember(img_path)
+    if buffer is None:
+        return None
+    factor = 1
+    if target_size is not None:
+        factor = reduceFactor(imageSize(img_path, buffer), target_size)
+    return cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), flags[factor])
+
+
+@timers.timed('image.read')
+def readImage(img_path, target_size=None):
+    """Decode an image file.
+
+    Parameters
+    ----------
+    img_path : string
+        The image file path, or a file inside an archive.
+    target_size : tuple, optional
+        The (width, height) where the image will be displayed. If defined
+        the image is decoded at the smaller resolution which still fill
+        it, otherwise at full resolution. The default is None.
+
+    Returns
+    -------
+    numpy.ndarray
+        The decoded BGR image, None if the file not exist or can't be read.
+
+    """
+    return decodeImage(img_path, target_size)
+
+
+def readThumbnail(img_path, size=(160, 120)):
+    """Decode an image fitted into a thumbnail size.
+
+    The image is decoded at the smaller reduction which still fill the
+    size, then resized keeping the aspect ratio.
+
+    Returns
+    -------
+    numpy.ndarray
+        The BGR thumbnail, None if the file can't be read.
+
+    """
+    img = readImage(img_path, size)
+    if img is None:
+        return None
+    scale = min(size[0] / img.shape[1], size[1] / img.shape[0], 1.)
+    if scale < 1.:
+        img = cv2.resize(img, (max(int(img.shape[1] * scale), 1),
+                               max(int(img.shape[0] * scale), 1)),
+                         interpolation=cv2.INTER_AREA)
+    return img
+
+
+class ImageCache:
+    """Thread safe LRU cache of decoded images bounded by memory size."""
+
+    def __init__(self, max_bytes=512 * 1024**2):
+        """Initialize the cache.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            The memory cap for the cached images in bytes.
+            The default is 512 MB.
+
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of cached images."""
+        return len(self._images)
+
+    def __contains__(self, key):
+        """Check if an image is cached, without updating its usage."""
+        with self._lock:
+            return key in self._images
+
+    def get(self, key):
+        """Get a cached image and mark it as recently used.
+
+        Returns None and count a miss if the image is not cached.
+        """
+        with self._lock:
+            img = self._images.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key, img):
+        """Store an image, evicting the least recently used if required."""
+        if img is None or img.nbytes > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._images:
+                self.nbytes -= self._images.pop(key).nbytes
+            self._images[key] = img
+            self.nbytes += img.nbytes
+            while self.nbytes > self.max_bytes:
+                _, old = self._images.popitem(last=False)
+                self.nbytes -= old.nbytes
+        return True
+
+    def clear(self):
+        """Remove all the cached images, the counters are kept."""
+        with self._lock:
+            self._images.clear()
+            self.nbytes = 0
+
+    def info(self):
+        """Get the cache usage counters."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'images': len(self._images), 'nbytes': self.nbytes,
+                    'max_bytes': self.max_bytes}
+
+
+class ImagePrefetcher:
+    """Decode images in background threads into an ImageCache."""
+
+    def __init__(self, cache, workers=2, read_fn=readImage):
+        """Initialize the prefetcher.
+
+        Parameters
+        ----------
+        cache : ImageCache
+            The cache where the decoded images are stored.
+        workers : int, optional
+            The number of decoding threads. The default is 2.
+        read_fn : callable, optional
+            The function decoding an image, the image keys are tuples
+            of its arguments. The default is readImage.
+
+        """
+        self.cache = cache
+        self.read_fn = read_fn
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        try:
+            img = self.read_fn(*key)
+            self.cache.put(key, img)
+            return img
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def prefetch(self, keys):
+        """Schedule the decoding of the images not yet cached.
+
+        Queued images not included in keys are cancelled, so only the
+        latest neighbourhood is decoded.
+
+        Parameters
+        ----------
+        keys : list
+            The images to decode, in priority order.
+
+        """
+        keys = [k for k in keys if k not in self.cache]
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                if key not in keys and future.cancel():
+                    del self._pending[key]
+            for key in keys:
+                if key not in self._pending:
+                    self._pending[key] = self._executor.submit(
+                        self._load, key)
+
+    def get(self, key):
+        """Get an image from the cache, or decode it if required.
+
+        If the image is being prefetched waits for it instead of decoding
+        it again.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            wait([future])
+
+        img = self.cache.get(key)
+        if img is None:
+            img = self._load(key)
+        return img
+
+    @property
+    def busy(self):
+        """Check if there are images queued or decoding."""
+        with self._lock:
+            return len(self._pending) > 0
+
+    def cancel(self):
+        """Cancel all the queued images."""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+
+    def shutdown(self):
+        """Cancel the queued images and stop the threads."""
+        self.cancel()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:01:18 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QSize
+from PyQt5.QtCore import QPoint
+from PyQt5.QtGui import QImage
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtGui import QPainter
+from PyQt5.QtGui import QColor
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtWidgets import QScrollArea
+
+from timing import timers
+
+
+def toQImage(img):
+    """Wrap a decoded image buffer as QImage, without copying it.
+
+    The QImage only references the buffer, which must be kept alive
+    while the QImage is used.
+
+    Parameters
+    ----------
+    img : numpy.ndarray
+        The BGR or grayscale uint8 image, rows may be padded.
+
+    Returns
+    -------
+    PyQt5.QtGui.QImage
+        The image over the buffer memory.
+    numpy.ndarray
+        The buffer, a contiguous copy only if the rows pixels were not.
+
+    """
+    if img.ndim == 2:
+        img_format = QImage.Format_Grayscale8
+        channels = 1
+    else:
+        img_format = QImage.Format_BGR888
+        channels = 3
+    if img.dtype != np.uint8 or img.strides[-1] != 1 or \
+            img.strides[1] != channels:
+        # the pixels of a row must be contiguous
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+    return QImage(img.data, img.shape[1], img.shape[0], img.strides[0],
+                  img_format), img
+
+
+class ImageView(QWidget):
+    """Display an image with its labels drawn over.
+
+    The image is scaled once to the viewport and cached as pixmap, the
+    labels are painted as text on top, never on the image pixels.
+    """
+
+    def __init__(self, parent=None):
+        super(ImageView, self).__init__(parent)
+        self.buffer = None
+        self.qimage = None
+        self.labels = []
+        self.fit = True
+        self._scaled = None
+        self.setMinimumSize(QSize(320, 240))
+        self.labelFont = QFont()
+        self.labelFont.setPointSize(14)
+        self.labelFont.setBold(True)
+        self.labelColor = QColor(0, 0, 255)
+
+    def setImage(self, img, labels=()):
+        """Show a decoded image, None to clear the view."""
+        # the QImage references the buffer memory
+        self.qimage, self.buffer = toQImage(img) if img is not None \
+            else (None, None)
+        self.labels = list(labels)
+        self._scaled = None
+        self.updateSize()
+        self.update()
+
+    def setLabels(self, labels):
+        self.labels = list(labels)
+        self.update()
+
+    def setFit(self, fit):
+        """Fit the image to the viewport, or show it at full size."""
+        self.fit = fit
+        self._scaled = None
+        self.updateSize()
+        self.update()
+
+    def updateSize(self):
+        if self.fit or self.qimage is None:
+            self.setMinimumSize(QSize(320, 240))
+        else:
+            self.setMinimumSize(self.qimage.size())
+
+    def scaledPixmap(self):
+        """The pixmap of the image at the viewport size."""
+        if self.qimage is None:
+            return None
+        size = self.size() if self.fit else self.qimage.size()
+        if self._scaled is None or self._scaled[0] != size:
+            if self.fit:
+                qimage = self.qimage.scaled(size, Qt.KeepAspectRatio,
+                                            Qt.SmoothTransformation)
+            else:
+                qimage = self.qimage
+            self._scaled = size, QPixmap.fromImage(qimage)
+        return self._scaled[1]
+
+    @timers.timed('imageView.paint')
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        pixmap = self.scaledPixmap()
+        if pixmap is not None:
+            # centered when fitted
+            x = (self.width() - pixmap.width()) // 2 if self.fit else 0
+            y = (self.height() - pixmap.height()) // 2 if self.fit else 0
+            painter.drawPixmap(QPoint(x, y), pixmap)
+
+            # labels over the image top left corner
+            painter.setFont(self.labelFont)
+            painter.setPen(self.labelColor)
+            line_height = painter.fontMetrics().height()
+            for i, label in enumerate(self.labels):
+                painter.drawText(QPoint(x + 3, y + line_height * (i + 1)),
+                                 label)
+        painter.end()
+
+
+class ImageScrollArea(QScrollArea):
+    """An ImageView scrollable when shown at full size."""
+
+    def __init__(self, parent=None):
+        super(ImageScrollArea, self).__init__(parent)
+        self.view = ImageView(self)
+        self.setWidget(self.view)
+        self.setWidgetResizable(True)
+        self.setAlignment(Qt.AlignCenter)
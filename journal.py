@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:40:03 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import os
+import json
+import time
+
+
+class LabelJournal:
+    """Append-only journal of label changes.
+
+    Each change is a json line with [folder_path, image_id, label,
+    timestamp]. The lines are flushed to the OS on each append, so a
+    process crash lose nothing, while the fsync to disk is batched.
+    """
+
+    def __init__(self, journal_path, sync_every=32, sync_interval=1.):
+        """Initialize the journal.
+
+        Parameters
+        ----------
+        journal_path : string
+            The journal file path.
+        sync_every : int, optional
+            The number of appended changes forcing a fsync.
+            The default is 32.
+        sync_interval : float, optional
+            The seconds since the last fsync forcing a new one on append.
+            The default is 1.
+
+        """
+        self.journal_path = journal_path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.records = 0
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self._file = None
+
+    def __len__(self):
+        """Number of changes in the journal."""
+        return self.records
+
+    @property
+    def saving_path(self):
+        """The journal set aside while its changes are being saved."""
+        return self.journal_path + '.saving'
+
+    def exists(self):
+        """Check if there is a journal file."""
+        return os.path.isfile(self.journal_path)
+
+    def rotate(self):
+        """Set the changes aside, the next ones start a new journal.
+
+        The changes set aside are replayed until released, once they are
+        in the csv. If a previous save failed they are kept in order.
+        """
+        self.close()
+        if self.exists():
+            if os.path.isfile(self.saving_path):
+                with open(self.saving_path, 'a') as saving, \
+                        open(self.journal_path) as f:
+                    saving.write(f.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.saving_path)
+        self.records = 0
+
+    def release(self):
+        """Remove the changes set aside, they are in the csv now."""
+        if os.path.isfile(self.saving_path):
+            os.remove(self.saving_path)
+
+    def append(self, key, label):
+        """Write a label change.
+
+        Parameters
+        ----------
+        key : tuple
+            The (folder_path, image_id) of the row.
+        label : string or list
+            The new label of the row.
+
+        """
+        if self._file is None:
+            self._open()
+        record = [key[0], key[1], label, time.time()]
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self.records += 1
+        self.pending += 1
+
+        if (self.pending >= self.sync_every
+           or time.monotonic() - self.last_sync >= self.sync_interval):
+            self.sync()
+
+    def extend(self, changes):
+        """Write many label changes at once, with a single fsync.
+
+        Parameters
+        ----------
+        changes : iterable
+            The (key, label) of each change, as in append.
+
+        """
+        if self._file is None:
+            self._open()
+        # the same lines as append, each folder and label encoded once
+        labels = {}
+        folders = {}
+        lines = []
+        suffix = ', {}]\n'.format(json.dumps(time.time()))
+        for (folder_path, image_id), label in changes:
+            label_key = label if isinstance(label, str) else tuple(label)
+            label_json = labels.get(label_key)
+            if label_json is None:
+                label_json = labels[label_key] = ', ' + json.dumps(label) + \
+                    suffix
+            folder_json = folders.get(folder_path)
+            if folder_json is None:
+                folder_json = folders[folder_path] = '[' + \
+                    json.dumps(folder_path) + ', '
+            lines.append(folder_json + json.dumps(image_id) + label_json)
+        if len(lines) == 0:
+            return
+        self._file.write(''.join(lines))
+        self._file.flush()
+        self.records += len(lines)
+        self.pending += len(lines)
+        self.sync()
+
+    def _open(self):
+        # terminate a line truncated by a crash
+        truncated = False
+        if self.exists() and os.path.getsize(self.journal_path) > 0:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                truncated = f.read(1) != b'\n'
+        self._file = open(self.journal_path, 'a')
+        if truncated:
+            self._file.write('\n')
+
+    def sync(self):
+        """Fsync the appended changes, if any."""
+        if self._file is not None and self.pending > 0:
+            os.fsync(self._file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def replay(self):
+        """Read the journal changes in order.
+
+        Truncated lines, from a crash while writing, are ignored.
+
+        Returns
+        -------
+        list
+            The ((folder_path, image_id), label, timestamp) changes.
+
+        """
+        changes = []
+        # the changes of an unfinished save first
+        for path in (self.saving_path, self.journal_path):
+            if not os.path.isfile(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        folder_path, image_id, label, ts = json.loads(line)
+                    except ValueError:
+                        continue
+                    changes.append(((folder_path, image_id), label, ts))
+        self.records = len(changes)
+        return changes
+
+    def close(self):
+        """Sync and close the journal file."""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """Remove the journal, once its changes are in the csv."""
+        self.close()
+        if self.exists():
+            os.remove(self.journal_path)
+        self.release()
+        self.records = 0
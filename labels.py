@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:27 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import ast
+from collections import Counter
+import numpy as np
+from lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+
+UNSET = 'unset'
+# labels identifiers as stored, and its display names
+LABELS_ID = ['bom', 'maisoumenos', 'ruim',
+             'empty-hand', 'falso', 'not-sure', 'cropped-gun',
+             'handgun', 'rifle', 'shotgun',
+             'smartphone', 'wallet', 'card', 'money']
+LABELS_NAME = ['Bom', '+ ou -', 'Ruim',
+               'Empty Hand', 'Falso', 'Not sure', 'Cropped Gun',
+               'Handgun', 'Rifle', 'Shotgun',
+               'Smartphone', 'Wallet', 'Card', 'Money']
+
+
+class LabelCodec:
+    """Encode label sets as integer bitmasks over a fixed labels list.
+
+    The bit i of a mask is set if the labels_id[i] label is present. The
+    'unset' label is the empty mask, single labels decode as a string and
+    multiple labels as a list in the labels_id order, as written by the
+    labeler.
+    """
+
+    def __init__(self, labels_id):
+        """Initialize the codec.
+
+        Parameters
+        ----------
+        labels_id : list
+            The labels identifiers, up to 64.
+
+        """
+        if len(labels_id) > 64:
+            raise ValueError('Up to 64 labels can be encoded as bitmask')
+        self.labels_id = list(labels_id)
+        self.index = {label: i for i, label in enumerate(self.labels_id)}
+
+        if len(self.labels_id) <= 16:
+            self.dtype = np.uint16
+        elif len(self.labels_id) <= 32:
+            self.dtype = np.uint32
+        else:
+            self.dtype = np.uint64
+
+    def __len__(self):
+        """Number of labels."""
+        return len(self.labels_id)
+
+    @staticmethod
+    def toList(label):
+        """Get the labels of a stored label value as list."""
+        if isinstance(label, str) and '[' in label:
+            label = ast.literal_eval(label)
+        if isinstance(label, list):
+            return label
+        if label == UNSET:
+            return []
+        return [label]
+
+    def encode(self, label):
+        """Encode a label value, stringified list or list into a bitmask."""
+        mask = 0
+        for lbl in self.toList(label):
+            if lbl not in self.index:
+                raise ValueError("Unknown label '{}'".format(lbl))
+            mask |= 1 << self.index[lbl]
+        return mask
+
+    def decode(self, mask):
+        """Decode a bitmask into 'unset', a single label or a labels list."""
+        mask = int(mask)
+        labels = [lbl for i, lbl in enumerate(self.labels_id)
+                  if mask >> i & 1]
+        if len(labels) == 0:
+            return UNSET
+        elif len(labels) == 1:
+            return labels[0]
+        return labels
+
+    def encodeColumn(self, column):
+        """Encode a column of stored label values into a bitmasks array.
+
+        Only the distinct values are parsed.
+        """
+        codes, uniques = pd.factorize(pd.Series(column), sort=False)
+        masks = np.array([self.encode(u) for u in uniques], dtype=self.dtype)
+        return masks[codes]
+
+    def decodeColumn(self, masks):
+        """Decode a bitmasks array into stored label values.
+
+        The lists are stringified as they are written into the csv.
+        """
+        uniques, inverse = np.unique(masks, return_inverse=True)
+        values = [self.decode(m) for m in uniques]
+        values = np.array([str(v) if isinstance(v, list) else v
+                           for v in values], dtype=object)
+        return values[inverse]
+
+    def maskOf(self, labels):
+        """Get the bitmask of a labels list."""
+        return self.encode(list(labels))
+
+    def hasAny(self, masks, labels):
+        """Boolean array of the masks with any of the labels."""
+        return (masks & self.dtype(self.maskOf(labels))) != 0
+
+    def hasAll(self, masks, labels):
+        """Boolean array of the masks with all the labels."""
+        mask = self.dtype(self.maskOf(labels))
+        return (masks & mask) == mask
+
+    def counts(self, masks):
+        """Number of masks having each label, in the labels_id order."""
+        return [int(np.count_nonzero(masks & self.dtype(1 << i)))
+                for i in range(len(self.labels_id))]
+
+    def combinations(self, masks):
+        """Count of each distinct label set as (label value, count) pairs."""
+        uniques, counts = np.unique(masks, return_counts=True)
+        return [(self.decode(m), int(c)) for m, c in zip(uniques, counts)]
+
+
+class LabelStats:
+    """Label counters updated on each label change.
+
+    Keeps the count of each label combination, of each single label and of
+    the labels by folder_path. The label values are the stored ones, both
+    strings and bitmasks, parsed once per distinct value.
+    """
+
+    def __init__(self, parse_fn=LabelCodec.toList):
+        """Initialize the counters.
+
+        Parameters
+        ----------
+        parse_fn : callable, optional
+            Function getting the labels list of a stored label value.
+            The default is LabelCodec.toList.
+
+        """
+        self.parse_fn = parse_fn
+        self.total = 0
+        self.unset = 0
+        self.combinations = Counter()
+        self.labels = Counter()
+        self.folders = {}
+        self._parsed = {}
+
+    def parse(self, value):
+        """Get the labels tuple of a stored value, cached by value."""
+        labels = self._parsed.get(value)
+        if labels is None:
+            labels = tuple(self.parse_fn(value))
+            self._parsed[value] = labels
+        return labels
+
+    def add(self, folder, value, count=1):
+        """Count rows of a folder with a label value, negative to remove."""
+        labels = self.parse(value)
+        self.total += count
+        if len(labels) == 0:
+            self.unset += count
+        self.combinations[labels] += count
+        folder_counter = self.folders.setdefault(folder, Counter())
+        folder_counter[None] += count
+        for lbl in labels:
+            self.labels[lbl] += count
+            folder_counter[lbl] += count
+        if len(labels) == 0:
+            folder_counter[UNSET] += count
+
+    def update(self, folder, old_value, new_value):
+        """Move a row from its old label value to the new one."""
+        self.add(folder, old_value, -1)
+        self.add(folder, new_value, 1)
+
+    @property
+    def labeled(self):
+        """Number of rows with any label."""
+        return self.total - self.unset
+
+    def byCombination(self):
+        """Count of each label combination as (label value, count) pairs.
+
+        Single labels are strings and multiple ones lists, as returned by
+        get_stats.
+        """
+        stats = []
+        for labels, count in self.combinations.items():
+            if count == 0:
+                continue
+            if len(labels) == 0:
+                key = UNSET
+            elif len(labels) == 1:
+                key = labels[0]
+            else:
+                key = list(labels)
+            stats.append((key, count))
+        # by first label, then the most frequent first
+        stats.sort(key=lambda x: (x[0][0] if type(x[0]) is list else x[0],
+                                  -x[1], str(x[0])))
+        return stats
+
+    def byFolder(self):
+        """Rows and labeled rows of each folder as (folder, total, labeled)."""
+        return sorted((folder, c[None], c[None] - c[UNSET])
+                      for folder, c in self.folders.items() if c[None] > 0)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 03:05:37 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import sys
+import importlib
+import threading
+
+
+class LazyModule:
+    """A module imported on the first access to its attributes.
+
+    Bound at the module level as the plain import would be, so pandas
+    and cv2 are not imported until a dataset or an image is used.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return '<lazy module {!r}{}>'.format(
+            self._name, '' if isLoaded(self._name) else ' (not loaded)')
+
+
+def isLoaded(name):
+    """Check if a module was imported."""
+    return name in sys.modules
+
+
+def preload(*names):
+    """Import the modules on a background thread.
+
+    Returns
+    -------
+    threading.Thread
+        The started daemon thread.
+
+    """
+    def importAll():
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                print('Preload of {} failed:'.format(name), e)
+
+    thread = threading.Thread(target=importAll, name='preload', daemon=True)
+    thread.start()
+    return thread
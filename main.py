@@ -8,9 +8,13 @@ Created on Fri Jun 26 00:14:34 2020
 
 import os
 import sys
-import cv2
 import ast
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import QMainWindow
@@ -24,12 +28,35 @@ from PyQt5.QtWidgets import QVBoxLayout
 from PyQt5.QtWidgets import QWidget
 from PyQt5.QtWidgets import QPushButton
 from PyQt5.QtWidgets import QFileDialog
-from PyQt5.QtWidgets import QListWidget
+from PyQt5.QtWidgets import QInputDialog
+from PyQt5.QtWidgets import QListView
 from PyQt5.QtWidgets import QShortcut
+from PyQt5.QtWidgets import QComboBox
+from PyQt5.QtWidgets import QSplitter
 
 from handlers import DataHandler
+from labels import LABELS_ID
+from labels import LABELS_NAME
+from sqlite_handler import SqliteDataHandler
+from sqlite_handler import SQLITE_EXTENSIONS
+from sessions import SharedDataHandler
+from models import DataListModel
+from navigation import NavigationIndex
+from duplicates import clusterImages
+from timing import timers
+from lazy import preload
+from grid import ThumbnailGrid
+from thumbstore import buildThumbnails
+from scoring import scoreImages
+from scoring import imagePaths
+from imageview import ImageScrollArea
+from images import ImageCache
+from images import ImagePrefetcher
+from saver import BackgroundSaver
 from dialogs import CsvNameDialog
 from dialogs import MessageDialog
+from dialogs import StatsDialog
+from dialogs import TimingDialog
 
 
 class LabelerWindow(QMainWindow):
@@ -41,18 +68,42 @@ class LabelerWindow(QMainWindow):
         self.current = -1
         self.isLabeling = False
         self.changesSaved = True
+        self.navIndex = None
+        self.duplicates = None
+        self.scores = None
+        self.grid = None
         
         # labels
         self.labels = []
-        self.labels_id = ['bom', 'maisoumenos', 'ruim',
-                          'empty-hand', 'falso', 'not-sure', 'cropped-gun',
-                          'handgun', 'rifle', 'shotgun', 
-                          'smartphone', 'wallet', 'card', 'money']
-        self.labels_name = ['Bom', '+ ou -', 'Ruim',
-                            'Empty Hand', 'Falso', 'Not sure', 'Cropped Gun',
-                            'Handgun', 'Rifle', 'Shotgun', 
-                            'Smartphone', 'Wallet', 'Card', 'Money']
+        self.labels_id = list(LABELS_ID)
+        self.labels_name = list(LABELS_NAME)
         self.labels_default = [1, 4] #none
+        self.labels_idx = {l: i for i, l in enumerate(self.labels_id)}
+        
+        # images decoding
+        self.direction = 1
+        self.zoomed = False
+        self.screen_res = 800, 600
+        self.prefetch_ahead = 8
+        self.prefetch_behind = 2
+        self.imageCache = ImageCache(max_bytes=512 * 1024**2)
+        self.prefetcher = ImagePrefetcher(self.imageCache, workers=2)
+        # the packed thumbnails are written in background
+        self.thumbsBuilder = ThreadPoolExecutor(max_workers=1)
+        self.thumbsStop = threading.Event()
+        # the csv is written in background
+        self.saver = BackgroundSaver()
+        # the near duplicates are hashed in background
+        self.hashRunner = ThreadPoolExecutor(max_workers=1)
+        self.hashStop = threading.Event()
+        self.hashFuture = None
+        self.hashProgress = 0.
+        # the pre-labeling scores are computed in background
+        self.scorer_spec = os.environ.get('LABELER_SCORER', '')
+        self.scoreRunner = ThreadPoolExecutor(max_workers=1)
+        self.scoreStop = threading.Event()
+        self.scoreFuture = None
+        self.scoreProgress = 0.
         
         self.setWindowTitle("Simple Labeler")        
         # self.setApplicationDisplayName('Simple Labeler')
@@ -62,8 +113,15 @@ class LabelerWindow(QMainWindow):
         self.mainWidget = QWidget(self)        
         self.mainLayout = QVBoxLayout()
         self.mainWidget.setLayout(self.mainLayout)        
-        self.setCentralWidget(self.mainWidget)
-        self.resize(450, 550)
+        
+        # the image next to the labels
+        self.imageArea = ImageScrollArea(self)
+        splitter = QSplitter(Qt.Horizontal, self)
+        splitter.addWidget(self.mainWidget)
+        splitter.addWidget(self.imageArea)
+        splitter.setStretchFactor(1, 1)
+        self.setCentralWidget(splitter)
+        self.resize(1250, 650)
                 
         label = QLabel("Labels")
         label.setAlignment(Qt.AlignCenter)
@@ -75,10 +133,12 @@ class LabelerWindow(QMainWindow):
         self.imagesInfo.setAlignment(Qt.AlignCenter)
         self.mainLayout.addWidget(self.imagesInfo)
         
+        self.embedFilters()
         self.embedList()
         
         self.embedButtons()
         self.embedShortcuts()
+        self.embedTimers()
         
     @property
     def haveLabels(self):
@@ -94,10 +154,36 @@ class LabelerWindow(QMainWindow):
         
     def embedList(self):
         
-        self.listWidget = QListWidget(self.mainWidget)
-        self.listWidget.itemSelectionChanged.connect(self.onSelectItem)
+        self.listModel = DataListModel(self.row2text, self)
+        self.listView = QListView(self.mainWidget)
+        # same height rows, avoid the view asking the text of every row
+        self.listView.setUniformItemSizes(True)
+        self.listView.setModel(self.listModel)
+        self.listView.selectionModel().currentChanged.connect(
+            self.onSelectItem)
+        
+        self.mainLayout.addWidget(self.listView)
+        
+    def embedFilters(self):
+        # show only the images with a label and in a folder
+        layout = QHBoxLayout()
+        
+        self.labelFilter = QComboBox(self.mainWidget)
+        self.labelFilter.setStatusTip("Show only the images with a label")
+        self.labelFilter.addItem("All labels", None)
+        self.labelFilter.addItem("Unset", 'unset')
+        for label_id, label_name in zip(self.labels_id, self.labels_name):
+            self.labelFilter.addItem(label_name, label_id)
+        self.labelFilter.currentIndexChanged.connect(self.onFilterChanged)
+        layout.addWidget(self.labelFilter)
         
-        self.mainLayout.addWidget(self.listWidget)
+        self.folderFilter = QComboBox(self.mainWidget)
+        self.folderFilter.setStatusTip("Show only the images of a folder")
+        self.folderFilter.addItem("All folders", None)
+        self.folderFilter.currentIndexChanged.connect(self.onFilterChanged)
+        layout.addWidget(self.folderFilter)
+        
+        self.mainLayout.addLayout(layout)
         
     def embedButtons(self):   
         # image navigation buttons
@@ -135,6 +221,17 @@ class LabelerWindow(QMainWindow):
         button_action.triggered.connect(self.onCreateCsv)
         toolbar.addAction(button_action)
         
+        button_action = QAction("Generate CSV from archive", self)
+        button_action.setStatusTip("Choose a zip or tar file with the images, read without extracting it")
+        button_action.triggered.connect(self.onCreateFromArchive)
+        toolbar.addAction(button_action)
+        
+        # refresh
+        button_action = QAction("Refresh", self)
+        button_action.setStatusTip("Sync the dataset with the images added or removed from its folder")
+        button_action.triggered.connect(self.onRefreshCsv)
+        toolbar.addAction(button_action)
+        
         toolbar.addSeparator()
         
         # stats
@@ -143,6 +240,79 @@ class LabelerWindow(QMainWindow):
         button_action.triggered.connect(self.onShowStats)
         toolbar.addAction(button_action)
         
+        # navigation timings
+        self.timingAction = QAction("Timing", self)
+        self.timingAction.setStatusTip("Record the latency of each navigation stage")
+        self.timingAction.setCheckable(True)
+        self.timingAction.setChecked(timers.enabled)
+        self.timingAction.toggled.connect(self.onToggleTiming)
+        toolbar.addAction(self.timingAction)
+        
+        button_action = QAction("Show timings", self)
+        button_action.setStatusTip("Show the latency percentiles of each navigation stage")
+        button_action.triggered.connect(self.onShowTimings)
+        toolbar.addAction(button_action)
+        
+        toolbar.addSeparator()
+        
+        # many images per screen
+        button_action = QAction("Thumbnails", self)
+        button_action.setStatusTip("Label a page of thumbnails at once")
+        button_action.triggered.connect(self.onShowGrid)
+        toolbar.addAction(button_action)
+        
+        toolbar.addSeparator()
+        
+        # near duplicates
+        button_action = QAction("Find duplicates", self)
+        button_action.setStatusTip("Cluster the near duplicate images by its perceptual hash")
+        button_action.triggered.connect(self.onFindDuplicates)
+        toolbar.addAction(button_action)
+        
+        self.labelDuplicatesAction = QAction("Label duplicates", self)
+        self.labelDuplicatesAction.setStatusTip("Apply the labels to the whole duplicates cluster")
+        self.labelDuplicatesAction.setCheckable(True)
+        toolbar.addAction(self.labelDuplicatesAction)
+        
+        self.collapseAction = QAction("Collapse duplicates", self)
+        self.collapseAction.setStatusTip("Show one image per duplicates cluster, labeling the whole cluster")
+        self.collapseAction.setCheckable(True)
+        self.collapseAction.toggled.connect(self.onFilterChanged)
+        toolbar.addAction(self.collapseAction)
+        
+        toolbar.addSeparator()
+        
+        # pre-labeling
+        button_action = QAction("Score images", self)
+        button_action.setStatusTip("Score the labels of each image with a scorer plugin")
+        button_action.triggered.connect(self.onScoreImages)
+        toolbar.addAction(button_action)
+        
+        self.uncertainAction = QAction("Uncertain first", self)
+        self.uncertainAction.setStatusTip("Show the images by its labels uncertainty, the most uncertain first")
+        self.uncertainAction.setCheckable(True)
+        self.uncertainAction.toggled.connect(self.onFilterChanged)
+        toolbar.addAction(self.uncertainAction)
+        
+        self.suggestAction = QAction("Suggest labels", self)
+        self.suggestAction.setStatusTip("Pre-check the labels scored over 0.5 of the unset images, stored as its labels when leaving the image")
+        self.suggestAction.setCheckable(True)
+        toolbar.addAction(self.suggestAction)
+        
+        toolbar.addSeparator()
+        
+        # many annotators
+        self.sharedAction = QAction("Shared", self)
+        self.sharedAction.setStatusTip("Label the CSV together with other sessions, each one on its own rows")
+        self.sharedAction.setCheckable(True)
+        self.sharedAction.toggled.connect(self.onToggleShared)
+        toolbar.addAction(self.sharedAction)
+        
+        button_action = QAction("Next rows", self)
+        button_action.setStatusTip("Give back the labeled rows and take the next ones")
+        button_action.triggered.connect(self.onNextShard)
+        toolbar.addAction(button_action)
+        
         toolbar.addSeparator()
         
         # write
@@ -151,9 +321,19 @@ class LabelerWindow(QMainWindow):
         button_action.triggered.connect(self.onSaveCsv)
         toolbar.addAction(button_action)
         
+        self.autosaveAction = QAction("Autosave", self)
+        self.autosaveAction.setStatusTip("Save the changes every 5 minutes")
+        # optional, off unless checked
+        self.autosaveAction.setCheckable(True)
+        self.autosaveAction.toggled.connect(self.onToggleAutosave)
+        toolbar.addAction(self.autosaveAction)
+        
         toolbar.addSeparator()
                 
         self.setStatusBar(QStatusBar(self))
+        # labeling progress
+        self.progressInfo = QLabel("")
+        self.statusBar().addPermanentWidget(self.progressInfo)
         
         
     def embedCheckBox(self):
@@ -176,21 +356,112 @@ class LabelerWindow(QMainWindow):
         
         self.mainLayout.addLayout(layout)
 
-    def embedShortcuts(self):
-        shortcuts = [("Q", self.labelBomCropped),
-                    ("W", self.labelBomHandgun),
-                    ("E", self.labelBomEmpty),
-                    ("F", self.label2Falso),
-                    ("R", self.label2Ruim),
-                    ("V", self.label2SoSo),
-                    ("H", self.labelRepeat),
-                    ("B", self.labelUnset)]
+    def labelPresets(self):
+        return [("Q", self.labelBomCropped),
+                ("W", self.labelBomHandgun),
+                ("E", self.labelBomEmpty),
+                ("F", self.label2Falso),
+                ("R", self.label2Ruim),
+                ("V", self.label2SoSo),
+                ("H", self.labelRepeat),
+                ("B", self.labelUnset)]
 
-        for sh_key, sh_fn in shortcuts:
+    def embedShortcuts(self):
+        for sh_key, sh_fn in self.labelPresets():
             sh = QShortcut(sh_key, self.mainWidget)
             sh.activated.connect(sh_fn)
             sh.activated.connect(self.refreshCheckboxes)
             sh.activated.connect(self.setLastLabel)
+        
+        # full resolution image
+        sh = QShortcut("Z", self.mainWidget)
+        sh.activated.connect(self.onZoomImage)
+        
+        # jump to the next unset, or next image with the filter label
+        sh = QShortcut("N", self.mainWidget)
+        sh.activated.connect(self.onNextUnset)
+        sh = QShortcut("J", self.mainWidget)
+        sh.activated.connect(self.onNextMatch)
+
+    def embedTimers(self):
+        # fsync the pending journal changes
+        self.syncTimer = QTimer(self)
+        self.syncTimer.timeout.connect(self.onSyncJournal)
+        self.syncTimer.start(1000)
+        
+        # save the changes, folding the journal into the csv
+        self.autosaveTimer = QTimer(self)
+        self.autosaveTimer.timeout.connect(self.onAutosave)
+        
+        # background save progress
+        self.saveTimer = QTimer(self)
+        self.saveTimer.timeout.connect(self.onSaveProgress)
+        
+        # background hashing progress
+        self.hashTimer = QTimer(self)
+        self.hashTimer.timeout.connect(self.onHashProgress)
+        
+        # background scoring progress
+        self.scoreTimer = QTimer(self)
+        self.scoreTimer.timeout.connect(self.onScoreProgress)
+        
+        # renew the leased rows and take the other sessions labels
+        self.sessionTimer = QTimer(self)
+        self.sessionTimer.timeout.connect(self.onSyncSession)
+        self.sessionTimer.start(5000)
+
+    def onSyncJournal(self):
+        if self.isLabeling and self.data.journal is not None:
+            self.data.journal.sync()
+
+    def onToggleAutosave(self, checked):
+        if checked:
+            self.autosaveTimer.start(5 * 60 * 1000)
+        else:
+            self.autosaveTimer.stop()
+
+    def onAutosave(self):
+        if not self.isLabeling or self.saver.saving:
+            return
+        if self.isShared:
+            # merged only by the last session labeling
+            self.data.compact()
+        elif not self.changesSaved:
+            self.saveData()
+
+    def saveData(self):
+        # the labels are copied now, written in background
+        self.changesSaved = True
+        self.saver.save(self.data)
+        self.statusBar().showMessage("Saving {}".format(self.data.csv_file))
+        self.saveTimer.start(100)
+
+    def onSaveProgress(self):
+        error = self.saver.takeError() if self.saver.poll() else None
+        if error is not None:
+            self.changesSaved = False
+            self.statusBar().showMessage("Not saved: {}".format(error), 5000)
+        if self.saver.saving:
+            if error is None:
+                self.statusBar().showMessage("Saving {} {:.0%}".format(
+                    self.data.csv_file, self.saver.progress))
+        else:
+            self.saveTimer.stop()
+            if error is None:
+                self.statusBar().showMessage("Saved", 2000)
+
+    def onSyncSession(self):
+        if not self.isShared:
+            return
+        lost = self.data.renew()
+        for row, prev_label, label in self.data.pull():
+            self.navIndex.update(row, prev_label, label)
+            self.listModel.updateRow(row)
+        if len(lost) > 0:
+            self.statusBar().showMessage(
+                "The leased rows expired, labeling other rows", 5000)
+            self.applyFilter()
+        self.updateProgress()
 
     def setLastLabel(self):
         self.labels_default = self.labels
@@ -231,16 +502,26 @@ class LabelerWindow(QMainWindow):
         self.labelResetSGM()
         self.labels.append(1)
 
+    def dataHandler(self, filepath, archive=None):
+        # the storage backend by file extension
+        if os.path.splitext(filepath)[1].lower() in SQLITE_EXTENSIONS:
+            return SqliteDataHandler(filepath, self.labels_id, archive=archive)
+        if self.sharedAction.isChecked():
+            return SharedDataHandler(filepath, self.labels_id, archive=archive)
+        return DataHandler(filepath, self.labels_id, use_journal=True,
+                           archive=archive)
+
     def onImportCsv(self, s):
         dialog = QFileDialog.getOpenFileName(self, 'Open file', '',
-                                                    "CSV files (*.csv)")
+                                             "CSV files (*.csv);;"
+                                             "SQLite files (*.db *.sqlite *.sqlite3)")
         
         if os.path.isfile(dialog[0]):
             # reset if was labeling
             if self.isLabeling:
                 self.stopLabeling()
             # load data
-            self.data = DataHandler(dialog[0])
+            self.data = self.dataHandler(dialog[0])
             # start labeling
             self.startLabeling()
             
@@ -251,12 +532,24 @@ class LabelerWindow(QMainWindow):
         # if there is no folder, do nothing
         if not os.path.isdir(main_folder):
             return False
+        return self.createCsv(main_folder)
+        
+    def onCreateFromArchive(self, s):
+        dialog = QFileDialog.getOpenFileName(self, 'Open archive', '',
+                                             "Archives (*.zip *.tar)")
+        
+        # if there is no archive, do nothing
+        if not os.path.isfile(dialog[0]):
+            return False
+        # the csv next to the archive
+        return self.createCsv(os.path.dirname(dialog[0]), dialog[0])
         
+    def createCsv(self, main_folder, archive=None):
         optDialog = CsvNameDialog()
         
         # get desired filename and if images are organized from user
         if optDialog.exec_() == CsvNameDialog.Accepted:
-            filename, have_labels = optDialog.getValues()
+            filename, have_labels, as_mask = optDialog.getValues()
         else:
             # if cancel, do nothing
             return False
@@ -266,8 +559,20 @@ class LabelerWindow(QMainWindow):
             self.stopLabeling()
         
         # initialize data handler
-        self.data = DataHandler(os.path.join(main_folder, filename))
-        self.data.create(have_labels)
+        self.data = self.dataHandler(os.path.join(main_folder, filename),
+                                     archive)
+        try:
+            self.data.create(have_labels)
+        except ValueError as e:
+            MessageDialog('Archive not supported', str(e)).exec_()
+            self.data = None
+            return False
+        if as_mask:
+            try:
+                self.data.toMask()
+            except ValueError as e:
+                MessageDialog('Labels as bitmask', 
+                              'Labels kept as text: {}'.format(e)).exec_()
                 
         if len(self.data) > 0:
             message = "{} images found, save to file?".format(len(self.data))
@@ -283,38 +588,408 @@ class LabelerWindow(QMainWindow):
             self.data.save()
             # start labeling
             self.startLabeling()
-        else:
-            self.data = None
+            self.updateThumbnails()
+            return True
+        self.data = None
+        return False
+
+    @property
+    def isShared(self):
+        return self.isLabeling and isinstance(self.data, SharedDataHandler)
+    
+    def onToggleShared(self, checked):
+        if not self.isLabeling or self.isShared == checked:
+            return False
+        # reopen the same csv
+        filepath = os.path.join(self.data.root_path, self.data.csv_file)
+        if os.path.splitext(filepath)[1].lower() in SQLITE_EXTENSIONS:
+            return False
+        self.stopLabeling()
+        self.data = self.dataHandler(filepath)
+        self.startLabeling()
+        return True
+    
+    def onNextShard(self):
+        if not self.isShared:
+            return False
+        if self.current > -1:
+            self.processLabels()
+        if self.data.nextShard() is None:
+            self.statusBar().showMessage("All the rows are leased", 2000)
+        self.applyFilter()
+        return True
+        
+    def onRefreshCsv(self, s):
+        if not self.isLabeling:
+            return False
+        if self.isShared:
+            # the rows positions are shared with the other sessions
+            self.statusBar().showMessage("Refresh is not available while shared", 2000)
+            return False
+        
+        # keep the current image labels
+        self.processLabels()
+        try:
+            added, removed = self.data.refresh()
+        except ValueError as e:
+            # the data is kept as before the refresh
+            self.statusBar().showMessage("Not refreshed: {}".format(e), 5000)
+            return False
+        if added + removed == 0:
+            return True
+        
+        self.changesSaved = False
+        if added > 0:
+            self.updateThumbnails()
+        row = min(self.current, len(self.data) -1)
+        self.current = -1
+        self.populateList()
+        self.resetScores()
+        self.buildNavIndex()
+        self.resetDuplicates()
+        self.setCurrentRow(row)
+        return True
 
     def onShowStats(self):
+        if not self.isLabeling:
+            return False
+        
         stats = self.data.get_stats()
-        stats_str = ""
+        stats_str = "Labels combinations\n"
         for key, val in stats:
             key = '_'.join(key) if type(key) is list else key
             stats_str += f"{key} = {val}\n"
+        
+        # counters kept by the data handler
+        counters = self.data.stats
+        stats_str += "\nLabels\n"
+        for label in self.labels_id:
+            stats_str += f"{label} = {counters.labels[label]}\n"
+        stats_str += "\nFolders (labeled / total)\n"
+        for folder, total, labeled in counters.byFolder():
+            stats_str += f"{folder} = {labeled} / {total}\n"
+        
+        cache = self.imageCache.info()
+        stats_str += "\nImage cache: {} hits, {} misses, {:.1f} MB\n".format(
+            cache['hits'], cache['misses'], cache['nbytes'] / 1024**2)
+
+        dlg = StatsDialog('Label stats', stats_str)
+        dlg.exec_()
 
-        dlg = MessageDialog('Label stats', stats_str)
+    def updateThumbnails(self):
+        # only one session writes the packed thumbnails
+        if not self.isLabeling or self.isShared:
+            return False
+        self.thumbsStop.clear()
+        # the paths are read here, the handler is not shared with the thread
+        future = self.thumbsBuilder.submit(
+            buildThumbnails, self.data.imagePaths(), self.data.thumbs_file,
+            self.data.images_root, stop_event=self.thumbsStop)
+        future.add_done_callback(self.onThumbnailsBuilt)
+        return True
+    
+    def onThumbnailsBuilt(self, future):
+        # from the builder thread, the grid reloads the store by itself
+        if not future.cancelled() and future.exception() is not None:
+            print('Error!', 'thumbnails not stored:', future.exception())
+    
+    def onShowGrid(self):
+        if not self.isLabeling:
+            return False
+        if self.grid is None:
+            self.grid = ThumbnailGrid(self)
+        if not os.path.isfile(self.data.thumbs_file):
+            self.updateThumbnails()
+        self.grid.show()
+        self.grid.raise_()
+        return True
+        
+    def onToggleTiming(self, checked):
+        timers.enabled = checked
+        
+    def onShowTimings(self):
+        dlg = TimingDialog('Navigation timings', timers)
         dlg.exec_()
 
+    def onFindDuplicates(self):
+        if not self.isLabeling:
+            return False
+        
+        if self.hashFuture is not None:
+            self.statusBar().showMessage("Already hashing", 2000)
+            return False
+        
+        # the paths are read here, the handler is not shared with the thread
+        self.hashStop = threading.Event()
+        self.hashProgress = 0.
+        paths = [os.path.join(self.data.images_root, path)
+                 for path in self.data.imagePaths()]
+        self.hashFuture = self.hashRunner.submit(
+            clusterImages, paths, self.data.hashes_file,
+            stop_event=self.hashStop, progress=self.setHashProgress)
+        self.hashTimer.start(500)
+        return True
+    
+    def setHashProgress(self, fraction):
+        # from the hashing thread
+        self.hashProgress = fraction
+        
+    def onHashProgress(self):
+        future = self.hashFuture
+        if future is None:
+            self.hashTimer.stop()
+            return
+        if not future.done():
+            self.statusBar().showMessage("Hashing images {:.0%}".format(self.hashProgress))
+            return
+        self.hashTimer.stop()
+        self.hashFuture = None
+        if future.exception() is not None:
+            print('Error!', 'images not hashed:', future.exception())
+            self.statusBar().showMessage("Not hashed: {}".format(future.exception()), 5000)
+            return
+        clusters = future.result()
+        if clusters is None or not self.isLabeling:
+            return
+        self.duplicates = clusters
+        self.statusBar().showMessage(
+            "{} duplicate clusters, {} duplicate images".format(
+                len(self.duplicates), self.duplicates.n_duplicates), 5000)
+        if self.collapseAction.isChecked():
+            self.applyFilter()
+        
+    def resetDuplicates(self):
+        # the running hashing is of the previous rows, its result is dropped
+        self.hashStop.set()
+        self.hashFuture = None
+        self.duplicates = None
+        self.collapseAction.blockSignals(True)
+        self.collapseAction.setChecked(False)
+        self.collapseAction.blockSignals(False)
+        
+    @property
+    def isCollapsed(self):
+        return self.duplicates is not None and self.collapseAction.isChecked()
+        
+    def onScoreImages(self):
+        if not self.isLabeling:
+            return False
+        if self.scoreFuture is not None:
+            self.statusBar().showMessage("Already scoring", 2000)
+            return False
+        spec, ok = QInputDialog.getText(
+            self, "Score images", "Scorer (module:attribute or file.py:attribute)",
+            text=self.scorer_spec)
+        if not ok or not spec.strip():
+            return False
+        self.scorer_spec = spec.strip()
+        
+        # the paths are read here, the handler is not shared with the thread
+        # each scoring stops by its own event, once reset
+        self.scoreStop = threading.Event()
+        self.scoreProgress = 0.
+        self.scoreFuture = self.scoreRunner.submit(
+            scoreImages, imagePaths(self.data), self.data.scores_file,
+            self.scorer_spec, self.labels_id, stop_event=self.scoreStop,
+            progress=self.setScoreProgress)
+        self.scoreTimer.start(500)
+        return True
+    
+    def setScoreProgress(self, fraction):
+        # from the scoring thread
+        self.scoreProgress = fraction
+        
+    def onScoreProgress(self):
+        future = self.scoreFuture
+        if future is None:
+            self.scoreTimer.stop()
+            return
+        if not future.done():
+            self.statusBar().showMessage("Scoring {:.0%}".format(self.scoreProgress))
+            return
+        self.scoreTimer.stop()
+        self.scoreFuture = None
+        if future.exception() is not None:
+            print('Error!', 'images not scored:', future.exception())
+            self.statusBar().showMessage("Not scored: {}".format(future.exception()), 5000)
+            return
+        scores = future.result()
+        if not self.isLabeling or len(scores) != len(self.data):
+            # the dataset changed while scoring
+            return
+        self.scores = scores
+        self.statusBar().showMessage("{} of {} images scored".format(
+            scores.n_scored, len(scores)), 5000)
+        if self.uncertainAction.isChecked():
+            self.applyFilter()
+        
+    def resetScores(self):
+        # the running scoring is of the previous rows, its result is dropped
+        self.scores = None
+        self.scoreStop.set()
+        self.scoreFuture = None
+        
+    @property
+    def isUncertainFirst(self):
+        return self.scores is not None and self.uncertainAction.isChecked() \
+            and len(self.scores) == len(self.data)
+    
+    def suggestedLabels(self):
+        if self.scores is None or not self.suggestAction.isChecked() \
+                or len(self.scores) != len(self.data):
+            return []
+        return self.scores.suggested(self.current)
+        
     def onSaveCsv(self, button):
-        self.changesSaved = True
-        self.data.save()
+        if self.isLabeling:
+            self.saveData()
             
     def onNextImage(self, s):
-        if self.current +1 < len(self.data):
-            self.listWidget.setCurrentRow(self.current +1)        
+        self.direction = 1
+        row = self.listView.currentIndex().row()
+        if row +1 < self.listModel.rowCount():
+            self.setViewRow(row +1)
         
     def onPrevImage(self, s):        
-        if self.current >= 1:
-            self.listWidget.setCurrentRow(self.current -1)
+        self.direction = -1
+        row = self.listView.currentIndex().row()
+        if row >= 1:
+            self.setViewRow(row -1)
+    
+    def onNextUnset(self):
+        self.jumpToNext('unset')
+        
+    def onNextMatch(self):
+        self.jumpToNext(self.labelFilter.currentData())
+        
+    def jumpToNext(self, label):
+        if not self.isLabeling:
+            return False
+        folder = self.folderFilter.currentData()
+        row = self.nextShown(self.current, label, folder)
+        if row < 0:
+            # from the start
+            row = self.nextShown(-1, label, folder)
+        if row < 0 or row == self.current:
+            self.statusBar().showMessage("No more images found", 2000)
+            return False
+        self.direction = 1
+        self.setCurrentRow(row)
+        return True
+    
+    def nextShown(self, row, label, folder):
+        leased = self.data.leasedRows()
+        if leased is not None or self.isUncertainFirst:
+            rows = self.navIndex.rows(label, folder)
+            if leased is not None:
+                # only the leased rows are shown
+                rows = np.intersect1d(rows, leased, assume_unique=True)
+            if self.isCollapsed:
+                rows = rows[self.duplicates.representative[rows] == rows]
+            if self.isUncertainFirst:
+                return self.scores.next(row, rows)
+            pos = np.searchsorted(rows, row, side='right')
+            return int(rows[pos]) if pos < len(rows) else -1
+        row = self.navIndex.next(row, label, folder)
+        if self.isCollapsed:
+            # skip the collapsed duplicates
+            reps = self.duplicates.representative
+            while row > -1 and reps[row] != row:
+                row = self.navIndex.next(row, label, folder)
+        return row
+        
+    def onFilterChanged(self, index):
+        if not self.isLabeling:
+            return False
+        self.applyFilter()
+        return True
+        
+    def applyFilter(self):
+        label = self.labelFilter.currentData()
+        folder = self.folderFilter.currentData()
+        rows = None
+        if label is not None or folder is not None:
+            rows = self.navIndex.rows(label, folder)
+        leased = self.data.leasedRows()
+        if leased is not None:
+            rows = leased if rows is None else np.intersect1d(
+                rows, leased, assume_unique=True)
+        if self.isCollapsed:
+            reps = self.duplicates.representatives()
+            rows = reps if rows is None else np.intersect1d(
+                rows, reps, assume_unique=True)
+        if self.isUncertainFirst:
+            rows = self.scores.sort(rows)
+        self.listModel.setRows(rows)
+        
+        # keep the current image if shown, else the next one
+        row = self.current
+        if self.listModel.viewRow(row) < 0:
+            row = self.nextShown(self.current, label, folder)
+            if row < 0:
+                row = self.listModel.dataRow(0) \
+                    if self.listModel.rowCount() > 0 else -1
+        if row > -1:
+            self.setCurrentRow(row)
+        self.updateImageInfo()
+        if self.grid is not None and self.grid.isVisible():
+            self.grid.showCurrentPage()
     
-    def onSelectItem(self):
+    def clearFilter(self):
+        for combo in (self.labelFilter, self.folderFilter):
+            combo.blockSignals(True)
+            combo.setCurrentIndex(0)
+            combo.blockSignals(False)
+        self.collapseAction.blockSignals(True)
+        self.collapseAction.setChecked(False)
+        self.collapseAction.blockSignals(False)
+        rows = self.data.leasedRows() if self.data is not None else None
+        if self.data is not None and self.isUncertainFirst:
+            # the order is kept
+            rows = self.scores.sort(rows)
+        self.listModel.setRows(rows)
+        
+    def buildNavIndex(self):
+        self.navIndex = NavigationIndex.fromData(self.data)
+        self.clearFilter()
+        self.folderFilter.blockSignals(True)
+        while self.folderFilter.count() > 1:
+            self.folderFilter.removeItem(1)
+        for folder in self.navIndex.folders:
+            self.folderFilter.addItem(folder, folder)
+        self.folderFilter.blockSignals(False)
+    
+    def onZoomImage(self):
+        self.zoomed = not self.zoomed
+        self.imageArea.view.setFit(not self.zoomed)
+        if self.isLabeling and self.current > -1:
+            # keep the checked labels
+            self.processLabels()
+            self.updateItem()
+            self.processImage()
+    
+    def setCurrentRow(self, row):
+        view_row = self.listModel.viewRow(row)
+        if view_row < 0:
+            # hidden by the filter
+            self.clearFilter()
+            view_row = self.listModel.viewRow(row)
+        if view_row > -1:
+            self.setViewRow(view_row)
+        
+    def setViewRow(self, row):
+        self.listView.setCurrentIndex(self.listModel.index(row))
+    
+    @timers.timed('window.onSelectItem')
+    def onSelectItem(self, current=None, previous=None):
         if self.current > -1:
             self.processLabels()
             # update labels
             self.updateItem()
-        self.current = self.listWidget.currentRow()
-        self.processImage()
+        self.current = self.listModel.dataRow(
+            self.listView.currentIndex().row())
+        if self.current > -1:
+            self.processImage()
 
     def startLabeling(self):
         # init data and pointer
@@ -322,19 +997,34 @@ class LabelerWindow(QMainWindow):
         self.current = -1
         # populate list for selection
         self.populateList()
-        # initiate image visor
-        cv2.namedWindow("Image", cv2.WINDOW_NORMAL)            
+        self.buildNavIndex()
         # process first image
-        self.listWidget.setCurrentRow(0)
-        self.changesSaved = True
-        self.isLabeling = True        
+        self.setViewRow(0)
+        # recovered changes from the journal are not in the csv yet
+        self.changesSaved = not self.data.hasJournal()
+        self.isLabeling = True
+        # the new or modified images of the packed thumbnails
+        if os.path.isfile(self.data.thumbs_file):
+            self.updateThumbnails()        
         
     def stopLabeling(self):
         self.launchSaveChanges()
         # images presenter and info
         self.imagesInfo.setText("Images")
-        self.listWidget.clear()
-        cv2.destroyAllWindows()
+        self.progressInfo.setText("")
+        self.current = -1
+        self.clearFilter()
+        self.listModel.setDataHandler(None)
+        self.navIndex = None
+        self.resetDuplicates()
+        self.resetScores()
+        self.prefetcher.cancel()
+        self.imageCache.clear()
+        self.thumbsStop.set()
+        if self.grid is not None:
+            self.grid.clear()
+            self.grid.hide()
+        self.imageArea.view.setImage(None)
         # reset data
         self.data = None
         self.labels = []
@@ -344,8 +1034,8 @@ class LabelerWindow(QMainWindow):
         label = []
         
         def label_idx(l):
-            if l in self.labels_id:
-                return self.labels_id.index(l)
+            if l in self.labels_idx:
+                return self.labels_idx[l]
             else:
                 return l
         
@@ -391,22 +1081,20 @@ class LabelerWindow(QMainWindow):
         return item_text
     
     def populateList(self):
-        for i in range(len(self.data)):
-            item = self.row2text(i)
-            self.listWidget.addItem(item)
+        # rows text are built on demand by the model
+        self.listModel.setDataHandler(self.data)
             
+    @timers.timed('window.updateItem')
     def updateItem(self):
-        itemText = self.row2text(self.current)
-        item = self.listWidget.item(self.current)
-        
-        if item.text() != itemText:
-            self.changesSaved = False
-            item.setText(itemText)       
+        self.listModel.updateRow(self.current)
     
-    def refreshCheckboxes(self):
+    def refreshCheckboxes(self, suggest=False):
 #        if self.haveLabels:
+        # the scored labels of the unset images
+        unset = not any(isinstance(l, int) for l in self.labels)
+        suggested = self.suggestedLabels() if suggest and unset else []
         for label, checkbox in enumerate(self.checkboxes):
-            if label in self.labels:
+            if label in self.labels or label in suggested:
                 checkbox.setChecked(True)
             else:
                 checkbox.setChecked(False)
@@ -422,93 +1110,192 @@ class LabelerWindow(QMainWindow):
         
         return self.labels
     
-    def processLabels(self):
-        self.getValidLabels()
-        self.refreshCheckboxes()
+    def outLabels(self, labels):
+        # the stored label of the labels index
         out_labels = []
         
-        if self.isMultiLabel: #multi label
-            for l in self.labels:
+        if len(labels) > 1: #multi label
+            for l in labels:
                 out_labels.append(self.labels_id[l])
-        elif self.isSingleLabel:
-            out_labels = self.labels_id[self.labels[0]]
+        elif len(labels) == 1:
+            out_labels = self.labels_id[labels[0]]
+        
+        return out_labels if len(out_labels) > 0 else 'unset'
+    
+    @timers.timed('window.processLabels')
+    def processLabels(self):
+        if not self.data.isWritable(self.current):
+            # leased by another session
+            return
+        self.getValidLabels()
+        self.refreshCheckboxes()
+        out_labels = self.outLabels(self.labels)
+        _, prev_label = self.data[self.current]
+        if self.parseLabel(prev_label) == self.parseLabel(out_labels):
+            # only visited, nothing to store or propagate
+            return
+        self.changesSaved = False
+        self.navIndex.update(self.current, prev_label, out_labels)
         
         # self.dataset.iloc[self.current]['class'] = out_labels
-        self.data[self.current] = out_labels if len(out_labels) > 0 else \
-            'unset'
+        self.data[self.current] = out_labels
+        
+        if self.duplicates is not None and (
+                self.labelDuplicatesAction.isChecked() or self.isCollapsed):
+            self.labelDuplicates(out_labels)
+            
+    def applyLabels(self, rows, labels):
+        # same labels to many rows in a single batch update
+        rows = [row for row in rows if self.data.isWritable(row)]
+        out_labels = self.outLabels(labels)
+        prev_labels = [self.data[row][1] for row in rows]
+        if self.current in rows:
+            # the checkboxes are stored when leaving the image
+            self.labels = list(labels)
+            self.refreshCheckboxes()
+        
+        changed = self.data.setLabels(rows, out_labels)
+        if changed == 0:
+            return 0
+        self.changesSaved = False
+        for row, prev_label in zip(rows, prev_labels):
+            if self.parseLabel(prev_label) != self.parseLabel(out_labels):
+                self.navIndex.update(row, prev_label, out_labels)
+                self.listModel.updateRow(row)
+        self.updateProgress()
+        if self.current in rows:
+            self.showImage()
+        return changed
+            
+    def labelDuplicates(self, out_labels):
+        # the cluster members labeled otherwise, in a single batch update
+        rows, prev_labels = [], []
+        for row in self.duplicates.members(self.current):
+            _, prev_label = self.data[row]
+            if row == self.current or not self.data.isWritable(row) or \
+                    self.parseLabel(prev_label) == self.parseLabel(out_labels):
+                continue
+            rows.append(row)
+            prev_labels.append(prev_label)
+        if len(rows) == 0 or self.data.setLabels(rows, out_labels) == 0:
+            return
+        for row, prev_label in zip(rows, prev_labels):
+            self.navIndex.update(row, prev_label, out_labels)
+            self.listModel.updateRow(row)
             
     def updateImageInfo(self):
         image_summ = "Image Nro. {} of {}".format(self.current +1, 
                                                   len(self.data))
+        if self.listModel.rows is not None:
+            image_summ += " ({} shown)".format(self.listModel.rowCount())
         self.imagesInfo.setText(image_summ)
+        self.updateProgress()
+        
+    def updateProgress(self):
+        stats = self.data.stats
+        self.progressInfo.setText("Labeled {} of {} ({} unset)".format(
+            stats.labeled, stats.total, stats.unset))
         
+    def imageKey(self, idx):
+        img_path, _ = self.data[idx]
+        impath = os.path.join(self.data.images_root, img_path)
+        # reduced decoding unless zoomed
+        return impath, None if self.zoomed else self.screen_res
+        
+    def prefetchImages(self):
+        ahead, behind = self.prefetch_ahead, self.prefetch_behind
+        if self.direction < 0:
+            ahead, behind = behind, ahead
+        # the neighbours in the list, as shown by the filter
+        view_row = self.listModel.viewRow(self.current)
+        rows = [view_row + i for i in range(1, ahead +1)]
+        rows += [view_row - i for i in range(1, behind +1)]
+        rows = [self.listModel.dataRow(r) for r in rows
+                if 0 <= r < self.listModel.rowCount()]
+        self.prefetcher.prefetch([self.imageKey(r) for r in rows])
+        
+    @timers.timed('window.showImage')
     def showImage(self):
-        img_path, label = self.data[self.current]
+        with timers.stage('showImage.row'):
+            img_path, label = self.data[self.current]
         
         # idx = self.current
         # row = self.dataset.iloc[idx]
-        impath = os.path.join(self.data.root_path, img_path)
-        text_height = 20
+        impath = os.path.join(self.data.images_root, img_path)
         self.labels = self.parseLabel(label)
         
+        with timers.stage('showImage.decode'):
+            img = self.prefetcher.get(self.imageKey(self.current))
+        self.prefetchImages()
         # check if image exist
-        if not os.path.isfile(impath):
+        if img is None:
             print('Error!', impath, 'Not Found!')
+            self.imageArea.view.setImage(None)
             return False
-    
-        img = cv2.imread(impath)
-        #define the screen resulation
-        screen_res = 800, 600
-        # must resize?
-        # if img.shape[1] > screen_res[0] or img.shape[0] > screen_res[1]: 
-        scale_width = screen_res[0] / img.shape[1]
-        scale_height = screen_res[1] / img.shape[0]
-        scale = min(scale_width, scale_height)
-     
-        #resized window width and height
-        window_width = int(img.shape[1] * scale)
-        window_height = int(img.shape[0] * scale)
-     
-        #resize the window according to the screen resolution
-        cv2.resizeWindow("Image", window_width, window_height)
-     
-        # draw labels
-        if self.haveLabels:
-            for i, l in enumerate(self.labels):
-                if not isinstance(l, int):
-                    continue
-                y_pos = text_height + (text_height *i) + (5 *i)
-                cv2.putText(img, text=self.labels_name[l], org=(3, y_pos), 
-                            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                            fontScale=0.70, color=(255, 0, 0), thickness=2)
-        
-        cv2.imshow("Image", img)
+        # only the labels names are drawn, over the image
+        labels_name = [self.labels_name[l] for l in self.labels
+                       if isinstance(l, int)] if self.haveLabels else []
+        
+        # the cached image is shown without copying it
+        with timers.stage('showImage.display'):
+            self.imageArea.view.setImage(img, labels_name)
         
     def processImage(self):
         self.updateImageInfo()
         self.showImage()
-        self.refreshCheckboxes()
+        self.refreshCheckboxes(suggest=True)
         
     def launchSaveChanges(self):
+        if isinstance(self.data, SharedDataHandler):
+            # the changes are in the sessions database, merged by the last
+            self.data.close()
+            return
         if not self.changesSaved:
             saveDialog = MessageDialog('Not saved changes!', 
                         'Some labeled images were not saved, do you want to save the changes?')
             if saveDialog.exec_():
                 # save csv
-                self.data.save()
+                self.saver.save(self.data)
+            elif self.data.journal is not None:
+                # discard the changes
+                self.data.journal.clear()
+        # the background saves of this data
+        self.saveTimer.stop()
+        self.saver.wait()
+        error = self.saver.takeError()
+        if error is not None:
+            print('Error!', 'not saved:', error)
+        if self.data is not None and self.data.journal is not None:
+            self.data.journal.close()
         
     def closeEvent(self, event):
         # stop process
         self.stopLabeling()                
+        self.prefetcher.shutdown()
+        self.saver.shutdown()
+        self.thumbsStop.set()
+        self.thumbsBuilder.shutdown(wait=False)
+        self.scoreStop.set()
+        self.scoreRunner.shutdown(wait=False)
+        self.hashStop.set()
+        self.hashRunner.shutdown(wait=False)
+        if self.grid is not None:
+            self.grid.close()
+            self.grid.thumbLoader.shutdown()
         event.accept() # let the window close
         
     
 def main():
+   start = time.perf_counter()
    app = QApplication(['Simple Labeler'])
    labeler = LabelerWindow()
    labeler.show()
+   if timers.enabled:
+       QTimer.singleShot(0, lambda: timers.record(
+           'startup.window', time.perf_counter() - start))
+   # the data and image modules load while a dataset is chosen
+   preload('pandas', 'cv2')
    app.exec_()
-   cv2.destroyAllWindows()
 	
 if __name__ == '__main__':
    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 18:02:11 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QModelIndex
+from PyQt5.QtCore import QAbstractListModel
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtGui import QIcon
+
+from imageview import toQImage
+
+
+class DataListModel(QAbstractListModel):
+    """A lazy list model over a DataHandler.
+
+    The item text is built only when the view ask for it, so only the
+    visible rows are ever formatted. A rows array shows only a subset of
+    the data, or the data in another order, the view rows mapped to the
+    data rows.
+    """
+
+    def __init__(self, textFn, parent=None):
+        super(DataListModel, self).__init__(parent)
+        self.textFn = textFn
+        self.data_handler = None
+        self.rows = None
+        self.positions = None
+
+    def setDataHandler(self, data_handler):
+        self.beginResetModel()
+        self.data_handler = data_handler
+        self.rows = None
+        self.positions = None
+        self.endResetModel()
+
+    def setRows(self, rows):
+        # None to show all the data rows
+        self.beginResetModel()
+        self.rows = rows
+        self.positions = None
+        if rows is not None and len(rows) > 1 and \
+                np.any(rows[1:] < rows[:-1]):
+            # not sorted, the view row of each data row
+            self.positions = np.full(int(rows.max()) + 1, -1, dtype=np.int64)
+            self.positions[rows] = np.arange(len(rows))
+        self.endResetModel()
+
+    def dataRow(self, row):
+        if row < 0 or self.rows is None:
+            return row
+        return int(self.rows[row])
+
+    def viewRow(self, data_row):
+        if self.rows is None:
+            return data_row
+        if self.positions is not None:
+            if 0 <= data_row < len(self.positions):
+                return int(self.positions[data_row])
+            return -1
+        pos = np.searchsorted(self.rows, data_row)
+        if pos < len(self.rows) and self.rows[pos] == data_row:
+            return int(pos)
+        return -1
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.data_handler is None:
+            return 0
+        if self.rows is not None:
+            return len(self.rows)
+        return len(self.data_handler)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or self.data_handler is None:
+            return None
+        if role == Qt.DisplayRole:
+            return self.textFn(self.dataRow(index.row()))
+        return None
+
+    def updateRow(self, data_row):
+        row = self.viewRow(data_row)
+        if row < 0:
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+
+class ThumbnailModel(QAbstractListModel):
+    """A page of data rows with its thumbnails.
+
+    The thumbnails are taken from an ImageCache filled by worker threads,
+    the rows still decoding are shown with its text only.
+    """
+
+    def __init__(self, textFn, keyFn, cache, parent=None):
+        super(ThumbnailModel, self).__init__(parent)
+        self.textFn = textFn
+        self.keyFn = keyFn
+        self.cache = cache
+        self.rows = []
+        self.icons = {}
+
+    def setRows(self, rows):
+        self.beginResetModel()
+        self.rows = list(rows)
+        self.icons = {}
+        self.endResetModel()
+
+    def dataRow(self, row):
+        return self.rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        data_row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return self.textFn(data_row)
+        elif role == Qt.DecorationRole:
+            return self.icons.get(data_row)
+        return None
+
+    def loadThumbnails(self):
+        """Take the decoded thumbnails from the cache, True if all done."""
+        for row, data_row in enumerate(self.rows):
+            if data_row in self.icons:
+                continue
+            key = self.keyFn(data_row)
+            if key not in self.cache:
+                continue
+            img = self.cache.get(key)
+            if img is None:
+                continue
+            # the pixmap is a copy, the cached buffer is only wrapped
+            qimg, _ = toQImage(img)
+            self.icons[data_row] = QIcon(QPixmap.fromImage(qimg))
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+        return len(self.icons) == len(self.rows)
+
+    def updateRow(self, data_row):
+        if data_row in self.rows:
+            index = self.index(self.rows.index(data_row))
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:10:58 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import numpy as np
+
+from labels import UNSET
+from labels import LabelCodec
+
+
+class NavigationIndex:
+    """Sorted rows index by label and by folder.
+
+    Each label keeps the sorted array of the rows having it, the rows
+    without labels are under 'unset'. The next or previous row of a
+    filter is a binary search, and a label change moves the row between
+    the labels arrays.
+    """
+
+    def __init__(self, label_rows, folder_rows, n_rows):
+        """Initialize the index.
+
+        Parameters
+        ----------
+        label_rows : dict
+            The sorted rows array of each label.
+        folder_rows : dict
+            The sorted rows array of each folder_path.
+        n_rows : int
+            The number of rows of the dataset.
+
+        """
+        self.label_rows = label_rows
+        self.folder_rows = folder_rows
+        self.n_rows = n_rows
+
+    @classmethod
+    def fromData(cls, data):
+        """Build the index of a data handler."""
+        return cls(data.labelRows(), data.folderRows(), len(data))
+
+    @staticmethod
+    def labelsOf(label):
+        """The labels of a label value, 'unset' if it has none."""
+        labels = LabelCodec.toList(label)
+        return labels if len(labels) > 0 else [UNSET]
+
+    @property
+    def folders(self):
+        """The sorted folder_path of the dataset."""
+        return sorted(self.folder_rows)
+
+    def update(self, row, old_label, new_label):
+        """Move a row from its old label value to the new one."""
+        old_labels = set(self.labelsOf(old_label))
+        new_labels = set(self.labelsOf(new_label))
+
+        for label in old_labels - new_labels:
+            rows = self.label_rows[label]
+            pos = np.searchsorted(rows, row)
+            if pos < len(rows) and rows[pos] == row:
+                self.label_rows[label] = np.delete(rows, pos)
+
+        for label in new_labels - old_labels:
+            rows = self.label_rows.get(label, np.empty(0, dtype=np.int64))
+            pos = np.searchsorted(rows, row)
+            if pos == len(rows) or rows[pos] != row:
+                self.label_rows[label] = np.insert(rows, pos, row)
+
+    def rows(self, label=None, folder=None):
+        """The sorted rows with a label and in a folder, all if None."""
+        rows = None
+        if label is not None:
+            rows = self.label_rows.get(label, np.empty(0, dtype=np.int64))
+        if folder is not None:
+            folder_rows = self.folder_rows.get(folder,
+                                               np.empty(0, dtype=np.int64))
+            rows = folder_rows if rows is None else np.intersect1d(
+                rows, folder_rows, assume_unique=True)
+        if rows is None:
+            rows = np.arange(self.n_rows)
+        return rows
+
+    def next(self, row, label=None, folder=None, step=1):
+        """The next row after row with a label and in a folder.
+
+        Parameters
+        ----------
+        row : int
+            The starting row, excluded.
+        label : string, optional
+            The required label, any if None. The default is None.
+        folder : string, optional
+            The required folder_path, any if None. The default is None.
+        step : int, optional
+            1 to look forward, -1 backward. The default is 1.
+
+        Returns
+        -------
+        int
+            The row found, -1 if there is none.
+
+        """
+        if label is not None and folder is not None:
+            # walk the label rows checking the folder
+            rows = self.label_rows.get(label, np.empty(0, dtype=np.int64))
+            folder_rows = self.folder_rows.get(folder,
+                                               np.empty(0, dtype=np.int64))
+            if len(folder_rows) < len(rows):
+                rows, folder_rows = folder_rows, rows
+            found = self._next(rows, row, step)
+            while found >= 0 and not self._contains(folder_rows, found):
+                found = self._next(rows, found, step)
+            return found
+
+        if label is not None:
+            rows = self.label_rows.get(label, np.empty(0, dtype=np.int64))
+        elif folder is not None:
+            rows = self.folder_rows.get(folder, np.empty(0, dtype=np.int64))
+        else:
+            found = row + step
+            return found if 0 <= found < self.n_rows else -1
+        return self._next(rows, row, step)
+
+    @staticmethod
+    def _next(rows, row, step):
+        if step > 0:
+            pos = np.searchsorted(rows, row, side='right')
+            return int(rows[pos]) if pos < len(rows) else -1
+        pos = np.searchsorted(rows, row, side='left') - 1
+        return int(rows[pos]) if pos >= 0 else -1
+
+    @staticmethod
+    def _contains(rows, row):
+        pos = np.searchsorted(rows, row)
+        return pos < len(rows) and rows[pos] == row
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 00:58:21 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+
+class BackgroundSaver:
+    """Write the data handlers on a worker thread.
+
+    The labels are copied when the save is requested, so the labeling
+    continues while the csv is written. A save requested while another
+    one is writing is coalesced into a single save, started by poll once
+    the current one ends. The error of a failed save is kept until taken.
+    """
+
+    def __init__(self):
+        self.progress = 0.
+        self.error = None
+        self._future = None
+        self._pending = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def saving(self):
+        """Check if a save is writing or waiting."""
+        return self._pending is not None or (
+            self._future is not None and not self._future.done())
+
+    def save(self, data):
+        """Request a save of a data handler.
+
+        Returns
+        -------
+        bool
+            False if coalesced, it is started once the current save ends.
+
+        """
+        if self._future is not None and not self._future.done():
+            self._pending = data
+            return False
+        self._start(data)
+        return True
+
+    def _start(self, data):
+        self.progress = 0.
+        if not data.background_save:
+            # the backends sharing a connection save on its thread
+            data.save()
+            self.progress = 1.
+            return
+        snapshot = data.snapshot()
+        self._future = self._executor.submit(self._write, data, snapshot)
+
+    def _write(self, data, snapshot):
+        try:
+            data.writeSnapshot(snapshot, progress=self._setProgress)
+        except Exception as e:
+            self.error = e
+            raise
+
+    def _setProgress(self, fraction):
+        self.progress = fraction
+
+    def takeError(self):
+        """The error of the last failed save, cleared once taken."""
+        error, self.error = self.error, None
+        return error
+
+    def poll(self):
+        """Start the coalesced save once the current one ends.
+
+        Returns
+        -------
+        bool
+            True if a save ended since the last poll, see error.
+
+        """
+        future = self._future
+        if future is None or not future.done():
+            return False
+        self._future = None
+        if self._pending is not None:
+            data, self._pending = self._pending, None
+            self._start(data)
+        return True
+
+    def wait(self):
+        """Block until the requested saves are written."""
+        while self.saving:
+            if self._future is not None:
+                wait([self._future])
+            self.poll()
+
+    def shutdown(self):
+        """Write the requested saves and stop the thread."""
+        self.wait()
+        self._executor.shutdown()
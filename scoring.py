@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 03:48:52 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+
+Pre-labeling scores of a dataset images from a scorer plugin:
+
+    python scoring.py dataset.csv my_scorers:handgunScorer [--workers 4]
+    python scoring.py dataset.csv path/to/scorer.py:Scorer
+
+The scorer is any callable mapping a decoded BGR image array to a score
+in [0, 1] for each label of the labels_id, named as module:attribute or
+file.py:attribute. A class is instantiated once by each process, so its
+model is loaded only once:
+
+    class Scorer:
+        def __init__(self):
+            self.model = loadModel('weights.onnx')
+
+        def __call__(self, img):
+            return self.model.predict(img)
+
+The scores are cached by image file, the scoring is resumed where it was
+stopped and only the new or modified images are scored again.
+"""
+import os
+import sys
+import time
+import argparse
+import importlib
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from images import decodeImage
+from images import imageSizeArg
+from duplicates import fileState
+from labels import LABELS_ID
+
+
+SUGGEST_THRESHOLD = 0.5
+# the scorer of each process
+_scorer = None
+
+
+def loadScorer(spec):
+    """Load a scorer from its module:attribute or file.py:attribute.
+
+    Raises
+    ------
+    ValueError
+        If the spec has no attribute or it is not callable.
+
+    """
+    module_name, _, attr = spec.rpartition(':')
+    if not module_name or not attr:
+        raise ValueError("The scorer '{}' is not module:attribute".format(
+            spec))
+    if module_name.endswith('.py'):
+        name = os.path.splitext(os.path.basename(module_name))[0]
+        module_spec = importlib.util.spec_from_file_location(
+            name, module_name)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    scorer = getattr(module, attr)
+    if isinstance(scorer, type):
+        scorer = scorer()
+    if not callable(scorer):
+        raise ValueError("The scorer '{}' is not callable".format(spec))
+    return scorer
+
+
+def _initScorer(spec):
+    global _scorer
+    _scorer = loadScorer(spec)
+
+
+def scoreImage(img_path, image_size, n_labels):
+    """Score an image with the process scorer.
+
+    Parameters
+    ----------
+    img_path : string
+        The image file path.
+    image_size : tuple
+        The (width, height) the image is decoded to fill, at full
+        resolution if None.
+    n_labels : int
+        The number of scores expected.
+
+    Returns
+    -------
+    numpy.ndarray
+        The float32 scores, None if the image can't be read.
+
+    """
+    img = decodeImage(img_path, image_size)
+    if img is None:
+        return None
+    scores = np.asarray(_scorer(img), dtype=np.float32).ravel()
+    if len(scores) != n_labels:
+        raise ValueError('The scorer returned {} scores for {} labels'.format(
+            len(scores), n_labels))
+    return scores
+
+
+class ScoreCache:
+    """Label scores cached in a sidecar file.
+
+    The scores are kept by image path along its size and modification
+    time, as the HashCache, and are discarded if computed by another
+    scorer or for other labels.
+    """
+
+    def __init__(self, cache_path, scorer, labels_id):
+        """Initialize the cache.
+
+        Parameters
+        ----------
+        cache_path : string
+            The .npz file of the cached scores.
+        scorer : string
+            The scorer spec.
+        labels_id : list
+            The labels of the scores.
+
+        """
+        self.cache_path = cache_path
+        self.scorer = scorer
+        self.labels_id = list(labels_id)
+        self.entries = {}
+
+    def load(self):
+        """Read the cached scores, if of the same scorer and labels."""
+        self.entries = {}
+        if not os.path.isfile(self.cache_path):
+            return False
+        with np.load(self.cache_path) as cached:
+            if str(cached['scorer']) != self.scorer or \
+                    cached['labels_id'].tolist() != self.labels_id:
+                return False
+            for path, state, scores, valid in zip(
+                    cached['path'], cached['state'], cached['scores'],
+                    cached['valid']):
+                self.entries[str(path)] = (tuple(state.tolist()),
+                                           scores if valid else None)
+        return True
+
+    def save(self):
+        """Write the cached scores, replacing the file once written."""
+        paths = list(self.entries)
+        states = [self.entries[p][0] for p in paths]
+        empty = np.zeros(len(self.labels_id), dtype=np.float32)
+        scores = [self.entries[p][1] if self.entries[p][1] is not None
+                  else empty for p in paths]
+        valid = [self.entries[p][1] is not None for p in paths]
+        tmp_file = self.cache_path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, scorer=np.array(self.scorer),
+                     labels_id=np.array(self.labels_id, dtype=str),
+                     path=np.array(paths, dtype=str),
+                     state=np.array(states, dtype=np.int64).reshape(-1, 2),
+                     scores=np.array(scores, dtype=np.float32).reshape(
+                         -1, len(self.labels_id)),
+                     valid=np.array(valid, dtype=bool))
+        os.replace(tmp_file, self.cache_path)
+
+    def get(self, path, state):
+        """Get the (found, scores) of an image in the given state."""
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != state:
+            return False, None
+        return True, entry[1]
+
+    def put(self, path, state, scores):
+        """Store the scores of an image, None if can't be read."""
+        self.entries[path] = (state, scores)
+
+
+class LabelScores:
+    """The label scores of the dataset rows, by uncertainty.
+
+    The uncertainty of a row is given by its label score closest to 0.5,
+    1 if any label is a coin toss and 0 if all the labels are certain.
+    The rows without scores are the last ones.
+    """
+
+    def __init__(self, scores, valid):
+        """Initialize the scores.
+
+        Parameters
+        ----------
+        scores : numpy.ndarray
+            The (rows, labels) scores.
+        valid : numpy.ndarray
+            The boolean array of the rows with scores.
+
+        """
+        self.scores = scores
+        self.valid = valid
+        self.uncertainty = np.full(len(scores), -1., dtype=np.float32)
+        if scores.shape[1] > 0:
+            margin = np.abs(np.clip(scores[valid], 0., 1.) - 0.5).min(axis=1)
+            self.uncertainty[valid] = 1. - 2. * margin
+        # the most uncertain first, in the rows order if tied
+        self.order = np.argsort(-self.uncertainty, kind='stable')
+        self.rank = np.empty(len(scores), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(scores))
+
+    def __len__(self):
+        """Number of rows."""
+        return len(self.scores)
+
+    @property
+    def n_scored(self):
+        """Number of rows with scores."""
+        return int(np.count_nonzero(self.valid))
+
+    def sort(self, rows=None):
+        """The rows sorted by uncertainty, all if None."""
+        if rows is None:
+            return self.order
+        return rows[np.argsort(self.rank[rows], kind='stable')]
+
+    def next(self, row, rows):
+        """The next row after row in the uncertainty order.
+
+        Parameters
+        ----------
+        row : int
+            The starting row, excluded, -1 to start from the first.
+        rows : numpy.ndarray
+            The rows to look into.
+
+        Returns
+        -------
+        int
+            The row found, -1 if there is none.
+
+        """
+        ranks = self.rank[rows]
+        later = ranks > (self.rank[row] if row > -1 else -1)
+        if not later.any():
+            return -1
+        return int(rows[later][np.argmin(ranks[later])])
+
+    def suggested(self, row, threshold=SUGGEST_THRESHOLD):
+        """The labels index scored over the threshold for a row."""
+        if row < 0 or row >= len(self.scores) or not self.valid[row]:
+            return []
+        return np.flatnonzero(self.scores[row] >= threshold).tolist()
+
+
+def computeScores(paths, cache, scorer, n_labels, image_size=(224, 224),
+                  workers=None, stop_event=None, progress=None,
+                  save_every=30.):
+    """Score the images on a process pool.
+
+    Parameters
+    ----------
+    paths : list
+        The image files path.
+    cache : ScoreCache
+        The cached scores, updated with the computed ones and saved every
+        save_every seconds, so an interrupted scoring is resumed.
+    scorer : string
+        The scorer spec, loaded by each process.
+    n_labels : int
+        The number of labels scored.
+    image_size : tuple, optional
+        The (width, height) the images are decoded to fill.
+        The default is (224, 224).
+    workers : int, optional
+        The number of processes, the CPU count if None.
+        The default is None.
+    stop_event : threading.Event, optional
+        Set to stop the scoring, the scores done are kept.
+        The default is None.
+    progress : callable, optional
+        Called with the scored fraction of the pending images.
+        The default is None.
+    save_every : float, optional
+        The seconds between the cache saves. The default is 30.
+
+    Returns
+    -------
+    numpy.ndarray
+        The (n, n_labels) float32 scores of each image.
+    numpy.ndarray
+        The boolean array of the images scored.
+
+    """
+    start = time.perf_counter()
+    scores = np.zeros((len(paths), n_labels), dtype=np.float32)
+    valid = np.zeros(len(paths), dtype=bool)
+
+    pending = []
+    for i, path in enumerate(paths):
+        state = fileState(path)
+        found, cached = cache.get(path, state)
+        if found:
+            if cached is not None:
+                scores[i] = cached
+                valid[i] = True
+        else:
+            pending.append((i, path, state))
+
+    scored = 0
+    if len(pending) > 0:
+        # spawned processes, the GUI threads are not forked
+        context = multiprocessing.get_context('spawn')
+        last_save = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_initScorer,
+                                 initargs=(scorer,)) as executor:
+            results = executor.map(
+                scoreImage, [p[1] for p in pending],
+                [image_size] * len(pending), [n_labels] * len(pending),
+                chunksize=16)
+            for (i, path, state), result in zip(pending, results):
+                if result is not None:
+                    scores[i] = result
+                    valid[i] = True
+                cache.put(path, state, result)
+                scored += 1
+                if progress is not None:
+                    progress(scored / len(pending))
+                if time.monotonic() - last_save >= save_every:
+                    cache.save()
+                    last_save = time.monotonic()
+                if stop_event is not None and stop_event.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+
+    print('Scored {} images, {} cached, in {:.2f}s'.format(
+        scored, len(paths) - len(pending), time.perf_counter() - start))
+
+    return scores, valid
+
+
+def scoreImages(paths, scores_file, scorer, labels_id=LABELS_ID, **kwargs):
+    """Score the images, with its scores cached in a sidecar file.
+
+    Parameters
+    ----------
+    paths : list
+        The image files path.
+    scores_file : string
+        The sidecar file of the cached scores.
+    scorer : string
+        The scorer spec, as module:attribute or file.py:attribute.
+    labels_id : list, optional
+        The labels scored. The default is LABELS_ID.
+    **kwargs
+        The computeScores options.
+
+    Returns
+    -------
+    LabelScores
+        The scores of the images, in the paths order.
+
+    """
+    cache = ScoreCache(scores_file, scorer, labels_id)
+    cache.load()
+    try:
+        scores, valid = computeScores(paths, cache, scorer, len(labels_id),
+                                      **kwargs)
+    finally:
+        # the scores done, even if the scorer failed
+        cache.save()
+    return LabelScores(scores, valid)
+
+
+def imagePaths(data):
+    """The image file path of each data handler row."""
+    return [os.path.join(data.images_root, path)
+            for path in data.imagePaths()]
+
+
+def scoreDataset(data, scorer, labels_id=LABELS_ID, **kwargs):
+    """Score the images of a data handler rows.
+
+    The scores are cached in the data scores sidecar file, see
+    scoreImages.
+    """
+    return scoreImages(imagePaths(data), data.scores_file, scorer,
+                       labels_id, **kwargs)
+
+
+def main(argv=None):
+    from handlers import DataHandler
+
+    parser = argparse.ArgumentParser(
+        description='Score the images of a dataset csv with a scorer.')
+    parser.add_argument('csv_file', help='the dataset csv file')
+    parser.add_argument('scorer', help='module:attribute or file.py:attribute')
+    parser.add_argument('--image-size', type=imageSizeArg, default=(224, 224),
+                        help='WIDTHxHEIGHT the images are decoded to fill')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    data = DataHandler(args.csv_file)
+    data.read()
+    scores = scoreDataset(data, args.scorer, image_size=args.image_size,
+                          workers=args.workers)
+    print('{} of {} rows scored, {} uncertain over 0.5'.format(
+        scores.n_scored, len(scores),
+        int(np.count_nonzero(scores.uncertainty > 0.5))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
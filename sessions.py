@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:48:12 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import numpy as np
+from contextlib import contextmanager
+
+from lazy import LazyModule
+from handlers import DataHandler
+
+pd = LazyModule('pandas')
+
+
+class ShardLeases:
+    """Row ranges of a dataset leased to the labeling sessions.
+
+    The dataset rows are split in shards of consecutive rows, each leased
+    to a single session, which must renew it before it expires. The
+    expired leases, of crashed or suspended sessions, are reclaimed by
+    the next session asking for rows.
+
+    The leases and the label changes of all the sessions are kept in a
+    SQLite database in WAL mode, so the sessions read while another one
+    writes. A change is only written if its row is in a shard leased to
+    the session, checked in the same statement. The changes are kept
+    until merged into the csv and pulled by all the live sessions.
+    """
+
+    def __init__(self, db_path, n_rows, shard_size=500, lease_seconds=120.,
+                 session_id=None):
+        """Initialize the leases.
+
+        Parameters
+        ----------
+        db_path : string
+            The sessions database file.
+        n_rows : int
+            The number of rows of the dataset.
+        shard_size : int, optional
+            The rows of each shard. The default is 500.
+        lease_seconds : float, optional
+            The seconds a lease is kept without being renewed.
+            The default is 120.
+        session_id : string, optional
+            The session name, unique by default.
+
+        """
+        self.db_path = db_path
+        self.n_rows = n_rows
+        self.shard_size = shard_size
+        self.lease_seconds = lease_seconds
+        self.session_id = session_id or '{}-{}-{}'.format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        # the (start, stop) of the leased shards, by shard id
+        self.owned = {}
+        self.conn = None
+
+    def open(self):
+        """Connect to the database, splitting the rows on first use."""
+        if self.conn is not None:
+            return
+        # transactions are explicit
+        self.conn = sqlite3.connect(self.db_path, timeout=30.,
+                                    isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.transaction():
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS shards ('
+                'id INTEGER PRIMARY KEY, start INTEGER NOT NULL, '
+                'stop INTEGER NOT NULL, session TEXT, heartbeat REAL, '
+                'done INTEGER NOT NULL DEFAULT 0)')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS changes ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'row INTEGER NOT NULL, folder_path TEXT NOT NULL, '
+                'image_id TEXT NOT NULL, label TEXT NOT NULL, '
+                'session TEXT NOT NULL, ts REAL NOT NULL)')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta ('
+                'key TEXT PRIMARY KEY, value TEXT)')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'session TEXT PRIMARY KEY, pulled INTEGER NOT NULL, '
+                'heartbeat REAL NOT NULL)')
+
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'n_rows'").fetchone()
+            if row is not None and int(row[0]) != self.n_rows:
+                if self._busy():
+                    raise ValueError(
+                        'The dataset has {} rows but is shared with {} rows'
+                        .format(self.n_rows, row[0]))
+                # nothing pending from the previous rows split
+                self.conn.execute('DELETE FROM shards')
+                row = None
+            if row is None:
+                self._split()
+            # nothing pulled yet, the changes are kept for this session
+            self.conn.execute(
+                'INSERT OR REPLACE INTO sessions VALUES (?, 0, ?)',
+                (self.session_id, time.time()))
+
+    def _busy(self):
+        """Check for live leases or changes not merged into the csv."""
+        return self.pending() > 0 or len(self.liveSessions()) > 0
+
+    def _split(self):
+        starts = range(0, self.n_rows, self.shard_size)
+        self.conn.executemany(
+            'INSERT INTO shards (id, start, stop) VALUES (?, ?, ?)',
+            [(i, start, min(start + self.shard_size, self.n_rows))
+             for i, start in enumerate(starts)])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('n_rows', ?)",
+            (str(self.n_rows),))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('shard_size', ?)",
+            (str(self.shard_size),))
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction, the other sessions writes wait for it."""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def acquire(self):
+        """Lease the next free shard, reclaiming an expired one if needed.
+
+        Returns
+        -------
+        tuple
+            The (start, stop) rows of the shard, None if all are leased.
+
+        """
+        now = time.time()
+        with self.transaction():
+            # the shards not labeled yet first
+            row = self.conn.execute(
+                'SELECT id, start, stop FROM shards '
+                'WHERE session IS NULL OR heartbeat < ? '
+                'ORDER BY done, id LIMIT 1',
+                (now - self.lease_seconds,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                'UPDATE shards SET session = ?, heartbeat = ? WHERE id = ?',
+                (self.session_id, now, row[0]))
+        self.owned[row[0]] = row[1], row[2]
+        return row[1], row[2]
+
+    def renew(self):
+        """Extend the leases of the session.
+
+        Returns
+        -------
+        list
+            The (start, stop) of the shards lost, reclaimed by another
+            session after they expired.
+
+        """
+        with self.transaction():
+            now = time.time()
+            self.conn.execute(
+                'UPDATE shards SET heartbeat = ? WHERE session = ?',
+                (now, self.session_id))
+            self.conn.execute(
+                'UPDATE sessions SET heartbeat = ? WHERE session = ?',
+                (now, self.session_id))
+            owned = {i: (start, stop) for i, start, stop in self.conn.execute(
+                'SELECT id, start, stop FROM shards WHERE session = ?',
+                (self.session_id,))}
+        lost = [shard for i, shard in self.owned.items() if i not in owned]
+        self.owned = owned
+        return lost
+
+    def release(self, done=False):
+        """Return the leased shards, marked as done if labeled."""
+        if len(self.owned) == 0:
+            return
+        with self.transaction():
+            self.conn.execute(
+                'UPDATE shards SET session = NULL, heartbeat = NULL, '
+                'done = MAX(done, ?) WHERE session = ?',
+                (int(done), self.session_id))
+        self.owned = {}
+
+    def owns(self, row):
+        """Check if a row is in the leased shards."""
+        return any(start <= row < stop for start, stop in self.owned.values())
+
+    def ownedRows(self):
+        """The sorted rows of the leased shards."""
+        if len(self.owned) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, stop, dtype=np.int64)
+                               for start, stop in sorted(self.owned.values())])
+
+    def liveSessions(self):
+        """The sessions renewed before expiring, but this one."""
+        return [r[0] for r in self.conn.execute(
+            'SELECT session FROM sessions '
+            'WHERE session != ? AND heartbeat >= ?',
+            (self.session_id, time.time() - self.lease_seconds))]
+
+    def markPulled(self, seq):
+        """Record the last change applied by this session."""
+        self.conn.execute(
+            'UPDATE sessions SET pulled = ?, heartbeat = ? WHERE session = ?',
+            (seq, time.time(), self.session_id))
+
+    def write(self, changes):
+        """Write label changes of the leased rows.
+
+        Parameters
+        ----------
+        changes : list
+            The (row, (folder_path, image_id), label) changes.
+
+        Returns
+        -------
+        list
+            The bool of each change, False if its row is not leased.
+
+        """
+        written = []
+        now = time.time()
+        with self.transaction():
+            for row, key, label in changes:
+                # only while the shard is still leased
+                cursor = self.conn.execute(
+                    'INSERT INTO changes '
+                    '(row, folder_path, image_id, label, session, ts) '
+                    'SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS ('
+                    'SELECT 1 FROM shards WHERE session = ? '
+                    'AND start <= ? AND ? < stop)',
+                    (int(row), key[0], key[1], json.dumps(label),
+                     self.session_id, now, self.session_id, int(row),
+                     int(row)))
+                written.append(cursor.rowcount > 0)
+        return written
+
+    def changes(self, since=0):
+        """The label changes after a sequence number, in order.
+
+        Returns
+        -------
+        list
+            The (seq, row, (folder_path, image_id), label, session)
+            changes.
+
+        """
+        return [(seq, row, (folder_path, image_id), json.loads(label),
+                 session)
+                for seq, row, folder_path, image_id, label, session
+                in self.conn.execute(
+                    'SELECT seq, row, folder_path, image_id, label, session '
+                    'FROM changes WHERE seq > ? ORDER BY seq', (since,))]
+
+    def pending(self):
+        """The number of changes not merged into the csv."""
+        return self.conn.execute('SELECT COUNT(*) FROM changes').fetchone()[0]
+
+    def purge(self, until):
+        """Remove the changes merged into the csv until a sequence number.
+
+        The changes not pulled yet by a live session are kept, as its
+        labels would be written over them when it saves.
+
+        Returns
+        -------
+        int
+            The last sequence number removed.
+
+        """
+        pulled, = self.conn.execute(
+            'SELECT MIN(pulled) FROM sessions '
+            'WHERE session != ? AND heartbeat >= ?',
+            (self.session_id, time.time() - self.lease_seconds)).fetchone()
+        if pulled is not None:
+            until = min(until, pulled)
+        self.conn.execute('DELETE FROM changes WHERE seq <= ?', (until,))
+        return until
+
+    def close(self):
+        """Release the leases and disconnect."""
+        if self.conn is None:
+            return
+        self.release()
+        self.conn.execute('DELETE FROM sessions WHERE session = ?',
+                          (self.session_id,))
+        self.conn.close()
+        self.conn = None
+
+
+class SharedDataHandler(DataHandler):
+    """Handler of a csv labeled by many sessions at once.
+
+    Each session labels only the rows of its leased shards. The label
+    changes are written to the sessions database instead of the csv, and
+    pulled by the other sessions. The csv is rewritten only when merged,
+    on save or by the last session closing, read again first if another
+    session rewrote it.
+    """
+
+    # merged while holding the sessions database lock, on its thread
+    background_save = False
+
+    def __init__(self, filepath, labels_id=None, use_journal=False,
+                 archive=None, shard_size=500, lease_seconds=120.):
+        """Initialize the handler.
+
+        Parameters
+        ----------
+        filepath : string
+            The csv file target to write or read the data.
+        labels_id : list, optional
+            The known labels. The default is None.
+        use_journal : bool, optional
+            Ignored, the changes table is the journal of the sessions.
+            The default is False.
+        archive : string, optional
+            A zip or tar file with the images, instead of the csv folder.
+            The default is None.
+        shard_size : int, optional
+            The rows of each leased shard. The default is 500.
+        lease_seconds : float, optional
+            The seconds a lease is kept without being renewed.
+            The default is 120.
+        """
+        super(SharedDataHandler, self).__init__(filepath, labels_id,
+                                                archive=archive)
+        self.shard_size = shard_size
+        self.lease_seconds = lease_seconds
+        self.leases = None
+        # the last change applied from the sessions database
+        self.pulled = 0
+        # the csv state when read or merged by this session
+        self.csv_state = None
+
+    @property
+    def sessions_file(self):
+        """The sessions database, next to the csv."""
+        return os.path.join(self.root_path, self.csv_file + '.sessions.db')
+
+    def read(self):
+        """Load the csv, the changes not merged, and lease the first rows."""
+        if self.leases is not None:
+            return False
+        if not self.loaded:
+            super(SharedDataHandler, self).read()
+            self.csv_state = self._csvState()
+        self.leases = ShardLeases(self.sessions_file, len(self),
+                                  self.shard_size, self.lease_seconds)
+        self.leases.open()
+        replayed = len(self.pull())
+        if replayed > 0:
+            print('Pulled {} label changes of the sessions'.format(replayed))
+        self.leases.acquire()
+        return self.data
+
+    def isWritable(self, idx):
+        """Check if a row is leased to this session."""
+        return self.leases is None or self.leases.owns(idx)
+
+    def leasedRows(self):
+        """The rows leased to this session."""
+        return None if self.leases is None else self.leases.ownedRows()
+
+    def __setitem__(self, idx, label):
+        """Set the label of a leased row, other rows are kept."""
+        if self.leases is not None and \
+                self._storedValue(label) != self._labelValue(
+                    self._label_codes[idx]):
+            written, = self.leases.write([(idx, self.key(idx), label)])
+            if not written:
+                return self[idx]
+        self._store(idx, label)
+        return self[idx]
+
+    def setLabels(self, rows, label, mode='set', dry_run=False):
+        """Set the label of many leased rows at once, see DataHandler."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.leases is not None:
+            rows = rows[[self.leases.owns(r) for r in rows]]
+        if dry_run or len(rows) == 0:
+            return super(SharedDataHandler, self).setLabels(
+                rows, label, mode, dry_run=True)
+
+        # the new labels, written to the database before stored
+        prev_codes = self._label_codes[rows].copy()
+        super(SharedDataHandler, self).setLabels(rows, label, mode)
+        changed = rows[self._label_codes[rows] != prev_codes]
+        written = self.leases.write([(r, self.key(r), self[r][1])
+                                     for r in changed])
+        lost = changed[~np.array(written, dtype=bool)]
+        if len(lost) > 0:
+            # leased by another session meanwhile
+            for r in lost:
+                self._store(r, self.labelOf(prev_codes[rows == r][0]))
+        return len(changed) - len(lost)
+
+    def pull(self, own=False):
+        """Apply the changes written by the other sessions.
+
+        Parameters
+        ----------
+        own : bool, optional
+            if the changes of this session are applied too, as after
+            reading the csv again. The default is False.
+
+        Returns
+        -------
+        list
+            The (row, previous_label, label) of the rows changed.
+
+        """
+        pulled = []
+        changes = self.leases.changes(self.pulled)
+        for seq, row, key, label, session in changes:
+            self.pulled = seq
+            if session == self.leases.session_id and not own:
+                continue
+            if row >= len(self) or self.key(row) != key:
+                # the csv rows moved, find it by key
+                row = int(self.indexOf(pd.DataFrame(
+                    [key], columns=['folder_path', 'image_id']))[0])
+                if row < 0:
+                    continue
+            _, prev_label = self[row]
+            if self._store(row, label):
+                pulled.append((row, prev_label, label))
+        if len(changes) > 0:
+            self.leases.markPulled(self.pulled)
+        return pulled
+
+    def reload(self):
+        """Read the csv again, with all the changes not merged into it.
+
+        Returns
+        -------
+        list
+            The (row, previous_label, label) of the rows changed by the
+            changes, the rows changed in the csv are not listed.
+
+        """
+        self.loaded = False
+        super(SharedDataHandler, self).read()
+        self.csv_state = self._csvState()
+        # the changes merged by the other session are in the csv now
+        self.pulled = 0
+        return self.pull(own=True)
+
+    def renew(self):
+        """Extend the leases, leasing new rows if all were lost.
+
+        Returns
+        -------
+        list
+            The (start, stop) of the shards lost.
+
+        """
+        lost = self.leases.renew()
+        if len(lost) > 0 and len(self.leases.owned) == 0:
+            self.leases.acquire()
+        return lost
+
+    def nextShard(self):
+        """Release the leased rows as labeled and lease the next ones."""
+        self.leases.release(done=True)
+        return self.leases.acquire()
+
+    def hasJournal(self):
+        """Check if there are changes not merged into the csv."""
+        return self.leases is not None and self.leases.pending() > 0
+
+    def save(self):
+        """Merge the changes of all the sessions into the csv.
+
+        The other sessions writes wait meanwhile, so no change is lost.
+        The csv is read again if another session rewrote it, as the
+        changes it merged may be already purged.
+        """
+        if self.leases is None:
+            return super(SharedDataHandler, self).save()
+        with self.leases.transaction():
+            if self._csvState() != self.csv_state:
+                self.reload()
+            else:
+                self.pull()
+            super(SharedDataHandler, self).save()
+            self.csv_state = self._csvState()
+            self.leases.purge(self.pulled)
+
+    def compact(self):
+        """Merge the changes into the csv, only if no other session is
+        labeling."""
+        if self.leases is None or len(self.leases.liveSessions()) > 0:
+            return False
+        self.save()
+        return True
+
+    def close(self):
+        """Release the leases, merging if this is the last session."""
+        if self.leases is None:
+            return
+        self.leases.release()
+        self.compact()
+        self.leases.close()
+        self.leases = None
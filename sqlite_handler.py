@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:05:52 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import os
+import sqlite3
+import numpy as np
+from lazy import LazyModule
+from handlers import DataHandler
+from labels import LabelCodec
+from labels import LabelStats
+from timing import timers
+
+pd = LazyModule('pandas')
+
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+class SqliteDataHandler(DataHandler):
+    """Handler class for data stored in a SQLite database.
+
+    The rows are kept in an images table where the id is the row position,
+    so the access by index and the label updates are single indexed
+    queries, each label update committed on its own.
+    """
+
+    # the connection is used only from its thread
+    background_save = False
+
+    def __init__(self, filepath, labels_id=None, use_journal=False,
+                 archive=None):
+        """Initialize the handler.
+
+        Parameters
+        ----------
+        filepath : string
+            The database file target to write or read the data.
+        labels_id : list, optional
+            The known labels. The default is None.
+        use_journal : bool, optional
+            Ignored, the label updates are already transactional.
+            The default is False.
+        archive : string, optional
+            A zip or tar file with the images, instead of the database
+            folder. The default is None.
+        """
+        super(SqliteDataHandler, self).__init__(filepath, labels_id,
+                                                archive=archive)
+        self.conn = None
+        self._len = 0
+
+    @property
+    def db_path(self):
+        """The database file path."""
+        return os.path.join(self.root_path, self.csv_file)
+
+    def _connect(self):
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS images ('
+            'id INTEGER PRIMARY KEY, folder_path TEXT NOT NULL, '
+            'image_id TEXT NOT NULL, class TEXT NOT NULL)')
+        self._createIndexes()
+        self.conn.commit()
+
+    def _createIndexes(self):
+        """Create the column indexes, within the current transaction."""
+        self.conn.execute('CREATE INDEX IF NOT EXISTS images_folder_path '
+                          'ON images (folder_path)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS images_image_id '
+                          'ON images (image_id)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS images_class '
+                          'ON images (class)')
+
+    def __len__(self):
+        """Number of images in the database."""
+        return self._len
+
+    def __getitem__(self, idx):
+        """Get the image path and label of an element data."""
+        if idx < 0:
+            idx += self._len
+        row = self.conn.execute(
+            'SELECT folder_path, image_id, class FROM images WHERE id = ?',
+            (idx, )).fetchone()
+        if row is None:
+            raise IndexError('Row {} out of range'.format(idx))
+
+        return os.path.join(row[0], row[1]), row[2]
+
+    def key(self, idx):
+        """The (folder_path, image_id) identifying a row."""
+        if idx < 0:
+            idx += self._len
+        row = self.conn.execute(
+            'SELECT folder_path, image_id FROM images WHERE id = ?',
+            (idx, )).fetchone()
+        if row is None:
+            raise IndexError('Row {} out of range'.format(idx))
+
+        return row
+
+    def __setitem__(self, idx, label):
+        """Set the label of an element data."""
+        if idx < 0:
+            idx += self._len
+        # as stored in the csv
+        label = self._storedValue(label)
+
+        folder, prev_label = self.conn.execute(
+            'SELECT folder_path, class FROM images WHERE id = ?',
+            (idx, )).fetchone()
+        if prev_label != label:
+            with self.conn:
+                self.conn.execute('UPDATE images SET class = ? WHERE id = ?',
+                                  (label, idx))
+            if self.stats is not None:
+                self.stats.update(folder, prev_label, label)
+
+        return self[idx]
+
+    def setLabels(self, rows, label, mode='set', dry_run=False):
+        """Set the label of many rows in a single transaction.
+
+        See DataHandler.setLabels.
+        """
+        if mode not in ('set', 'add', 'remove'):
+            raise ValueError("Unknown mode '{}'".format(mode))
+        rows = [int(r) for r in np.asarray(rows, dtype=np.int64)]
+        labels = LabelCodec.toList(label)
+
+        changes = []
+        new_values = {}
+        # chunked under the SQLite variables limit
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            for idx, folder, prev in self.conn.execute(
+                    'SELECT id, folder_path, class FROM images WHERE id IN '
+                    '({})'.format(','.join('?' * len(chunk))), chunk):
+                if prev not in new_values:
+                    new_values[prev] = self._storedValue(label) \
+                        if mode == 'set' else \
+                        self._combine(prev, labels, mode)
+                if new_values[prev] != prev:
+                    changes.append((idx, folder, prev, new_values[prev]))
+        if dry_run or len(changes) == 0:
+            return len(changes)
+
+        with self.conn:
+            self.conn.executemany('UPDATE images SET class = ? WHERE id = ?',
+                                  [(c[3], c[0]) for c in changes])
+        if self.stats is not None:
+            for _, folder, prev, new in changes:
+                self.stats.update(folder, prev, new)
+
+        return len(changes)
+
+    def buildStats(self):
+        """Count the labels by folder with an indexed GROUP BY query."""
+        self.stats = LabelStats()
+        for folder, label, count in self.conn.execute(
+                'SELECT folder_path, class, COUNT(*) FROM images '
+                'GROUP BY folder_path, class'):
+            self.stats.add(folder, label, count)
+        return self.stats
+
+    @timers.timed('data.read')
+    def read(self):
+        """Open the database."""
+        # if already loaded, do nothing
+        if self.loaded:
+            return False
+
+        print('Reading', str(os.path.sep).join(
+            self.db_path.split(os.path.sep)[-2:]))
+        self._connect()
+        self._len = self.conn.execute(
+            'SELECT COUNT(*) FROM images').fetchone()[0]
+        self.loaded = True
+        self.readFolders()
+        self.buildStats()
+
+        return self
+
+    @timers.timed('data.create')
+    def create(self, have_labels=False):
+        """Create the images table from the container folder.
+
+        Populate the data from the folder containing the database file
+        defined in the constructor, replacing any previous data.
+
+        Parameters
+        ----------
+        have_labels : bool, optional
+            if have subfolder organizing the images in labels.
+            The default is False.
+
+        Returns
+        -------
+        SqliteDataHandler
+            The handler itself.
+
+        """
+        # search
+        elements, elements_path = self.searchImages()
+        self.have_labels = have_labels
+
+        if have_labels:
+            classes = [p.lower() for p in elements_path]
+        else:
+            classes = ['unset'] * len(elements)
+        rows = sorted(zip(elements_path, classes, elements))
+
+        self._connect()
+        with self.conn:
+            self.conn.execute('DELETE FROM images')
+            self.conn.executemany(
+                'INSERT INTO images (id, folder_path, class, image_id) '
+                'VALUES (?, ?, ?, ?)',
+                ((i, ) + r for i, r in enumerate(rows)))
+        self._len = len(rows)
+        self.loaded = True
+        self.buildStats()
+
+        return self
+
+    @timers.timed('data.save')
+    def save(self):
+        """Checkpoint the database, the labels are already committed."""
+        print('Saving', str(os.path.sep).join(
+            self.db_path.split(os.path.sep)[-2:]))
+        self.conn.commit()
+        self.conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        self.saveFolders()
+
+    def toMask(self):
+        """Bitmask labels are not supported by this backend."""
+        raise ValueError('Bitmask labels are not supported in SQLite')
+
+    def hasJournal(self):
+        """The database has no pending changes journal."""
+        return False
+
+    def compact(self):
+        """Nothing to fold, the labels are already committed."""
+        return False
+
+    def iterRows(self, chunk_rows=10000):
+        """Stream the rows in chunks, see DataHandler.iterRows."""
+        for start in range(0, self._len, chunk_rows):
+            rows = self.conn.execute(
+                'SELECT folder_path, image_id, class FROM images '
+                'WHERE id >= ? AND id < ? ORDER BY id',
+                (start, start + chunk_rows)).fetchall()
+            paths = np.array([os.path.join(r[0], r[1]) for r in rows],
+                             dtype=object)
+            labels = np.array([r[2] for r in rows], dtype=object)
+            yield start, paths, labels
+
+    def folderPaths(self):
+        """The distinct folder_path of the data."""
+        return [r[0] for r in self.conn.execute(
+            'SELECT DISTINCT folder_path FROM images')]
+
+    def _matchRows(self, query, values=None):
+        """Boolean array of the ids returned by a query.
+
+        With values, the query has a {} placeholder for the IN list and
+        is run by chunks under the SQLite variables limit.
+        """
+        found = np.zeros(self._len, dtype=bool)
+        if values is None:
+            chunks = [(query, ())]
+        else:
+            values = list(values)
+            chunks = [(query.format(','.join('?' * len(values[i:i + 500]))),
+                       values[i:i + 500])
+                      for i in range(0, len(values), 500)]
+        for chunk_query, params in chunks:
+            ids = [r[0] for r in self.conn.execute(chunk_query, params)]
+            found[np.array(ids, dtype=np.int64)] = True
+        return found
+
+    def matchFolders(self, predicate):
+        """Boolean array of the rows whose folder_path match a predicate.
+
+        The predicate is evaluated once per distinct folder.
+        """
+        return self._matchRows(
+            'SELECT id FROM images WHERE folder_path IN ({})',
+            [f for f in self.folderPaths() if predicate(f)])
+
+    def matchImages(self, pattern):
+        """Boolean array of the rows whose image_id match a regex."""
+        image_ids = pd.Series([r[0] for r in self.conn.execute(
+            'SELECT image_id FROM images ORDER BY id')], dtype=object)
+        return np.array(image_ids.str.match(pattern), dtype=bool)
+
+    def matchUnset(self):
+        """Boolean array of the rows without labels."""
+        return self._matchRows(
+            "SELECT id FROM images WHERE class = 'unset'")
+
+    def indexOf(self, keys):
+        """The row positions of (folder_path, image_id) keys, -1 if missing.
+
+        See DataHandler.indexOf, the ids are looked up once per folder.
+        """
+        folders = keys['folder_path'].to_numpy(dtype=object)
+        image_ids = keys['image_id'].to_numpy(dtype=object)
+        index = np.full(len(keys), -1, dtype=np.int64)
+        for folder in pd.unique(folders):
+            rows = dict(self.conn.execute(
+                'SELECT image_id, id FROM images WHERE folder_path = ?',
+                (folder, )))
+            at = np.flatnonzero(folders == folder)
+            index[at] = [rows.get(i, -1) for i in image_ids[at]]
+        return index
+
+    def select(self, labels, require_all=False):
+        """Get the rows index having the labels.
+
+        See DataHandler.select, only the distinct classes are parsed.
+        """
+        wanted = set(labels)
+        found = []
+        for value, in self.conn.execute('SELECT DISTINCT class FROM images'):
+            value_set = set(LabelCodec.toList(value))
+            if wanted <= value_set if require_all \
+                    else len(wanted & value_set) > 0:
+                found.append(value)
+        return np.flatnonzero(self._matchRows(
+            'SELECT id FROM images WHERE class IN ({})', found))
+
+    def _columnRows(self, column):
+        """The sorted ids of each distinct value of a column."""
+        values = pd.Series([r[0] for r in self.conn.execute(
+            'SELECT {} FROM images ORDER BY id'.format(column))], dtype=object)
+        codes, uniques = pd.factorize(values)
+        codes, rows = self._groupRows(codes)
+        return {uniques[c]: r for c, r in zip(codes, rows)}
+
+    def labelRows(self):
+        """The sorted rows array of each label, 'unset' for no labels."""
+        groups = {}
+        for value, rows in self._columnRows('class').items():
+            labels = LabelCodec.toList(value)
+            for lbl in labels if len(labels) > 0 else ['unset']:
+                groups.setdefault(lbl, []).append(rows)
+        return {lbl: np.sort(np.concatenate(rows)) if len(rows) > 1
+                else rows[0] for lbl, rows in groups.items()}
+
+    def folderRows(self):
+        """The sorted rows array of each folder_path."""
+        return self._columnRows('folder_path')
+
+    def _mergeChanges(self, removed_folders, listed):
+        """Delete the removed images and insert the new ones."""
+        added = []
+        n_removed = 0
+        with self.conn:
+            for folder_path in removed_folders:
+                n_removed += self.conn.execute(
+                    'DELETE FROM images WHERE folder_path = ?',
+                    (folder_path, )).rowcount
+
+            for folder_path, files in listed.items():
+                files = set(files)
+                known = set()
+                for rowid, image_id in self.conn.execute(
+                        'SELECT id, image_id FROM images '
+                        'WHERE folder_path = ?', (folder_path, )).fetchall():
+                    if image_id in files:
+                        known.add(image_id)
+                    else:
+                        self.conn.execute('DELETE FROM images WHERE id = ?',
+                                          (rowid, ))
+                        n_removed += 1
+                label = folder_path.lower() if self.have_labels else 'unset'
+                added.extend((folder_path, f, label)
+                             for f in sorted(files - known))
+
+            if len(added) == 0 and n_removed == 0:
+                return 0, 0
+
+            # new rows at the end, then renumber in the create order
+            self.conn.executemany(
+                'INSERT INTO images (id, folder_path, image_id, class) '
+                'VALUES (NULL, ?, ?, ?)', added)
+            self._renumber()
+
+        self._len = self.conn.execute(
+            'SELECT COUNT(*) FROM images').fetchone()[0]
+
+        return len(added), n_removed
+
+    def _renumber(self):
+        """Make the ids the positions in folder_path, image_id order."""
+        self.conn.execute(
+            'CREATE TABLE images_sorted ('
+            'id INTEGER PRIMARY KEY, folder_path TEXT NOT NULL, '
+            'image_id TEXT NOT NULL, class TEXT NOT NULL)')
+        self.conn.execute(
+            'INSERT INTO images_sorted (id, folder_path, image_id, class) '
+            'SELECT ROW_NUMBER() OVER (ORDER BY folder_path, image_id) - 1, '
+            'folder_path, image_id, class FROM images')
+        self.conn.execute('DROP TABLE images')
+        self.conn.execute('ALTER TABLE images_sorted RENAME TO images')
+        # committed along the renumbering
+        self._createIndexes()
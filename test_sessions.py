@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:48:12 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+"""
+import pandas as pd
+
+from handlers import DataHandler
+from sessions import SharedDataHandler
+
+
+def writeDataset(tmp_path, n_rows=6):
+    csv_path = tmp_path / 'dataset.csv'
+    pd.DataFrame({'folder_path': ['.'] * n_rows,
+                  'image_id': ['{}.png'.format(i) for i in range(n_rows)],
+                  'class': ['unset'] * n_rows}).to_csv(csv_path, index=None)
+    return str(csv_path)
+
+
+def test_save_keeps_changes_not_pulled(tmp_path):
+    csv_path = writeDataset(tmp_path)
+    # the shards are leased in order, rows 0-1, 2-3 and 4-5
+    sessions = [SharedDataHandler(csv_path, shard_size=2) for _ in range(3)]
+    for data in sessions:
+        data.read()
+    a, b, c = sessions
+
+    c[4] = ['gun']
+    a.save()
+    # B did not pull the change of C yet
+    assert a.leases.pending() == 1
+    b[2] = ['knife']
+    b.save()
+
+    saved = DataHandler(csv_path)
+    saved.read()
+    assert saved[4][1] == 'gun'
+    assert saved[2][1] == 'knife'
+
+    for data in sessions:
+        data.close()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:31:05 2026
+
+@author: Angel Ayala <angel4ayala [at] gmail.com>
+
+Thumbnails of a dataset packed in a single memory mapped file:
+
+    python thumbstore.py dataset.csv [--size 160x120] [--jpeg]
+
+The file is a header, the thumbnails blobs, raw BGR pixels or JPEG
+encoded, and at the end the index of the blobs with the images path.
+New and modified images are appended with a new index, the header is
+written last, so a build interrupted keeps the previous thumbnails.
+"""
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from lazy import LazyModule
+from images import readThumbnail
+from images import imageSizeArg
+from duplicates import fileState
+
+pd = LazyModule('pandas')
+cv2 = LazyModule('cv2')
+
+MAGIC = b'LBLTHMB1'
+HEADER = struct.Struct('<8sHHHBxQQQ')
+ENCODINGS = ('raw', 'jpeg')
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'),
+                        ('height', '<u2'), ('width', '<u2'),
+                        ('size', '<i8'), ('mtime_ns', '<i8')])
+
+
+def encodeThumbnail(img_path, size, encoding='raw', quality=90):
+    """Decode an image as thumbnail and encode it as a store blob.
+
+    Returns
+    -------
+    tuple
+        The (height, width, bytes) of the thumbnail, None if the image
+        can't be read.
+
+    """
+    img = readThumbnail(img_path, size)
+    if img is None:
+        return None
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if encoding == 'jpeg':
+        ok, blob = cv2.imencode('.jpg', img,
+                                [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            return None
+        return img.shape[0], img.shape[1], blob.tobytes()
+    return img.shape[0], img.shape[1], np.ascontiguousarray(img).tobytes()
+
+
+class ThumbnailStore:
+    """Fixed size thumbnails of many images in a single mapped file.
+
+    The raw thumbnails are returned as read only views of the mapped
+    file, without copying them. The file is shared by the processes and
+    its pages are cached by the OS, only the index is loaded.
+    """
+
+    def __init__(self, store_path, size=(160, 120), encoding='raw',
+                 quality=90):
+        """Initialize the store.
+
+        Parameters
+        ----------
+        store_path : string
+            The packed thumbnails file.
+        size : tuple, optional
+            The (width, height) where the thumbnails are fitted.
+            The default is (160, 120).
+        encoding : string, optional
+            'raw' to store the BGR pixels, 'jpeg' to store them encoded.
+            The default is 'raw'.
+        quality : int, optional
+            The JPEG quality. The default is 90.
+
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown encoding '{}'".format(encoding))
+        self.store_path = store_path
+        self.size = tuple(size)
+        self.encoding = encoding
+        self.quality = quality
+        self.index = np.empty(0, dtype=INDEX_DTYPE)
+        self.paths = []
+        self.positions = {}
+        self.rows = np.empty(0, dtype=np.int64)
+        self._state = None
+        self._mm = None
+
+    def __len__(self):
+        """Number of images in the store."""
+        return len(self.paths)
+
+    def open(self):
+        """Map the file and load its index.
+
+        Returns
+        -------
+        bool
+            False if there is no file, or its thumbnails are of another
+            size or encoding.
+
+        """
+        self.close()
+        self.index = np.empty(0, dtype=INDEX_DTYPE)
+        self.paths, self.positions = [], {}
+        state = fileState(self.store_path)
+        if state[0] < HEADER.size:
+            return False
+        with open(self.store_path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, width, height, encoding, n_entries, index_offset, \
+            paths_length = HEADER.unpack_from(mm)
+        if magic != MAGIC or (width, height) != self.size or \
+                ENCODINGS[encoding] != self.encoding:
+            return False
+
+        self.index = np.frombuffer(mm, dtype=INDEX_DTYPE, count=n_entries,
+                                   offset=index_offset).copy()
+        paths_offset = index_offset + n_entries * INDEX_DTYPE.itemsize
+        paths = mm[paths_offset:paths_offset + paths_length]
+        self.paths = paths.decode('utf8').split('\0') if n_entries > 0 \
+            else []
+        self.positions = {p: i for i, p in enumerate(self.paths)}
+        self._mm = mm
+        self._state = state
+        return True
+
+    def reload(self):
+        """Open the file again if it was written since opened."""
+        if fileState(self.store_path) == self._state:
+            return False
+        return self.open()
+
+    def close(self):
+        # the mapping is unmapped once no thumbnail view references it
+        self._mm = None
+        self._state = None
+
+    def entry(self, path, state=None):
+        """The index position of an image, -1 if missing or modified."""
+        i = self.positions.get(path, -1)
+        if i > -1 and state is not None and \
+                (self.index['size'][i], self.index['mtime_ns'][i]) != state:
+            return -1
+        return i
+
+    def thumbnail(self, i):
+        """The thumbnail of an index position.
+
+        Returns
+        -------
+        numpy.ndarray
+            The BGR thumbnail, a read only view of the file if raw. None
+            if the image could not be read when stored.
+
+        """
+        offset, length, height, width = (int(v) for v in
+                                         self.index[i].tolist()[:4])
+        if length == 0 or self._mm is None:
+            return None
+        blob = np.frombuffer(self._mm, dtype=np.uint8, count=length,
+                             offset=offset)
+        if self.encoding == 'jpeg':
+            return cv2.imdecode(blob, cv2.IMREAD_COLOR)
+        return blob.reshape(height, width, 3)
+
+    def get(self, path, state=None):
+        """The thumbnail of an image path, None if not stored.
+
+        Parameters
+        ----------
+        path : string
+            The image path, relative to the dataset folder.
+        state : tuple, optional
+            The current (size, mtime_ns) of the image file. If defined
+            the thumbnail of a modified image is not returned.
+
+        """
+        i = self.entry(path, state)
+        return self.thumbnail(i) if i > -1 else None
+
+    def setRows(self, paths):
+        """Map the rows of a dataset to the stored images, by its path."""
+        self.rows = pd.Index(self.paths, dtype=object).get_indexer(
+            pd.Index(paths, dtype=object)) if len(self.paths) > 0 \
+            else np.full(len(paths), -1, dtype=np.int64)
+
+    def __getitem__(self, row):
+        """The thumbnail of a dataset row, see setRows."""
+        i = self.rows[row]
+        return self.thumbnail(i) if i > -1 else None
+
+    @property
+    def garbage(self):
+        """The bytes of the file not referenced by the index."""
+        if self._state is None:
+            return 0
+        live = int(self.index['length'].sum()) + HEADER.size + \
+            len(self.index) * INDEX_DTYPE.itemsize + \
+            len('\0'.join(self.paths).encode('utf8'))
+        return self._state[0] - live
+
+    def build(self, paths, root_path, workers=None, stop_event=None):
+        """Write the thumbnails of the new and modified images.
+
+        The images are decoded on a process pool, the thumbnails of the
+        images not modified since stored are kept.
+
+        Parameters
+        ----------
+        paths : list
+            The images path, relative to root_path.
+        root_path : string
+            The dataset folder.
+        workers : int, optional
+            The number of processes, the CPU count if None.
+            The default is None.
+        stop_event : threading.Event, optional
+            Set to stop the build, the thumbnails done are written.
+            The default is None.
+
+        Returns
+        -------
+        int
+            The number of thumbnails written.
+
+        """
+        start = time.perf_counter()
+        # empty if there is no file or of another size or encoding
+        self.open()
+
+        pending = []
+        for path in dict.fromkeys(paths):
+            state = fileState(os.path.join(root_path, path))
+            if self.entry(path, state) < 0:
+                pending.append((path, state))
+
+        written = 0
+        if len(pending) > 0:
+            written = self._write(pending, root_path, workers, stop_event)
+            # more replaced than live thumbnails
+            if self.garbage > int(self.index['length'].sum()):
+                self.compact()
+        self.setRows(paths)
+
+        print('Stored {} thumbnails, {} kept, in {:.2f}s'.format(
+            written, len(paths) - len(pending),
+            time.perf_counter() - start))
+        return written
+
+    def _header(self, n_entries, index_offset, paths_length):
+        width, height = self.size
+        return HEADER.pack(MAGIC, 1, width, height,
+                           ENCODINGS.index(self.encoding), n_entries,
+                           index_offset, paths_length)
+
+    def _write(self, pending, root_path, workers, stop_event):
+        index = list(self.index.tolist())
+        paths = list(self.paths)
+        positions = dict(self.positions)
+        fresh = self._state is None
+        # a new file is written aside, the mapped one is never truncated
+        target = self.store_path + '.tmp' if fresh else self.store_path
+
+        written = 0
+        # spawned processes, the GUI threads are not forked
+        context = multiprocessing.get_context('spawn')
+        with open(target, 'wb' if fresh else 'r+b') as f, \
+                ProcessPoolExecutor(max_workers=workers,
+                                    mp_context=context) as executor:
+            if fresh:
+                f.write(self._header(0, 0, 0))
+            f.seek(0, os.SEEK_END)
+            results = executor.map(
+                encodeThumbnail,
+                [os.path.join(root_path, p) for p, _ in pending],
+                [self.size] * len(pending), [self.encoding] * len(pending),
+                [self.quality] * len(pending), chunksize=32)
+            for (path, state), result in zip(pending, results):
+                entry = (f.tell(), 0, 0, 0) + tuple(state)
+                if result is not None:
+                    height, width, blob = result
+                    f.write(blob)
+                    entry = (entry[0], len(blob), height, width) + \
+                        tuple(state)
+                    # the unreadable images are indexed, not written
+                    written += 1
+                i = positions.get(path)
+                if i is None:
+                    positions[path] = len(paths)
+                    paths.append(path)
+                    index.append(entry)
+                else:
+                    index[i] = entry
+                if stop_event is not None and stop_event.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+
+            # the new index after the blobs, the header last
+            index_offset = f.tell()
+            paths_buffer = '\0'.join(paths).encode('utf8')
+            f.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+            f.write(paths_buffer)
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(self._header(len(paths), index_offset,
+                                 len(paths_buffer)))
+            f.flush()
+            os.fsync(f.fileno())
+
+        if fresh:
+            os.replace(target, self.store_path)
+        self.open()
+        return written
+
+    def compact(self):
+        """Rewrite the file with only the indexed thumbnails."""
+        target = self.store_path + '.tmp'
+        index = self.index.copy()
+        with open(target, 'wb') as f:
+            f.write(self._header(0, 0, 0))
+            for i, (offset, length) in enumerate(
+                    zip(self.index['offset'], self.index['length'])):
+                index['offset'][i] = f.tell()
+                f.write(self._mm[int(offset):int(offset) + int(length)])
+            index_offset = f.tell()
+            paths_buffer = '\0'.join(self.paths).encode('utf8')
+            f.write(index.tobytes())
+            f.write(paths_buffer)
+            f.seek(0)
+            f.write(self._header(len(self.paths), index_offset,
+                                 len(paths_buffer)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(target, self.store_path)
+        return self.open()
+
+
+def buildThumbnails(paths, thumbs_file, root_path, size=(160, 120),
+                    encoding='raw', workers=None, stop_event=None):
+    """Store the thumbnails of a dataset rows.
+
+    The paths are read by the caller, so the build thread never touches
+    the data handler, whose sqlite connection is bound to its thread.
+
+    Parameters
+    ----------
+    paths : list
+        The image path of each row, relative to root_path.
+    thumbs_file : string
+        The data thumbnails sidecar file.
+    root_path : string
+        The images folder, or the archive containing them.
+    size : tuple, optional
+        The (width, height) where the thumbnails are fitted.
+        The default is (160, 120).
+    encoding : string, optional
+        'raw' or 'jpeg'. The default is 'raw'.
+    workers : int, optional
+        The number of decoding processes, the CPU count if None.
+        The default is None.
+    stop_event : threading.Event, optional
+        Set to stop the build. The default is None.
+
+    Returns
+    -------
+    ThumbnailStore
+        The opened store, with the rows set.
+
+    """
+    store = ThumbnailStore(thumbs_file, size, encoding)
+    store.build(paths, root_path, workers, stop_event)
+    return store
+
+
+def main(argv=None):
+    from handlers import DataHandler
+
+    parser = argparse.ArgumentParser(
+        description='Pack the thumbnails of a dataset csv images.')
+    parser.add_argument('csv_file', help='the dataset csv file')
+    parser.add_argument('--size', type=imageSizeArg, default=(160, 120),
+                        help='WIDTHxHEIGHT')
+    parser.add_argument('--jpeg', action='store_true',
+                        help='store the thumbnails JPEG encoded')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    data = DataHandler(args.csv_file)
+    data.read()
+    buildThumbnails(data.imagePaths(), data.thumbs_file, data.images_root,
+                    args.size, 'jpeg' if args.jpeg else 'raw', args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())